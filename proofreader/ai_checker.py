@@ -35,6 +35,23 @@ class ProofreadingResult:
             "suggested": suggestion,
             "reason": reason
         })
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可JSON序列化的字典"""
+        return {
+            "issues": self.issues,
+            "suggestions": self.suggestions,
+            "statistics": self.statistics
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ProofreadingResult":
+        """从字典重建校对结果"""
+        result = cls()
+        result.issues = list(data.get("issues", []))
+        result.suggestions = list(data.get("suggestions", []))
+        result.statistics = dict(data.get("statistics", {}))
+        return result
 
 
 class AIChecker:
@@ -149,7 +166,7 @@ class AIChecker:
             
         except Exception as e:
             print(f"AI校对失败: {e}")
-            return {"issues": [], "suggestions": []}
+            return {"issues": [], "suggestions": [], "ai_failed": True}
     
     def _build_proofread_prompt(self, text: str) -> str:
         """构建校对提示词"""
@@ -202,7 +219,7 @@ class AIChecker:
         except Exception as e:
             print(f"解析AI响应失败: {e}")
         
-        return {"issues": [], "suggestions": []}
+        return {"issues": [], "suggestions": [], "ai_failed": True}
     
     def _parse_ai_result(self, ai_result: Dict[str, Any], result: ProofreadingResult):
         """解析AI校对结果"""
@@ -226,6 +243,10 @@ class AIChecker:
         # 保存整体评价
         if "overall_assessment" in ai_result:
             result.statistics["overall_assessment"] = ai_result["overall_assessment"]
+        
+        # 标记AI调用或响应解析失败，此时结果只包含基础检查
+        if ai_result.get("ai_failed"):
+            result.statistics["ai_failed"] = True
     
     def check_grammar(self, text: str) -> List[Dict[str, str]]:
         """专门检查语法问题"""
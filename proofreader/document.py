@@ -9,7 +9,8 @@ from docx.shared import RGBColor
 from docx.enum.text import WD_COLOR_INDEX
 from docx.oxml.shared import qn
 from docx.oxml.ns import nsdecls
-from docx.oxml import parse_xml
+from docx.oxml import OxmlElement, parse_xml
+from docx.text.run import Run
 import uuid
 from datetime import datetime
 from .word_comments import WordCommentsHandler
@@ -104,26 +105,32 @@ class DocumentProcessor:
             
             end_pos = start_pos + len(target_text)
             
-            # 清空段落
-            paragraph.clear()
+            # 先在段落之外构建全部新run，最后一次性替换段落内容（保留段落属性）
+            new_runs = []
             
             # 添加目标文本之前的内容
             if start_pos > 0:
-                paragraph.add_run(original_text[:start_pos])
+                new_runs.append(self._new_run(paragraph, original_text[:start_pos]))
             
             # 创建带有批注标记的run（高亮显示）
-            commented_run = paragraph.add_run(target_text)
+            commented_run = self._new_run(paragraph, target_text)
             commented_run.font.highlight_color = WD_COLOR_INDEX.YELLOW
+            new_runs.append(commented_run)
             
             # 直接添加批注内容到段落中（确保可见）
-            comment_run = paragraph.add_run(f" [批注: {comment}]")
+            comment_run = self._new_run(paragraph, f" [批注: {comment}]")
             comment_run.font.color.rgb = RGBColor(204, 0, 0)  # 深红色
             comment_run.font.size = 160000  # 8pt (160000 twips = 8pt)
             comment_run.font.italic = True
+            new_runs.append(comment_run)
             
             # 添加目标文本之后的内容
             if end_pos < len(original_text):
-                paragraph.add_run(original_text[end_pos:])
+                new_runs.append(self._new_run(paragraph, original_text[end_pos:]))
+            
+            paragraph_element = paragraph._element
+            kept = [] if paragraph_element.pPr is None else [paragraph_element.pPr]
+            paragraph_element[:] = kept + [run._element for run in new_runs]
             
             print(f"📝 批注已添加到文档: {comment}")
             return True
@@ -133,6 +140,13 @@ class DocumentProcessor:
             # 如果失败，回退到简单的文本批注
             return self._add_simple_text_comment(paragraph, target_text, comment, author)
     
+    @staticmethod
+    def _new_run(paragraph, text: str) -> Run:
+        """创建尚未插入段落的run"""
+        run = Run(OxmlElement('w:r'), paragraph)
+        run.text = text
+        return run
+    
     def highlight_text(self, paragraph_index: int, text: str, 
                       color: WD_COLOR_INDEX = WD_COLOR_INDEX.YELLOW):
         """高亮显示文本"""
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+docx压缩包处理模块
+在不解压整个文档的情况下读取和重写docx中的个别部件
+"""
+
+import copy
+import io
+import os
+import shutil
+import zipfile
+
+# 常用部件路径
+DOCUMENT_XML = 'word/document.xml'
+SETTINGS_XML = 'word/settings.xml'
+COMMENTS_XML = 'word/comments.xml'
+DOCUMENT_RELS = 'word/_rels/document.xml.rels'
+CONTENT_TYPES = '[Content_Types].xml'
+
+# 解压部件时的复制缓冲区大小
+COPY_BUFFER_SIZE = 1 << 20
+
+# 本身已压缩的媒体格式，重新打包时直接存储
+STORED_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.emf', '.wmf')
+
+# 小于该字节数的部件（如settings.xml、关系文件）直接存储，deflate几乎没有收益
+STORED_MAX_SIZE = 2048
+
+
+def extract_parts(docx_path: str, target_dir: str, part_names) -> list:
+    """仅解压指定部件到目标目录，返回实际存在并已解压的部件名
+
+    部件名来自调用方给出的固定路径，直接按大缓冲区复制，减少大部件的读写次数
+    """
+    extracted = []
+    with zipfile.ZipFile(docx_path, 'r') as zip_ref:
+        existing = set(zip_ref.namelist())
+        for name in part_names:
+            if name in existing:
+                path = os.path.join(target_dir, *name.split('/'))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with zip_ref.open(name) as src, open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+                extracted.append(name)
+    return extracted
+
+
+def read_parts_from_dir(source_dir: str, part_names) -> dict:
+    """从目录中读取指定部件的内容，不存在的部件会被跳过"""
+    parts = {}
+    for name in part_names:
+        path = os.path.join(source_dir, *name.split('/'))
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                parts[name] = f.read()
+    return parts
+
+
+def rewrite_docx(input_docx_path: str, output_docx_path: str, updated_parts: dict, compresslevel: int = 1):
+    """流式重写docx：未修改的部件直接从源压缩包复制，仅替换或追加updated_parts中的部件"""
+    # 输出覆盖输入文件时先将源文件读入内存，打开输出文件会截断源文件
+    if isinstance(input_docx_path, (str, os.PathLike)) and os.path.exists(output_docx_path) \
+            and os.path.samefile(input_docx_path, output_docx_path):
+        with open(input_docx_path, 'rb') as f:
+            input_docx_path = io.BytesIO(f.read())
+    
+    with zipfile.ZipFile(input_docx_path, 'r') as src, \
+            zipfile.ZipFile(output_docx_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as dst:
+        for info in src.infolist():
+            if info.filename in updated_parts:
+                # 保持部件在压缩包中的原始顺序；沿用原ZipInfo时不会继承compresslevel，需显式指定
+                data = updated_parts[info.filename]
+                dst.writestr(info, data, compress_type=_compress_type(len(data)), compresslevel=compresslevel)
+            elif info.filename.lower().endswith(STORED_SUFFIXES):
+                # 图片等已压缩的媒体文件不再做无效的deflate，按大缓冲区流式复制，不整体读入内存
+                stored_info = copy.copy(info)
+                stored_info.compress_type = zipfile.ZIP_STORED
+                with src.open(info) as member, dst.open(stored_info, 'w') as target:
+                    shutil.copyfileobj(member, target, COPY_BUFFER_SIZE)
+            elif info.file_size < STORED_MAX_SIZE:
+                # 小部件直接存储
+                dst.writestr(info, src.read(info.filename), compress_type=zipfile.ZIP_STORED)
+            else:
+                # 沿用原部件的压缩方式，避免解压后整体重新打包；重新压缩时同样使用较低的压缩级别
+                dst.writestr(info, src.read(info.filename), compresslevel=compresslevel)
+
+        existing = set(src.namelist())
+        for name, data in updated_parts.items():
+            if name not in existing:
+                dst.writestr(name, data, compress_type=_compress_type(len(data)), compresslevel=compresslevel)
+
+
+def _compress_type(size: int) -> int:
+    """按部件大小选择压缩方式：小部件直接存储，其余使用deflate"""
+    return zipfile.ZIP_STORED if size < STORED_MAX_SIZE else zipfile.ZIP_DEFLATED
@@ -9,13 +9,11 @@ from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from rich.table import Table
 from docx import Document
-from datetime import datetime
 
 from .config import Config
 from .document import DocumentProcessor
 from .ai_checker import AIChecker, ProofreadingResult
 from .word_comments_advanced import WordCommentsManager
-from .word_comments_xml import add_comments_to_docx
 from .proofreader_revisions import ProofReaderWithRevisions
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -71,26 +69,20 @@ class ProofReader:
             errors = self._convert_ai_result_to_errors(ai_result, text_content)
             self.console.print(f"[green]✅ AI校对完成，发现 {len(errors)} 个问题[/green]")
             
-            # 添加批注和修正
-            comments_data = self.add_comments_and_corrections(doc, errors, comments_manager)
+            # 添加批注和修正（全部累积后统一写入）
+            self.add_comments_and_corrections(doc, errors, comments_manager)
             
             # 完成文档处理
             comments_manager.finalize_document()
             
-            # 保存临时文档
-            temp_file = output_file.replace('.docx', '_temp.docx')
-            doc.save(temp_file)
-            
-            # 使用完整的Word审阅批注功能
-            if add_comments_to_docx(temp_file, output_file, comments_data):
-                # 删除临时文件
-                os.remove(temp_file)
+            # 使用完整的Word审阅批注功能，一次写入所有批注
+            if comments_manager.save(output_file):
                 self.console.print(f"[green]✅ 校对完成，输出文件: {output_file}[/green]")
                 self.console.print("[blue]📝 文档包含完整的Word审阅批注，可在Microsoft Word中查看[/blue]")
                 return True
             else:
-                # 如果失败，使用临时文件作为输出
-                os.rename(temp_file, output_file)
+                # 如果失败，输出不含批注部件的基础版本
+                doc.save(output_file)
                 self.console.print(f"[yellow]⚠️ 审阅批注添加失败，使用基础版本: {output_file}[/yellow]")
                 return True
             
@@ -99,9 +91,9 @@ class ProofReader:
             return False
     
     def add_comments_and_corrections(self, doc: Document, errors: list, comments_manager: WordCommentsManager):
-        """添加批注和修正，返回批注数据用于完整的Word审阅批注"""
+        """添加批注和修正，批注累积在comments_manager中，由其save统一写入；返回成功添加的批注数"""
         comment_count = 0
-        comments_data = []
+        paragraphs = doc.paragraphs
         
         for error in errors:
             paragraph_index = error.get('paragraph_index', 0)
@@ -115,25 +107,18 @@ class ProofReader:
                 comment_text += f"\n理由: {reason}"
             
             # 获取对应段落
-            if paragraph_index < len(doc.paragraphs):
-                paragraph = doc.paragraphs[paragraph_index]
+            if paragraph_index < len(paragraphs):
+                paragraph = paragraphs[paragraph_index]
                 
                 # 使用Word审阅批注功能
                 if comments_manager.add_comment(paragraph, text, comment_text):
                     comment_count += 1
-                    # 添加到批注数据列表
-                    comments_data.append({
-                        'id': comment_count,
-                        'text': comment_text,
-                        'author': 'AI校对助手',
-                        'date': datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
-                    })
                     self.console.print(f"[green]✅ 添加Word审阅批注 {comment_count}: {text} -> {suggestion}[/green]")
                 else:
                     self.console.print(f"[red]❌ 批注添加失败: {text}[/red]")
         
         self.console.print(f"[blue]📝 总共添加了 {comment_count} 个Word审阅批注[/blue]")
-        return comments_data
+        return comment_count
     
     def _add_comments_to_document(self, segment: str, result: ProofreadingResult):
         """将校对结果添加为文档批注"""
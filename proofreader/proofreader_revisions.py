@@ -74,6 +74,7 @@ class ProofReaderWithRevisions:
     def apply_revisions(self, doc: Document, revisions: list, revisions_manager: SimpleWordRevisionsManager):
         """应用修订到文档"""
         revision_count = 0
+        paragraphs = doc.paragraphs
         
         for revision in revisions:
             paragraph_index = revision.get('paragraph_index', 0)
@@ -82,8 +83,8 @@ class ProofReaderWithRevisions:
             reason = revision.get('reason', '')
             
             # 获取对应段落
-            if paragraph_index < len(doc.paragraphs):
-                paragraph = doc.paragraphs[paragraph_index]
+            if paragraph_index < len(paragraphs):
+                paragraph = paragraphs[paragraph_index]
                 
                 # 应用修订
                 if revisions_manager.add_revision(paragraph, original_text, corrected_text, reason):
@@ -11,14 +11,13 @@ from rich.console import Console
 from docx import Document
 from datetime import datetime
 import zipfile
-import tempfile
-import xml.etree.ElementTree as ET
 import re
 
 from .config import Config
 from .document import DocumentProcessor
 from .ai_checker import AIChecker, ProofreadingResult
-from .word_comments_xml import create_comments_xml, create_document_rels, update_content_types
+from .word_comments_xml import build_comments_xml, patch_content_types, patch_document_rels
+from .docx_package import COMMENTS_XML, CONTENT_TYPES, DOCUMENT_RELS, DOCUMENT_XML, rewrite_docx
 
 
 class SynchronizedProofReader:
@@ -81,54 +80,38 @@ class SynchronizedProofReader:
     def apply_synchronized_changes(self, input_path: str, output_path: str, result: ProofreadingResult) -> bool:
         """同步应用跟踪更改和批注"""
         try:
-            # 使用临时文件处理
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_input = os.path.join(temp_dir, "input.docx")
-                temp_output = os.path.join(temp_dir, "output.docx")
-                
-                # 复制输入文件
-                import shutil
-                shutil.copy2(input_path, temp_input)
-                
-                # 解压文档
-                with zipfile.ZipFile(temp_input, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-                
-                # 读取文档XML
-                document_xml_path = os.path.join(temp_dir, 'word', 'document.xml')
-                with open(document_xml_path, 'r', encoding='utf-8') as f:
-                    doc_content = f.read()
-                
-                # 同步处理每个修改
-                comment_data = []
-                for i, suggestion in enumerate(result.suggestions, 1):
-                    comment_id = str(i)
-                    
-                    # 同步添加跟踪更改和批注引用
-                    doc_content, comment_info = self.add_synchronized_change(
-                        doc_content, suggestion, comment_id
-                    )
-                    
-                    if comment_info:
-                        comment_data.append(comment_info)
-                        self.console.print(f"✅ 同步处理 {i}: {suggestion['original']} -> {suggestion['suggested']}")
-                
-                # 保存修改后的文档XML
-                with open(document_xml_path, 'w', encoding='utf-8') as f:
-                    f.write(doc_content)
-                
-                # 创建批注XML文件
-                if comment_data:
-                    self.create_comments_system(temp_dir, comment_data)
-                
-                # 重新打包文档
-                self.repackage_document(temp_dir, temp_output)
+            # 直接从压缩包读取需要修改的部件，不解压整个文档
+            with zipfile.ZipFile(input_path, 'r') as zip_ref:
+                existing = set(zip_ref.namelist())
+                doc_content = zip_ref.read(DOCUMENT_XML).decode('utf-8')
+                package_parts = {name: zip_ref.read(name) for name in (DOCUMENT_RELS, CONTENT_TYPES) if name in existing}
+            
+            # 同步处理每个修改
+            comment_data = []
+            for i, suggestion in enumerate(result.suggestions, 1):
+                comment_id = str(i)
                 
-                # 复制到最终输出位置
-                shutil.copy2(temp_output, output_path)
+                # 同步添加跟踪更改和批注引用
+                doc_content, comment_info = self.add_synchronized_change(
+                    doc_content, suggestion, comment_id
+                )
                 
-                self.console.print(f"✅ 成功应用 {len(comment_data)} 个同步更改和批注")
-                return True
+                if comment_info:
+                    comment_data.append(comment_info)
+                    self.console.print(f"✅ 同步处理 {i}: {suggestion['original']} -> {suggestion['suggested']}")
+            
+            # 修改后的文档XML
+            updated_parts = {DOCUMENT_XML: doc_content.encode('utf-8')}
+            
+            # 创建批注XML
+            if comment_data:
+                updated_parts.update(self.create_comments_system(package_parts, comment_data))
+            
+            # 重新打包文档，未修改的部件直接从源压缩包复制
+            rewrite_docx(input_path, output_path, updated_parts)
+            
+            self.console.print(f"✅ 成功应用 {len(comment_data)} 个同步更改和批注")
+            return True
                 
         except Exception as e:
             self.console.print(f"[red]❌ 应用同步更改失败: {e}[/red]")
@@ -184,7 +167,7 @@ class SynchronizedProofReader:
                 'id': comment_id,
                 'author': 'AI校对助手',
                 'date': current_time,
-                'content': f"💡 改进建议: {original_text} → {corrected_text}\n📋 原因: {suggestion['reason']}\n🎯 类型: 改进建议\n⏰ 建议时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+                'text': f"💡 改进建议: {original_text} → {corrected_text}\n📋 原因: {suggestion['reason']}\n🎯 类型: 改进建议\n⏰ 建议时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
             }
             
             return doc_content, comment_info
@@ -193,62 +176,23 @@ class SynchronizedProofReader:
             self.console.print(f"[red]❌ 添加同步更改失败: {e}[/red]")
             return doc_content, None
     
-    def create_comments_system(self, temp_dir: str, comment_data: List[Dict]) -> bool:
-        """创建完整的批注系统"""
-        try:
-            self.console.print(f"🔧 创建完整的批注系统，包含 {len(comment_data)} 个批注")
-            
-            # 创建批注XML文件
-            comments_xml_path = os.path.join(temp_dir, 'word', 'comments.xml')
-            comments_xml_content = create_comments_xml(comment_data)
-            
-            with open(comments_xml_path, 'w', encoding='utf-8') as f:
-                f.write(comments_xml_content)
-            
-            # 更新文档关系
-            rels_path = os.path.join(temp_dir, 'word', '_rels', 'document.xml.rels')
-            if os.path.exists(rels_path):
-                with open(rels_path, 'r', encoding='utf-8') as f:
-                    rels_content = f.read()
-                
-                updated_rels = create_document_rels(rels_content)
-                
-                with open(rels_path, 'w', encoding='utf-8') as f:
-                    f.write(updated_rels)
-            
-            # 更新内容类型
-            content_types_path = os.path.join(temp_dir, '[Content_Types].xml')
-            if os.path.exists(content_types_path):
-                with open(content_types_path, 'r', encoding='utf-8') as f:
-                    content_types_content = f.read()
-                
-                updated_content_types = update_content_types(content_types_content)
-                
-                with open(content_types_path, 'w', encoding='utf-8') as f:
-                    f.write(updated_content_types)
-            
-            self.console.print("✅ 完整的批注系统创建成功")
-            return True
-            
-        except Exception as e:
-            self.console.print(f"[red]❌ 创建批注系统失败: {e}[/red]")
-            return False
-    
-    def repackage_document(self, temp_dir: str, output_path: str) -> bool:
-        """重新打包文档"""
-        try:
-            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        if file.endswith('.docx'):
-                            continue  # 跳过临时docx文件
-                        
-                        file_path = os.path.join(root, file)
-                        arc_path = os.path.relpath(file_path, temp_dir)
-                        zip_file.write(file_path, arc_path)
-            
-            return True
-            
-        except Exception as e:
-            self.console.print(f"[red]❌ 重新打包文档失败: {e}[/red]")
-            return False 
\ No newline at end of file
+    def create_comments_system(self, package_parts: Dict[str, bytes], comment_data: List[Dict]) -> Dict[str, bytes]:
+        """创建完整的批注系统，返回需要写入文档的部件 {部件名: 内容}
+
+        package_parts为源文档中已有的关系文件和内容类型文件，不存在的不会创建
+        """
+        self.console.print(f"🔧 创建完整的批注系统，包含 {len(comment_data)} 个批注")
+        
+        # 创建批注XML
+        parts = {COMMENTS_XML: build_comments_xml(comment_data)}
+        
+        # 更新文档关系
+        if DOCUMENT_RELS in package_parts:
+            parts[DOCUMENT_RELS] = patch_document_rels(package_parts[DOCUMENT_RELS])
+        
+        # 更新内容类型
+        if CONTENT_TYPES in package_parts:
+            parts[CONTENT_TYPES] = patch_content_types(package_parts[CONTENT_TYPES])
+        
+        self.console.print("✅ 完整的批注系统创建成功")
+        return parts
\ No newline at end of file
@@ -5,30 +5,26 @@
 """
 
 import os
-import sys
-from typing import Optional
 from rich.console import Console
 from docx import Document
-from datetime import datetime
 
 from .config import Config
-from .document import DocumentProcessor
 from .ai_checker import AIChecker, ProofreadingResult
-from .word_track_changes import WordTrackChangesManager, enable_track_changes_in_docx
+from .word_track_changes import WordTrackChangesManager, enable_track_changes_in_document
+from .text_matcher import locate_first, extract_corrected_text
 
 
 class ProofReaderWithTrackChanges:
     """使用真正Word跟踪更改功能的校对器"""
     
-    def __init__(self, api_key: str = None):
-        """初始化校对器"""
+    def __init__(self, api_key: str = None, verbose: bool = False):
+        """初始化校对器，verbose为True时逐条输出每个更改的处理结果"""
         self.config = Config()
         if api_key:
             self.config.ai.api_key = api_key
         self.ai_checker = AIChecker(self.config)
         self.console = Console()
-        
-        self.document_processor = DocumentProcessor()
+        self.verbose = verbose
     
     def proofread_with_track_changes(self, input_file: str, output_file: str = None) -> bool:
         """使用Word跟踪更改功能进行校对"""
@@ -51,10 +47,11 @@ class ProofReaderWithTrackChanges:
             
             # 进行AI校对
             self.console.print("[bold]开始AI校对...")
-            ai_result = self.ai_checker.check_text(' '.join(text_content))
+            joined_text = ' '.join(text_content)
+            ai_result = self.ai_checker.check_text(joined_text)
             
             # 转换AI校对结果为跟踪更改格式
-            changes = self._convert_ai_result_to_track_changes(ai_result, text_content)
+            changes = self._convert_ai_result_to_track_changes(ai_result, text_content, joined_text)
             self.console.print(f"[green]✅ AI校对完成，发现 {len(changes)} 个需要跟踪更改的问题[/green]")
             
             # 应用跟踪更改
@@ -62,18 +59,14 @@ class ProofReaderWithTrackChanges:
             
             # 应用所有跟踪更改到文档
             self.console.print("[blue]正在应用所有跟踪更改到文档...[/blue]")
-            track_changes_manager.apply_all_changes()
-            
-            # 保存临时文档
-            temp_file = output_file.replace('.docx', '_temp.docx')
-            doc.save(temp_file)
+            applied = track_changes_manager.apply_all_changes()
+            if applied['paragraphs']:
+                self.console.print(f"[green]✅ 已应用跟踪更改: {applied['paragraphs']} 个段落，{applied['changes']} 个更改[/green]")
             
-            # 启用Word跟踪更改并生成最终文档
-            if enable_track_changes_in_docx(temp_file, output_file, track_changes_manager.revisions_data):
-                # 清理临时文件
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-                    
+            # 在内存中启用Word跟踪更改，只保存一次即生成最终文档
+            if enable_track_changes_in_document(doc):
+                doc.save(output_file)
+                
                 self.console.print(f"[green]✅ Word跟踪更改校对完成，输出文件: {output_file}[/green]")
                 self.console.print(f"[blue]📝 已应用 {change_count} 个跟踪更改，现在可以在Word审阅功能中查看[/blue]")
                 return True
@@ -88,6 +81,9 @@ class ProofReaderWithTrackChanges:
     def apply_track_changes(self, doc: Document, changes: list, track_changes_manager: WordTrackChangesManager):
         """应用跟踪更改到文档"""
         change_count = 0
+        failed_count = 0
+        log_lines = []
+        paragraphs = doc.paragraphs
         
         for change in changes:
             paragraph_index = change.get('paragraph_index', 0)
@@ -96,21 +92,30 @@ class ProofReaderWithTrackChanges:
             reason = change.get('reason', '')
             
             # 获取对应段落
-            if paragraph_index < len(doc.paragraphs):
-                paragraph = doc.paragraphs[paragraph_index]
+            if paragraph_index < len(paragraphs):
+                paragraph = paragraphs[paragraph_index]
                 
                 # 应用跟踪更改
                 if track_changes_manager.add_tracked_change(paragraph, original_text, corrected_text, reason):
                     change_count += 1
-                    self.console.print(f"[green]✅ 跟踪更改 {change_count}: {original_text} -> {corrected_text}[/green]")
+                    if self.verbose:
+                        log_lines.append(f"[green]✅ 跟踪更改 {change_count}: {original_text} -> {corrected_text}[/green]")
                 else:
-                    self.console.print(f"[red]❌ 跟踪更改失败: {original_text}[/red]")
+                    failed_count += 1
+                    if self.verbose:
+                        log_lines.append(f"[red]❌ 跟踪更改失败: {original_text}[/red]")
+        
+        # 逐条结果汇总后一次性输出，非详细模式只输出统计
+        if log_lines:
+            self.console.print("\n".join(log_lines))
+        elif failed_count:
+            self.console.print(f"跟踪更改: 成功 {change_count} 个，失败 {failed_count} 个", markup=False)
         
         return change_count
     
-    def _convert_ai_result_to_track_changes(self, ai_result: ProofreadingResult, text_content: list):
+    def _convert_ai_result_to_track_changes(self, ai_result: ProofreadingResult, text_content: list, joined_text: str = None):
         """将AI校对结果转换为跟踪更改格式"""
-        changes = []
+        candidates = []
         
         # 处理issues
         for issue in ai_result.issues:
@@ -122,16 +127,11 @@ class ProofReaderWithTrackChanges:
             
             # 如果修正文本与原文本不同，才添加跟踪更改
             if corrected_text and corrected_text != problem_text:
-                # 找到问题文本在哪个段落
-                for i, paragraph_text in enumerate(text_content):
-                    if problem_text in paragraph_text:
-                        changes.append({
-                            'paragraph_index': i,
-                            'original_text': problem_text,
-                            'corrected_text': corrected_text,
-                            'reason': f"{issue.get('type', '')} - {issue.get('severity', '')}"
-                        })
-                        break
+                candidates.append({
+                    'original_text': problem_text,
+                    'corrected_text': corrected_text,
+                    'reason': f"{issue.get('type', '')} - {issue.get('severity', '')}"
+                })
         
         # 处理suggestions
         for suggestion in ai_result.suggestions:
@@ -140,33 +140,25 @@ class ProofReaderWithTrackChanges:
             
             # 如果建议文本与原文本不同，才添加跟踪更改
             if suggested_text and suggested_text != original_text:
-                # 找到原文本在哪个段落
-                for i, paragraph_text in enumerate(text_content):
-                    if original_text in paragraph_text:
-                        changes.append({
-                            'paragraph_index': i,
-                            'original_text': original_text,
-                            'corrected_text': suggested_text,
-                            'reason': suggestion.get('reason', '')
-                        })
-                        break
+                candidates.append({
+                    'original_text': original_text,
+                    'corrected_text': suggested_text,
+                    'reason': suggestion.get('reason', '')
+                })
+        
+        # 一次扫描定位所有原文本所在段落
+        paragraph_indexes = locate_first([c['original_text'] for c in candidates], text_content, joined_text)
+        
+        changes = []
+        for candidate, paragraph_index in zip(candidates, paragraph_indexes):
+            if paragraph_index is not None:
+                changes.append({'paragraph_index': paragraph_index, **candidate})
         
         return changes
     
     def _extract_corrected_text(self, suggestion: str):
         """从建议中提取修正后的文本"""
-        # 尝试从建议中提取修正文本
-        if "建议改为：" in suggestion:
-            return suggestion.split("建议改为：")[-1].strip()
-        elif "应为" in suggestion:
-            return suggestion.split("应为")[-1].strip().strip("'\"")
-        elif "->" in suggestion:
-            return suggestion.split("->")[-1].strip()
-        elif "改为" in suggestion:
-            return suggestion.split("改为")[-1].strip().strip("'\"")
-        else:
-            # 如果无法提取，返回空字符串
-            return ""
+        return extract_corrected_text(suggestion)
     
     def extract_text_content(self, doc: Document):
         """提取文档的文本内容"""
@@ -5,34 +5,39 @@
 """
 
 import os
-import sys
-from typing import Optional
+import json
+import hashlib
 from rich.console import Console
 from docx import Document
 from datetime import datetime
 
 from .config import Config
-from .document import DocumentProcessor
 from .ai_checker import AIChecker, ProofreadingResult
-from .word_track_changes import WordTrackChangesManager, enable_track_changes_in_docx
-from .word_comments_advanced import WordCommentsManager
-from .word_comments_xml import create_comments_xml, create_document_rels, update_content_types, add_comments_to_docx
-import zipfile
-import tempfile
+from .text_matcher import locate_first, extract_corrected_text
+
+# AI校对结果缓存目录及提示词版本（修改提示词时需递增版本号使旧缓存失效）
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "aidocproof")
+PROMPT_VERSION = "v1"
 
 
 class ProofReaderWithTrackChangesAndComments:
     """增强版校对器 - 同时使用跟踪更改和批注"""
     
-    def __init__(self, api_key: str = None):
-        """初始化校对器"""
+    def __init__(self, api_key: str = None, verbose: bool = False, use_cache: bool = None):
+        """初始化校对器，verbose为True时逐条输出每个更改的处理结果
+
+        use_cache控制是否使用AI校对结果的磁盘缓存（缓存中保存文档全文的校对结果），
+        未指定时读取环境变量AI_RESULT_CACHE，设为0时关闭
+        """
         self.config = Config()
         if api_key:
             self.config.ai.api_key = api_key
         self.ai_checker = AIChecker(self.config)
         self.console = Console()
-        
-        self.document_processor = DocumentProcessor()
+        self.verbose = verbose
+        if use_cache is None:
+            use_cache = os.getenv("AI_RESULT_CACHE", "1") != "0"
+        self.use_cache = use_cache
     
     def proofread_with_track_changes_and_comments(self, input_file: str, output_file: str = None) -> bool:
         """使用跟踪更改和批注进行校对 - 确保跟踪更改和批注完全同步"""
@@ -51,11 +56,12 @@ class ProofReaderWithTrackChangesAndComments:
             
             # 只进行一次AI校对
             self.console.print("[bold]开始AI校对...")
-            ai_result = self.ai_checker.check_text(' '.join(text_content))
+            joined_text = ' '.join(text_content)
+            ai_result = self._cached_check_text(joined_text)
             
             # 第二步：同时创建跟踪更改和批注的数据
             self.console.print("[blue]第二步：同步生成跟踪更改和批注数据...[/blue]")
-            synchronized_changes = self._create_synchronized_changes(ai_result, text_content)
+            synchronized_changes = self._create_synchronized_changes(ai_result, text_content, joined_text)
             self.console.print(f"[green]✅ AI校对完成，发现 {len(synchronized_changes)} 个问题[/green]")
             
             # 第三步：同时应用跟踪更改和批注
@@ -76,9 +82,58 @@ class ProofReaderWithTrackChangesAndComments:
             self.console.print(f"[red]❌ 增强校对失败: {e}[/red]")
             return False
 
-    def _create_synchronized_changes(self, ai_result: ProofreadingResult, text_content: list):
+    def _cached_check_text(self, joined_text: str) -> ProofreadingResult:
+        """带磁盘缓存的AI校对 - 以(模型参数, 提示词版本, 校对规则, 文本)的SHA256为键"""
+        if not self.use_cache:
+            return self.ai_checker.check_text(joined_text)
+        
+        key = hashlib.sha256(
+            f"{self._cache_settings()}|{PROMPT_VERSION}|".encode('utf-8') + joined_text.encode('utf-8')
+        ).hexdigest()
+        cache_file = os.path.join(CACHE_DIR, f"{key}.json")
+        
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    result = ProofreadingResult.from_dict(json.load(f))
+                self.console.print("[cyan]💾 命中AI校对缓存，跳过AI调用[/cyan]")
+                return result
+            except Exception as e:
+                self.console.print(f"[yellow]⚠️ 读取AI校对缓存失败，重新校对: {e}[/yellow]")
+        
+        result = self.ai_checker.check_text(joined_text)
+        
+        # AI调用失败时结果只包含基础检查，不写入缓存
+        if not result.statistics.get("ai_failed"):
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                temp_cache_file = f"{cache_file}.{os.getpid()}.tmp"
+                with open(temp_cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(result.to_dict(), f, ensure_ascii=False)
+                os.replace(temp_cache_file, cache_file)
+            except Exception as e:
+                self.console.print(f"[yellow]⚠️ 写入AI校对缓存失败: {e}[/yellow]")
+        
+        return result
+
+    def _cache_settings(self) -> str:
+        """影响校对结果的配置：模型及接口地址、模型参数、校对规则，以及启用的规则所用的词典"""
+        rules = self.config.rules
+        settings = {
+            'model': self.config.ai.model,
+            'base_url': self.config.ai.base_url,
+            'max_tokens': self.config.ai.max_tokens,
+            'temperature': self.config.ai.temperature,
+            'rules': rules.model_dump(),
+            'typo_dict': self.config.typo_dict if rules.check_spelling else None,
+            'terminology_dict': self.config.terminology_dict if rules.check_terminology else None,
+        }
+        return json.dumps(settings, ensure_ascii=False, sort_keys=True)
+
+    def _create_synchronized_changes(self, ai_result: ProofreadingResult, text_content: list, joined_text: str = None):
         """创建同步的跟踪更改和批注数据"""
-        synchronized_changes = []
+        candidates = []
+        now_str = datetime.now().strftime('%Y-%m-%d %H:%M')
         
         # 处理AI校对的issues
         for issue in ai_result.issues:
@@ -92,25 +147,22 @@ class ProofReaderWithTrackChangesAndComments:
             
             # 如果有可用的修正文本，创建同步更改
             if corrected_text and corrected_text != problem_text:
-                # 找到问题文本在哪个段落
-                for i, paragraph_text in enumerate(text_content):
-                    if problem_text in paragraph_text:
-                        # 创建批注文本
-                        comment_text = f"🔍 发现问题: {issue_type}\n"
-                        comment_text += f"📝 修正: {problem_text} → {corrected_text}\n"
-                        comment_text += f"⚠️ 严重程度: {severity}\n"
-                        comment_text += f"💡 建议: {suggestion}\n"
-                        comment_text += f"⏰ 检查时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-                        
-                        synchronized_changes.append({
-                            'paragraph_index': i,
-                            'original_text': problem_text,
-                            'corrected_text': corrected_text,
-                            'comment_text': comment_text,
-                            'reason': f"{issue_type} - {severity}",
-                            'type': 'issue_fix'
-                        })
-                        break
+                # 创建批注文本
+                comment_text = (
+                    f"🔍 发现问题: {issue_type}\n"
+                    f"📝 修正: {problem_text} → {corrected_text}\n"
+                    f"⚠️ 严重程度: {severity}\n"
+                    f"💡 建议: {suggestion}\n"
+                    f"⏰ 检查时间: {now_str}"
+                )
+                
+                candidates.append({
+                    'original_text': problem_text,
+                    'corrected_text': corrected_text,
+                    'comment_text': comment_text,
+                    'reason': f"{issue_type} - {severity}",
+                    'type': 'issue_fix'
+                })
         
         # 处理AI校对的suggestions
         for suggestion in ai_result.suggestions:
@@ -120,38 +172,51 @@ class ProofReaderWithTrackChangesAndComments:
             
             # 如果建议文本与原文本不同，创建同步更改
             if suggested_text and suggested_text != original_text:
-                # 找到原文本在哪个段落
-                for i, paragraph_text in enumerate(text_content):
-                    if original_text in paragraph_text:
-                        # 创建批注文本
-                        comment_text = f"💡 建议修改: '{original_text}' → '{suggested_text}'\n"
-                        comment_text += f"📋 原因: {reason}\n"
-                        comment_text += f"🎯 类型: 改进建议\n"
-                        comment_text += f"⏰ 建议时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-                        
-                        synchronized_changes.append({
-                            'paragraph_index': i,
-                            'original_text': original_text,
-                            'corrected_text': suggested_text,
-                            'comment_text': comment_text,
-                            'reason': reason,
-                            'type': 'suggestion'
-                        })
-                        break
+                # 创建批注文本
+                comment_text = (
+                    f"💡 建议修改: '{original_text}' → '{suggested_text}'\n"
+                    f"📋 原因: {reason}\n"
+                    f"🎯 类型: 改进建议\n"
+                    f"⏰ 建议时间: {now_str}"
+                )
+                
+                candidates.append({
+                    'original_text': original_text,
+                    'corrected_text': suggested_text,
+                    'comment_text': comment_text,
+                    'reason': reason,
+                    'type': 'suggestion'
+                })
+        
+        # 一次扫描定位所有原文本所在段落
+        paragraph_indexes = locate_first([c['original_text'] for c in candidates], text_content, joined_text)
+        
+        synchronized_changes = []
+        for candidate, paragraph_index in zip(candidates, paragraph_indexes):
+            if paragraph_index is not None:
+                synchronized_changes.append({'paragraph_index': paragraph_index, **candidate})
         
         return synchronized_changes
 
     def _apply_synchronized_changes(self, doc: Document, synchronized_changes: list, output_file: str) -> bool:
         """同时应用跟踪更改和批注"""
         try:
+            from .word_track_changes import WordTrackChangesManager
+            from .word_comments_advanced import WordCommentsManager
+            
             # 创建跟踪更改管理器
             track_changes_manager = WordTrackChangesManager(doc)
             
             # 创建批注管理器
             comments_manager = WordCommentsManager(doc)
             
-            # 应用每个同步更改
+            # 段落列表只获取一次，避免每次访问doc.paragraphs都重新遍历文档
+            paragraphs = doc.paragraphs
+            
+            # 应用每个同步更改，输出信息汇总后一次性打印
             applied_count = 0
+            failed_count = 0
+            log_lines = []
             for change in synchronized_changes:
                 paragraph_index = change.get('paragraph_index', 0)
                 original_text = change.get('original_text', '')
@@ -161,8 +226,8 @@ class ProofReaderWithTrackChangesAndComments:
                 change_type = change.get('type', '')
                 
                 # 获取对应段落
-                if paragraph_index < len(doc.paragraphs):
-                    paragraph = doc.paragraphs[paragraph_index]
+                if paragraph_index < len(paragraphs):
+                    paragraph = paragraphs[paragraph_index]
                     
                     # 同时应用跟踪更改和批注
                     track_change_success = track_changes_manager.add_tracked_change(
@@ -174,24 +239,37 @@ class ProofReaderWithTrackChangesAndComments:
                     
                     if track_change_success and comment_success:
                         applied_count += 1
-                        self.console.print(
-                            f"[green]✅ 同步更改 {applied_count}: {original_text} -> {corrected_text} + 批注[/green]"
-                        )
-                    elif track_change_success:
-                        self.console.print(
-                            f"[yellow]⚠️ 跟踪更改成功但批注失败: {original_text}[/yellow]"
-                        )
-                    elif comment_success:
-                        self.console.print(
-                            f"[yellow]⚠️ 批注成功但跟踪更改失败: {original_text}[/yellow]"
-                        )
+                        if self.verbose:
+                            log_lines.append(
+                                f"[green]✅ 同步更改 {applied_count}: {original_text} -> {corrected_text} + 批注[/green]"
+                            )
                     else:
-                        self.console.print(
-                            f"[red]❌ 同步更改失败: {original_text}[/red]"
-                        )
+                        failed_count += 1
+                        if not self.verbose:
+                            continue
+                        if track_change_success:
+                            log_lines.append(
+                                f"[yellow]⚠️ 跟踪更改成功但批注失败: {original_text}[/yellow]"
+                            )
+                        elif comment_success:
+                            log_lines.append(
+                                f"[yellow]⚠️ 批注成功但跟踪更改失败: {original_text}[/yellow]"
+                            )
+                        else:
+                            log_lines.append(
+                                f"[red]❌ 同步更改失败: {original_text}[/red]"
+                            )
+            
+            # 逐条结果汇总后一次性输出，非详细模式只输出统计
+            if log_lines:
+                self.console.print("\n".join(log_lines))
+            elif failed_count:
+                self.console.print(f"同步更改未完全成功: {failed_count} 个", markup=False)
             
             # 应用所有跟踪更改
-            track_changes_manager.apply_all_changes()
+            applied = track_changes_manager.apply_all_changes()
+            if applied['paragraphs']:
+                self.console.print(f"[green]✅ 已应用跟踪更改: {applied['paragraphs']} 个段落，{applied['changes']} 个更改[/green]")
             
             # 保存临时文档
             temp_file = output_file.replace('.docx', '_temp.docx')
@@ -231,12 +309,13 @@ class ProofReaderWithTrackChangesAndComments:
             comment_proofreader = ProofReaderWithCommentsAndTrackChanges()
             
             # 格式化批注数据为正确的格式
+            now_iso = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
             formatted_comments = []
             for comment in comments_data:
                 formatted_comments.append({
                     'text': comment.get('text', ''),
                     'author': comment.get('author', 'AI校对助手'),
-                    'date': comment.get('date', datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"))
+                    'date': comment.get('date', now_iso)
                 })
             
             self.console.print(f"[cyan]🔧 使用专门的批注处理模块添加 {len(formatted_comments)} 个批注[/cyan]")
@@ -277,18 +356,7 @@ class ProofReaderWithTrackChangesAndComments:
 
     def _extract_corrected_text(self, suggestion: str):
         """从建议中提取修正后的文本"""
-        # 尝试从建议中提取修正文本
-        if "建议改为：" in suggestion:
-            return suggestion.split("建议改为：")[-1].strip()
-        elif "应为" in suggestion:
-            return suggestion.split("应为")[-1].strip().strip("'\"")
-        elif "->" in suggestion:
-            return suggestion.split("->")[-1].strip()
-        elif "改为" in suggestion:
-            return suggestion.split("改为")[-1].strip().strip("'\"")
-        else:
-            # 如果无法提取，返回空字符串
-            return ""
+        return extract_corrected_text(suggestion)
     
     def extract_text_content(self, doc: Document):
         """提取文档的文本内容"""
@@ -4,22 +4,167 @@
 修复版增强校对器 - 确保跟踪更改和批注都正确显示
 """
 
+import functools
 import os
-import sys
-from typing import Optional
+import re
+from collections import defaultdict
 from rich.console import Console
 from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import Part
 from datetime import datetime
-import zipfile
-import tempfile
-import xml.etree.ElementTree as ET
 
 from .config import Config
 from .document import DocumentProcessor
 from .ai_checker import AIChecker, ProofreadingResult
-from .word_track_changes import WordTrackChangesManager, enable_track_changes_in_docx
+from .word_track_changes import WordTrackChangesManager, enable_track_changes_in_document
+from .word_comments import new_comment_range_end, new_comment_range_start, new_comment_reference_run
 from .word_comments_advanced import WordCommentsManager
-from .word_comments_xml import create_comments_xml, create_document_rels, update_content_types
+from .text_matcher import find_occurrences, find_matches, present_needles
+from .docx_package import COMMENTS_XML
+from .word_comments_xml import build_comments_xml
+
+# WordprocessingML命名空间（Clark记法前缀）
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_W_ID = f'{_W}id'
+_DEL_PATH = f'.//{_W}del'
+_W_R = f'{_W}r'
+_COMMENT_MARKER_TAGS = (f'{_W}commentRangeStart', f'{_W}commentRangeEnd', f'{_W}commentReference')
+
+# 标点符号（非字母数字、非空白字符）
+_PUNCT_RE = re.compile(r'[^\w\s]')
+
+# 从建议中提取修正文本的模式：优先匹配引号包围的修正文本
+_QUOTED_PATTERNS = [re.compile(pattern) for pattern in (
+    r"应为[：:]?\s*[\"']([^\"']+)[\"']",
+    r"改为[：:]?\s*[\"']([^\"']+)[\"']",
+    r"修正为[：:]?\s*[\"']([^\"']+)[\"']",
+    r"建议改为[：:]?\s*[\"']([^\"']+)[\"']",
+    r"应该是[：:]?\s*[\"']([^\"']+)[\"']",
+    r"正确的是[：:]?\s*[\"']([^\"']+)[\"']",
+    r"→\s*[\"']([^\"']+)[\"']",
+    r"替换为[：:]?\s*[\"']([^\"']+)[\"']"
+)]
+
+_SIMPLE_PATTERNS = [re.compile(pattern) for pattern in (
+    r"应为[：:]?\s*([^\s，。]+)",
+    r"改为[：:]?\s*([^\s，。]+)",
+    r"修正为[：:]?\s*([^\s，。]+)",
+    r"建议改为[：:]?\s*([^\s，。]+)",
+    r"应该是[：:]?\s*([^\s，。]+)",
+    r"正确的是[：:]?\s*([^\s，。]+)"
+)]
+
+
+# 句子长度不同时查找的常见替换
+_COMMON_REPLACEMENTS = (
+    ("计算器科学", "计算机科学"),
+    ("程式设计", "程序设计"),
+    ("软体工程", "软件工程"),
+    ("变数", "变量"),
+    ("函式", "函数"),
+    ("超级计算器", "超级计算机"),
+    (",", "，"),  # 标点符号替换
+)
+
+
+# 术语不一致描述的解析：定位标记及其后的截断位置、分割术语、去除引号
+_TERM_MARKERS = ("发现多种术语：", "建议统一使用", "推荐使用")
+_TERM_TERMINATORS = ("，", "。")
+_TERM_PHRASES = _TERM_MARKERS + _TERM_TERMINATORS
+_TERM_SPLIT_RE = re.compile(r'[、，]')
+_QUOTE_TRANS = str.maketrans('', '', '"\'“”‘’')
+
+# 特殊的术语对
+_SPECIAL_TERMS = {
+    "软体工程": "软件工程",
+    "程式设计": "程序设计",
+    "计算器科学": "计算机科学",
+    "资料结构": "数据结构",
+    "演算法": "算法"
+}
+_SPECIAL_TERM_KEYS = tuple(_SPECIAL_TERMS)
+
+
+def _marker_section(text: str, markers: tuple):
+    """一次扫描定位标记，返回按优先级第一个出现的标记之后、到下一个，或。之前的文本；没有标记时返回None"""
+    matches = find_matches(_TERM_PHRASES, text)
+    first_starts = {}
+    for start, phrase in matches:
+        first_starts.setdefault(phrase, start)
+    
+    for marker in markers:
+        if marker in first_starts:
+            section_start = first_starts[marker] + len(marker)
+            section_end = next((start for start, phrase in matches
+                                if start >= section_start and phrase in _TERM_TERMINATORS), len(text))
+            return text[section_start:section_end]
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _is_text_match(target_text: str, paragraph_text: str, paragraph_clean: str = None,
+                   target_has_punct: bool = None) -> bool:
+    """改进的文本匹配逻辑
+
+    paragraph_clean为调用方预先去除标点的段落文本，target_has_punct为预先计算的目标文本是否含标点
+    """
+    # 精确匹配
+    if target_text in paragraph_text:
+        return True
+    
+    # 去除标点符号后匹配（目标文本不含标点时无需处理）
+    if target_has_punct is None:
+        target_has_punct = _PUNCT_RE.search(target_text) is not None
+    target_clean = _PUNCT_RE.sub('', target_text) if target_has_punct else target_text
+    if paragraph_clean is None:
+        paragraph_clean = _PUNCT_RE.sub('', paragraph_text)
+    if target_clean in paragraph_clean:
+        return True
+    
+    # 分词匹配（处理术语），目标文本不含空白时等同于精确匹配，已在上面判断过
+    target_words = target_text.split()
+    if len(target_words) == 1 and target_words[0] != target_text and target_words[0] in paragraph_text:
+        return True
+    
+    return False
+
+
+@functools.lru_cache(maxsize=4096)
+def _extract_word_corrections(original_text: str, suggested_text: str) -> tuple:
+    """从句子级别的修正中提取词汇级别的修正，返回 (原词, 修正词) 元组"""
+    # 简单的词汇差异检测
+    original_words = original_text.split()
+    suggested_words = suggested_text.split()
+    
+    # 如果长度相同，逐词比较
+    if len(original_words) == len(suggested_words):
+        return tuple((orig, sugg) for orig, sugg in zip(original_words, suggested_words) if orig != sugg)
+    
+    # 如果长度不同，查找明显的替换
+    return tuple((orig, repl) for orig, repl in _COMMON_REPLACEMENTS
+                 if orig in original_text and repl in suggested_text)
+
+
+def _print_traceback():
+    """打印当前异常的堆栈，traceback模块只在出错时才导入"""
+    import traceback
+    traceback.print_exc()
+
+
+def _remove_comment_markers(document_element, comment_ids):
+    """移除指定批注ID的范围标记和引用标记，只包含引用标记的run整体移除"""
+    if not comment_ids:
+        return
+    for marker in list(document_element.iter(*_COMMENT_MARKER_TAGS)):
+        if marker.get(_W_ID) not in comment_ids:
+            continue
+        parent = marker.getparent()
+        if parent.tag == _W_R and len(parent) == 1:
+            parent.getparent().remove(parent)
+        else:
+            parent.remove(marker)
 
 
 class ProofReaderWithTrackChangesAndCommentsFixed:
@@ -48,19 +193,20 @@ class ProofReaderWithTrackChangesAndCommentsFixed:
             # 第一步：AI校对
             self.console.print("[blue]第一步：AI校对分析文档...[/blue]")
             doc = Document(input_file)
-            text_content = self.extract_text_content(doc)
+            # 一次遍历同时取得段落对象和文本，后续步骤直接复用
+            paragraphs, text_content = self._extract_paragraphs_and_text(doc)
             self.console.print(f"[blue]提取文本内容: {len(text_content)} 个段落[/blue]")
             
             ai_result = self.ai_checker.check_text(' '.join(text_content))
             
             # 第二步：创建同步更改数据
             self.console.print("[blue]第二步：生成同步更改数据...[/blue]")
-            synchronized_changes = self._create_synchronized_changes(ai_result, text_content, doc)
+            synchronized_changes = self._create_synchronized_changes(ai_result, text_content)
             self.console.print(f"[green]✅ 发现 {len(synchronized_changes)} 个需要修改的问题[/green]")
             
             # 第三步：应用更改和批注
             self.console.print("[blue]第三步：应用跟踪更改和批注...[/blue]")
-            success = self._apply_changes_with_proper_comments(doc, synchronized_changes, output_file)
+            success = self._apply_changes_with_proper_comments(doc, synchronized_changes, output_file, paragraphs)
             
             if success:
                 self.console.print(f"[green]✅ 修复版增强校对完成：{output_file}[/green]")
@@ -74,11 +220,10 @@ class ProofReaderWithTrackChangesAndCommentsFixed:
             
         except Exception as e:
             self.console.print(f"[red]❌ 修复版增强校对失败: {e}[/red]")
-            import traceback
-            traceback.print_exc()
+            _print_traceback()
             return False
 
-    def _create_synchronized_changes(self, ai_result: ProofreadingResult, text_content: list, doc: Document):
+    def _create_synchronized_changes(self, ai_result: ProofreadingResult, text_content: list):
         """创建同步的跟踪更改和批注数据"""
         synchronized_changes = []
         processed_pairs = set()  # 避免重复处理相同的修正对
@@ -146,143 +291,163 @@ class ProofReaderWithTrackChangesAndCommentsFixed:
                         })
                         processed_pairs.add(correction_pair)
         
-        # 创建段落索引映射 - 从非空段落索引到实际段落索引
-        paragraph_mapping = {}
-        text_index = 0
-        for doc_index, paragraph in enumerate(doc.paragraphs):
-            if paragraph.text.strip():
-                paragraph_mapping[text_index] = doc_index
-                text_index += 1
-        
-        # 改进的文本匹配和应用逻辑
         for correction in all_corrections:
+            correction['target_has_punct'] = _PUNCT_RE.search(correction['original']) is not None
+            correction['comment_prefix'] = self._build_comment_prefix(correction)
+        
+        # 同一次校对的所有批注共用一个处理时间
+        time_line = f"⏰ 处理时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        
+        # 一次扫描所有段落，定位每个修正原文的全部出现位置
+        # text_content与doc.paragraphs一一对应，段落索引可直接使用
+        all_occurrences = find_occurrences([c['original'] for c in all_corrections], text_content)
+        paragraph_cleans = None
+        fuzzy_match_cache = {}
+        
+        for correction, occurrences in zip(all_corrections, all_occurrences):
             original = correction['original']
             corrected = correction['corrected']
             reason = correction['reason']
             corr_type = correction['type']
             
-            # 在所有段落中查找匹配项
-            matches_found = []
-            for i, paragraph_text in enumerate(text_content):
-                # 使用更精确的匹配策略
-                if self._is_text_match(original, paragraph_text):
-                    actual_paragraph_index = paragraph_mapping.get(i, i)
-                    # 计算该术语在段落中出现的次数
-                    occurrences = paragraph_text.count(original)
-                    matches_found.append((i, actual_paragraph_index, paragraph_text, occurrences))
-            
-            # 处理所有匹配项
-            if matches_found:
-                for text_idx, para_idx, para_text, occurrences in matches_found:
-                    # 为每个出现的术语创建一个修正项
-                    for occurrence in range(occurrences):
-                        # 创建批注文本
-                        if corr_type == 'suggestion':
-                            comment_text = f"💡 改进建议: {original} → {corrected}\n"
-                            comment_text += f"📋 原因: {reason}\n"
-                            comment_text += f"🎯 类型: 改进建议\n"
-                        elif corr_type == 'terminology':
-                            comment_text = f"🔍 术语不一致修正: {original} → {corrected}\n"
-                            comment_text += f"📝 理由: {reason}\n"
-                            comment_text += f"💡 建议: {correction.get('suggestion_text', '')}\n"
-                        else:
-                            comment_text = f"🔧 错误修正: {original} → {corrected}\n"
-                            comment_text += f"📝 理由: {reason}\n"
-                            comment_text += f"💡 建议: {correction.get('suggestion_text', '')}\n"
-                        
-                        comment_text += f"⏰ 处理时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-                        
-                        synchronized_changes.append({
-                            'paragraph_index': para_idx,
-                            'original_text': original,
-                            'corrected_text': corrected,
-                            'comment_text': comment_text,
-                            'reason': reason,
-                            'type': corr_type,
-                            'occurrence_index': occurrence  # 添加出现次数索引
-                        })
-                        
-                        self.console.print(f"[green]✅ 添加修正: {original} → {corrected} (段落{para_idx+1}, 第{occurrence+1}次出现)[/green]")
-            else:
-                self.console.print(f"[yellow]⚠️  未找到匹配文本: {original}[/yellow]")
+            # 处理所有匹配项，每个出现的术语创建一个修正项
+            comment_text = correction['comment_prefix'] + time_line
+            for para_idx, occurrence, _ in occurrences:
+                synchronized_changes.append({
+                    'paragraph_index': para_idx,
+                    'original_text': original,
+                    'corrected_text': corrected,
+                    'comment_text': comment_text,
+                    'reason': reason,
+                    'type': corr_type,
+                    'occurrence_index': occurrence  # 添加出现次数索引
+                })
+                
+                self.console.print(f"[green]✅ 添加修正: {original} → {corrected} (段落{para_idx+1}, 第{occurrence+1}次出现)[/green]")
+            
+            # 没有精确匹配时，仅在连近似匹配都没有的情况下提示
+            if not occurrences:
+                # 多个修正可能共用同一原文（修正文本或类型不同），近似匹配结果按原文缓存
+                matched = fuzzy_match_cache.get(original)
+                if matched is None:
+                    if paragraph_cleans is None:
+                        # 去除标点的段落文本只在需要近似匹配时计算一次
+                        paragraph_cleans = [_PUNCT_RE.sub('', text) for text in text_content]
+                    matched = any(_is_text_match(original, text, clean, correction['target_has_punct'])
+                                  for text, clean in zip(text_content, paragraph_cleans))
+                    fuzzy_match_cache[original] = matched
+                if not matched:
+                    self.console.print(f"[yellow]⚠️  未找到匹配文本: {original}[/yellow]")
         
         self.console.print(f"[green]✅ 总共创建了 {len(synchronized_changes)} 个同步更改[/green]")
         return synchronized_changes
 
+    def _build_comment_prefix(self, correction: dict) -> str:
+        """按修正类型生成批注文本中除处理时间外的部分"""
+        original = correction['original']
+        corrected = correction['corrected']
+        reason = correction['reason']
+        corr_type = correction['type']
+        
+        if corr_type == 'suggestion':
+            return (f"💡 改进建议: {original} → {corrected}\n"
+                    f"📋 原因: {reason}\n"
+                    f"🎯 类型: 改进建议\n")
+        if corr_type == 'terminology':
+            return (f"🔍 术语不一致修正: {original} → {corrected}\n"
+                    f"📝 理由: {reason}\n"
+                    f"💡 建议: {correction.get('suggestion_text', '')}\n")
+        return (f"🔧 错误修正: {original} → {corrected}\n"
+                f"📝 理由: {reason}\n"
+                f"💡 建议: {correction.get('suggestion_text', '')}\n")
+
     def _is_text_match(self, target_text: str, paragraph_text: str) -> bool:
         """改进的文本匹配逻辑"""
-        # 精确匹配
-        if target_text in paragraph_text:
-            return True
-        
-        # 去除标点符号后匹配
-        import re
-        target_clean = re.sub(r'[^\w\s]', '', target_text)
-        paragraph_clean = re.sub(r'[^\w\s]', '', paragraph_text)
-        if target_clean in paragraph_clean:
-            return True
-        
-        # 分词匹配（处理术语）
-        target_words = target_text.split()
-        if len(target_words) == 1 and target_words[0] in paragraph_text:
-            return True
-        
-        return False
+        return _is_text_match(target_text, paragraph_text)
 
-    def _apply_changes_with_proper_comments(self, doc: Document, synchronized_changes: list, output_file: str) -> bool:
-        """应用更改并确保批注正确显示"""
+    def _apply_changes_with_proper_comments(self, doc: Document, synchronized_changes: list, output_file: str,
+                                            paragraphs: list = None) -> bool:
+        """应用更改并确保批注正确显示，paragraphs为已提取的段落列表，未提供时从doc中获取"""
         try:
-            # 创建跟踪更改管理器
+            # 创建跟踪更改管理器，并在内存中一次性启用文档的跟踪更改设置
             track_changes_manager = WordTrackChangesManager(doc)
+            if not enable_track_changes_in_document(doc):
+                self.console.print("[yellow]⚠️ 启用跟踪更改设置失败，文档仍包含修订标记[/yellow]")
             
             # 创建批注管理器
             comments_manager = WordCommentsManager(doc)
             
-            # 应用每个更改
-            applied_count = 0
+            # 段落列表只获取一次，避免每次访问doc.paragraphs都重新遍历文档
+            if paragraphs is None:
+                paragraphs = list(doc.paragraphs)
+            
+            # 按段落分组，同一段落的更改按出现顺序连续应用
+            buckets = defaultdict(list)
             for change in synchronized_changes:
-                paragraph_index = change.get('paragraph_index', 0)
-                original_text = change.get('original_text', '')
-                corrected_text = change.get('corrected_text', '')
-                comment_text = change.get('comment_text', '')
-                reason = change.get('reason', '')
+                buckets[change.get('paragraph_index', 0)].append(change)
+            
+            # 应用每个更改；同一修正在多处出现时只创建一个批注，共用同一个批注ID
+            applied_count = 0
+            commented_changes = []  # 与批注管理器中的批注一一对应
+            comment_keys = set()
+            handled = set()
+            for paragraph_index in sorted(buckets):
+                if paragraph_index >= len(paragraphs):
+                    continue
+                paragraph = paragraphs[paragraph_index]
                 
-                if paragraph_index < len(doc.paragraphs):
-                    paragraph = doc.paragraphs[paragraph_index]
+                group = buckets[paragraph_index]
+                group.sort(key=lambda change: change.get('occurrence_index', 0))
+                for change in group:
+                    original_text = change.get('original_text', '')
+                    corrected_text = change.get('corrected_text', '')
+                    comment_text = change.get('comment_text', '')
+                    reason = change.get('reason', '')
+                    comment_key = (original_text, corrected_text, reason, change.get('type'))
+                    
+                    # 跟踪更改管理器会处理段落内的全部出现位置，同段落的重复项无需再添加
+                    if (comment_key, paragraph_index) in handled:
+                        continue
+                    handled.add((comment_key, paragraph_index))
                     
                     # 应用跟踪更改
                     track_success = track_changes_manager.add_tracked_change(
                         paragraph, original_text, corrected_text, reason
                     )
                     
-                    # 应用批注
-                    comment_success = comments_manager.add_comment(
-                        paragraph, original_text, comment_text
-                    )
+                    # 应用批注（相同修正只添加一次）
+                    if comment_key in comment_keys:
+                        comment_success = True
+                    else:
+                        comment_success = comments_manager.add_comment(
+                            paragraph, original_text, comment_text
+                        )
+                        if comment_success:
+                            comment_keys.add(comment_key)
+                            # 记录批注对应的删除修订ID，用于在document.xml中定位批注范围；
+                            # 跟踪更改失败时没有对应的删除修订，批注保留按自身ID放置的标记
+                            if track_success:
+                                commented_changes.append({**change, 'del_id': track_changes_manager.revision_counter})
+                            else:
+                                commented_changes.append(change)
                     
                     if track_success and comment_success:
                         applied_count += 1
                         self.console.print(f"[green]✅ 应用更改 {applied_count}: {original_text} -> {corrected_text}[/green]")
             
             # 完成处理
-            track_changes_manager.apply_all_changes()
+            applied = track_changes_manager.apply_all_changes()
+            if applied['paragraphs']:
+                self.console.print(f"[green]✅ 已应用跟踪更改: {applied['paragraphs']} 个段落，{applied['changes']} 个更改[/green]")
             comments_manager.finalize_document()
             
-            # 保存带有基本更改的文档
-            temp_file = output_file.replace('.docx', '_temp.docx')
-            doc.save(temp_file)
-            
-            # 创建完整的批注系统
+            # 创建完整的批注系统并直接保存最终文档
             success = self._create_complete_comment_system(
-                temp_file, 
+                doc, 
                 output_file, 
-                self._prepare_comments_with_changes(comments_manager.get_comments_for_xml(), synchronized_changes)
+                self._prepare_comments_with_changes(comments_manager.get_comments_for_xml(), commented_changes)
             )
             
-            # 清理临时文件
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-            
             if success:
                 self.console.print(f"[green]✅ 成功应用 {applied_count} 个更改和批注[/green]")
                 return True
@@ -291,138 +456,84 @@ class ProofReaderWithTrackChangesAndCommentsFixed:
                 
         except Exception as e:
             self.console.print(f"[red]❌ 应用更改失败: {e}[/red]")
-            import traceback
-            traceback.print_exc()
+            _print_traceback()
             return False
 
-    def _create_complete_comment_system(self, temp_file: str, output_file: str, comments_data: list) -> bool:
-        """创建完整的批注系统"""
+    def _create_complete_comment_system(self, doc: Document, output_file: str, comments_data: list) -> bool:
+        """创建完整的批注系统：在文档中添加批注引用、挂接comments.xml部件后一次保存"""
         try:
             self.console.print(f"[cyan]🔧 创建完整的批注系统，包含 {len(comments_data)} 个批注[/cyan]")
             
-            with zipfile.ZipFile(temp_file, 'r') as input_zip:
-                with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as output_zip:
-                    # 复制原有文件，但需要修改document.xml
-                    for item in input_zip.infolist():
-                        if item.filename == 'word/document.xml':
-                            # 修改document.xml添加批注引用
-                            document_xml = input_zip.read(item.filename).decode('utf-8')
-                            modified_document_xml = self._add_comment_references_to_document(document_xml, comments_data)
-                            output_zip.writestr(item.filename, modified_document_xml.encode('utf-8'))
-                        elif item.filename not in ['word/comments.xml', 'word/_rels/document.xml.rels', '[Content_Types].xml']:
-                            output_zip.writestr(item, input_zip.read(item.filename))
-                    
-                    # 创建批注XML
-                    comments_xml = self._create_comments_xml(comments_data)
-                    output_zip.writestr('word/comments.xml', comments_xml)
-                    
-                    # 更新关系文件
-                    rels_xml = self._create_updated_rels(input_zip)
-                    output_zip.writestr('word/_rels/document.xml.rels', rels_xml)
-                    
-                    # 更新内容类型
-                    content_types_xml = self._create_updated_content_types(input_zip)
-                    output_zip.writestr('[Content_Types].xml', content_types_xml)
+            # 在document.xml中添加批注引用
+            self._add_comment_references_to_document(doc.element, comments_data)
+            
+            # 挂接批注部件，关系文件和内容类型由python-docx在保存时生成
+            self._attach_comments_part(doc, self._create_comments_xml(comments_data))
+            doc.save(output_file)
             
             self.console.print("[green]✅ 完整的批注系统创建成功[/green]")
             return True
             
         except Exception as e:
             self.console.print(f"[red]❌ 创建完整批注系统失败: {e}[/red]")
-            import traceback
-            traceback.print_exc()
+            _print_traceback()
             return False
 
-    def _create_comments_xml(self, comments_data: list) -> str:
-        """创建批注XML内容"""
-        xml_content = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<w:comments xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'''
-        
-        for comment in comments_data:
-            comment_id = comment.get('id', 1)
-            author = comment.get('author', 'AI校对助手')
-            date = comment.get('date', datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"))
-            text = comment.get('text', '')
-            
-            xml_content += f'''
-    <w:comment w:id="{comment_id}" w:author="{author}" w:date="{date}" w:initials="AI">
-        <w:p>
-            <w:r>
-                <w:t>{text}</w:t>
-            </w:r>
-        </w:p>
-    </w:comment>'''
+    def _attach_comments_part(self, doc: Document, comments_xml: bytes):
+        """将批注XML作为comments.xml部件挂接到文档主部件，替换已有的批注部件"""
+        document_part = doc.part
+        for r_id, rel in list(document_part.rels.items()):
+            if rel.reltype == RT.COMMENTS:
+                document_part.drop_rel(r_id)
         
-        xml_content += '\n</w:comments>'
-        return xml_content
+        comments_part = Part(
+            PackURI(f'/{COMMENTS_XML}'), CT.WML_COMMENTS, comments_xml, document_part.package
+        )
+        document_part.relate_to(comments_part, RT.COMMENTS)
 
-    def _create_updated_rels(self, input_zip) -> str:
-        """创建更新的关系文件"""
-        try:
-            # 读取原始关系文件
-            if 'word/_rels/document.xml.rels' in input_zip.namelist():
-                rels_xml = input_zip.read('word/_rels/document.xml.rels').decode('utf-8')
-            else:
-                # 创建基本的关系文件
-                rels_xml = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
-</Relationships>'''
-            
-            # 检查是否已包含批注关系
-            if 'comments.xml' not in rels_xml:
-                # 添加批注关系
-                rels_xml = rels_xml.replace(
-                    '</Relationships>',
-                    '''    <Relationship Id="rIdComments" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/comments" Target="comments.xml"/>
-</Relationships>'''
-                )
-            
-            return rels_xml
-            
-        except Exception as e:
-            print(f"创建关系文件失败: {e}")
-            # 返回基本的关系文件
-            return '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
-    <Relationship Id="rIdComments" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/comments" Target="comments.xml"/>
-</Relationships>'''
-
-    def _add_comment_references_to_document(self, document_xml: str, comments_data: list) -> str:
-        """在document.xml中添加批注引用标记"""
+    def _create_comments_xml(self, comments_data: list) -> bytes:
+        """创建批注XML内容（按模板拼接，不构建元素树）"""
+        return build_comments_xml(comments_data)
+
+    def _add_comment_references_to_document(self, document_element, comments_data: list) -> int:
+        """在document.xml的元素树中添加批注引用标记，返回添加的批注数
+
+        批注管理器已在段落中放置的同ID标记会先移除，批注范围改为包裹对应的删除标记
+        """
+        added = 0
         try:
-            modified_xml = document_xml
-            
-            # 为每个批注添加引用标记
-            for comment in comments_data:
-                comment_id = comment['id']
-                # 从synchronized_changes中获取原始文本信息
-                # 这里需要改进获取原始文本的方法
+            # 删除修订ID -> 批注ID；未记录修订ID的批注保留批注管理器按批注ID放置的标记，
+            # 不能以批注ID去匹配删除标记，否则可能包裹其他更改的删除修订
+            wanted = {str(comment['del_id']): str(comment['id']) for comment in comments_data if 'del_id' in comment}
+            
+            # 每个批注只包裹文档中第一个对应的删除标记
+            anchors = []
+            for del_elem in document_element.iterfind(_DEL_PATH):
+                comment_id = wanted.pop(del_elem.get(_W_ID), None)
+                if comment_id is not None:
+                    anchors.append((del_elem, comment_id))
+                    if not wanted:
+                        break
+            
+            _remove_comment_markers(document_element, {comment_id for _, comment_id in anchors})
+            
+            for del_elem, comment_id in anchors:
+                range_start = new_comment_range_start(comment_id)
+                range_end = new_comment_range_end(comment_id)
+                reference_run = new_comment_reference_run(comment_id)
                 
-                # 简单的方法：在每个包含跟踪更改的段落后添加批注引用
-                import re
-                
-                # 查找包含删除标记的位置，在其后添加批注引用
-                del_pattern = f'(<w:del[^>]*w:id="{comment_id}"[^>]*>.*?</w:del>)'
-                matches = re.finditer(del_pattern, modified_xml, re.DOTALL)
-                
-                for match in matches:
-                    # 在删除标记后添加批注标记
-                    comment_range_start = f'<w:commentRangeStart w:id="{comment_id}"/>'
-                    comment_range_end = f'<w:commentRangeEnd w:id="{comment_id}"/>'
-                    comment_reference = f'<w:r><w:commentReference w:id="{comment_id}"/></w:r>'
-                    
-                    replacement = f'{comment_range_start}{match.group(0)}{comment_range_end}{comment_reference}'
-                    modified_xml = modified_xml.replace(match.group(0), replacement, 1)
-                    self.console.print(f"[green]✅ 添加批注引用标记: comment_id={comment_id}[/green]")
-                    break  # 只处理第一个匹配
-            
-            return modified_xml
+                del_elem.addprevious(range_start)
+                # addnext插入到紧邻位置，先插入引用再插入结束标记
+                del_elem.addnext(reference_run)
+                del_elem.addnext(range_end)
+                added += 1
+                self.console.print(f"[green]✅ 添加批注引用标记: comment_id={comment_id}[/green]")
             
         except Exception as e:
             self.console.print(f"[red]添加批注引用失败: {e}[/red]")
-            import traceback
-            traceback.print_exc()
-            return document_xml
+            _print_traceback()
+        
+        return added
 
     def _prepare_comments_with_changes(self, comments_data: list, synchronized_changes: list) -> list:
         """准备包含更改信息的批注数据"""
@@ -437,6 +548,8 @@ class ProofReaderWithTrackChangesAndCommentsFixed:
                     change = synchronized_changes[i]
                     enhanced_comment['original_text'] = change.get('original_text', '')
                     enhanced_comment['corrected_text'] = change.get('corrected_text', '')
+                    if 'del_id' in change:
+                        enhanced_comment['del_id'] = change['del_id']
                 
                 enhanced_comments.append(enhanced_comment)
             
@@ -446,110 +559,29 @@ class ProofReaderWithTrackChangesAndCommentsFixed:
             self.console.print(f"[red]准备批注数据失败: {e}[/red]")
             return comments_data
 
-    def _create_updated_content_types(self, input_zip) -> str:
-        """创建更新的内容类型文件"""
-        try:
-            # 读取原始内容类型文件
-            if '[Content_Types].xml' in input_zip.namelist():
-                content_types_xml = input_zip.read('[Content_Types].xml').decode('utf-8')
-            else:
-                content_types_xml = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
-</Types>'''
-            
-            # 检查是否已包含批注内容类型
-            if 'word/comments.xml' not in content_types_xml:
-                # 添加批注内容类型
-                content_types_xml = content_types_xml.replace(
-                    '</Types>',
-                    '''    <Override PartName="/word/comments.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.comments+xml"/>
-</Types>'''
-                )
-            
-            return content_types_xml
-            
-        except Exception as e:
-            print(f"创建内容类型文件失败: {e}")
-            # 返回基本的内容类型文件
-            return '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
-<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
-    <Override PartName="/word/comments.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.comments+xml"/>
-</Types>'''
-
     def _extract_word_corrections(self, original_text: str, suggested_text: str):
         """从句子级别的修正中提取词汇级别的修正"""
-        corrections = []
         try:
-            # 简单的词汇差异检测
-            original_words = original_text.split()
-            suggested_words = suggested_text.split()
-            
-            # 如果长度相同，逐词比较
-            if len(original_words) == len(suggested_words):
-                for orig, sugg in zip(original_words, suggested_words):
-                    if orig != sugg:
-                        corrections.append((orig, sugg))
-            else:
-                # 如果长度不同，查找明显的替换
-                common_replacements = [
-                    ("计算器科学", "计算机科学"),
-                    ("程式设计", "程序设计"), 
-                    ("软体工程", "软件工程"),
-                    ("变数", "变量"),
-                    ("函式", "函数"),
-                    ("超级计算器", "超级计算机"),
-                    (",", "，"),  # 标点符号替换
-                ]
-                
-                for orig, repl in common_replacements:
-                    if orig in original_text and repl in suggested_text:
-                        corrections.append((orig, repl))
-            
-            return corrections
+            return _extract_word_corrections(original_text, suggested_text)
         except Exception as e:
             self.console.print(f"[yellow]⚠️  提取词汇修正失败: {e}[/yellow]")
-            return []
+            return ()
 
     def _extract_terms_from_inconsistency(self, problem_text: str, suggestion: str):
         """从术语不一致问题中提取术语对"""
         terms = []
         
         # 解析不一致术语描述
-        if "发现多种术语：" in problem_text:
-            # 提取术语列表
-            terms_part = problem_text.split("发现多种术语：")[1].strip()
-            # 移除可能的额外描述
-            if "，" in terms_part:
-                terms_part = terms_part.split("，")[0]
-            if "。" in terms_part:
-                terms_part = terms_part.split("。")[0]
-            
-            # 分割术语
-            term_variants = []
-            if "、" in terms_part:
-                term_variants = [t.strip().strip('"').strip("'") for t in terms_part.split("、")]
-            elif "，" in terms_part:
-                term_variants = [t.strip().strip('"').strip("'") for t in terms_part.split("，")]
-            else:
-                # 单个术语的情况
-                term_variants = [terms_part.strip().strip('"').strip("'")]
+        terms_part = _marker_section(problem_text, ("发现多种术语：",))
+        if terms_part is not None:
+            # 提取术语列表（已移除可能的额外描述）并分割术语
+            term_variants = [t.translate(_QUOTE_TRANS).strip() for t in _TERM_SPLIT_RE.split(terms_part)]
             
             # 从建议中提取标准术语
             standard_term = None
-            if "建议统一使用" in suggestion:
-                standard_part = suggestion.split("建议统一使用")[1].strip()
-                if "。" in standard_part:
-                    standard_part = standard_part.split("。")[0]
-                if "，" in standard_part:
-                    standard_part = standard_part.split("，")[0]
-                standard_term = standard_part.strip().strip('"').strip("'")
-            elif "推荐使用" in suggestion:
-                standard_part = suggestion.split("推荐使用")[1].strip()
-                if "。" in standard_part:
-                    standard_part = standard_part.split("。")[0]
-                if "，" in standard_part:
-                    standard_part = standard_part.split("，")[0]
-                standard_term = standard_part.strip().strip('"').strip("'")
+            standard_part = _marker_section(suggestion, ("建议统一使用", "推荐使用"))
+            if standard_part is not None:
+                standard_term = standard_part.translate(_QUOTE_TRANS).strip()
             
             # 如果找到标准术语，为每个变体创建修正对
             if standard_term and term_variants:
@@ -566,18 +598,10 @@ class ProofReaderWithTrackChangesAndCommentsFixed:
                         terms.append((variant, standard_term))
                         self.console.print(f"[cyan]📝 术语修正: {variant} → {standard_term}[/cyan]")
         
-        # 处理特殊的术语对
-        special_corrections = {
-            "软体工程": "软件工程",
-            "程式设计": "程序设计", 
-            "计算器科学": "计算机科学",
-            "资料结构": "数据结构",
-            "演算法": "算法"
-        }
-        
-        # 检查是否包含特殊术语
-        for original, corrected in special_corrections.items():
-            if original in problem_text or original in suggestion:
+        # 检查是否包含特殊术语（一次扫描问题描述和建议）
+        present = present_needles(_SPECIAL_TERM_KEYS, f"{problem_text}\n{suggestion}")
+        for original, corrected in _SPECIAL_TERMS.items():
+            if original in present:
                 terms.append((original, corrected))
                 self.console.print(f"[cyan]🔧 特殊术语修正: {original} → {corrected}[/cyan]")
         
@@ -588,38 +612,17 @@ class ProofReaderWithTrackChangesAndCommentsFixed:
         if not suggestion:
             return None
         
-        # 常见的修正模式
-        patterns = [
-            r"应为[：:]?\s*[\"']([^\"']+)[\"']",
-            r"改为[：:]?\s*[\"']([^\"']+)[\"']", 
-            r"修正为[：:]?\s*[\"']([^\"']+)[\"']",
-            r"建议改为[：:]?\s*[\"']([^\"']+)[\"']",
-            r"应该是[：:]?\s*[\"']([^\"']+)[\"']",
-            r"正确的是[：:]?\s*[\"']([^\"']+)[\"']",
-            r"→\s*[\"']([^\"']+)[\"']",
-            r"替换为[：:]?\s*[\"']([^\"']+)[\"']"
-        ]
-        
-        import re
-        for pattern in patterns:
-            match = re.search(pattern, suggestion)
+        # 常见的修正模式（引号包围的修正文本）
+        for pattern in _QUOTED_PATTERNS:
+            match = pattern.search(suggestion)
             if match:
                 corrected = match.group(1).strip()
                 self.console.print(f"[cyan]🔍 提取修正文本: {corrected}[/cyan]")
                 return corrected
         
         # 如果没有找到引号包围的文本，尝试其他模式
-        simple_patterns = [
-            r"应为[：:]?\s*([^\s，。]+)",
-            r"改为[：:]?\s*([^\s，。]+)",
-            r"修正为[：:]?\s*([^\s，。]+)",
-            r"建议改为[：:]?\s*([^\s，。]+)",
-            r"应该是[：:]?\s*([^\s，。]+)",
-            r"正确的是[：:]?\s*([^\s，。]+)"
-        ]
-        
-        for pattern in simple_patterns:
-            match = re.search(pattern, suggestion)
+        for pattern in _SIMPLE_PATTERNS:
+            match = pattern.search(suggestion)
             if match:
                 corrected = match.group(1).strip()
                 self.console.print(f"[cyan]🔍 提取修正文本: {corrected}[/cyan]")
@@ -639,10 +642,12 @@ class ProofReaderWithTrackChangesAndCommentsFixed:
     
     def extract_text_content(self, doc: Document):
         """提取文档的文本内容"""
-        text_content = []
-        for paragraph in doc.paragraphs:
-            text_content.append(paragraph.text)
-        return text_content
+        return self._extract_paragraphs_and_text(doc)[1]
+    
+    def _extract_paragraphs_and_text(self, doc: Document):
+        """一次遍历提取段落列表及对应文本，每个段落的text只读取一次"""
+        paragraphs = doc.paragraphs
+        return paragraphs, [paragraph.text for paragraph in paragraphs]
 
 
 def test_fixed_enhanced_proofreader():
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文本定位模块 - 在多个段落中批量查找多个目标文本
+
+使用 pyahocorasick（已列入requirements.txt）的 Aho–Corasick 自动机一次扫描全部段落；
+未安装时回退到逐段落的子串查找，两条路径的结果一致。
+"""
+
+import bisect
+import functools
+import operator
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# 启用多进程扫描的最小文档字数，较小的文档进程启动开销大于收益
+PARALLEL_MIN_CHARS = 2_000_000
+
+# 拼接段落时使用的分隔符
+_SEPARATOR = '\x00'
+
+# 修正文本分隔符，按优先级排列：(分隔符, 是否去除引号)
+CORRECTION_SEPARATORS = (
+    ("建议改为：", False),
+    ("应为", True),
+    ("->", False),
+    ("改为", True),
+)
+
+
+def locate_first(needles: List[str], texts: List[str], joined_text: Optional[str] = None) -> List[Optional[int]]:
+    """返回每个目标文本首次出现的段落索引，未找到时为None
+
+    joined_text为调用方已拼接好的全文（如送给AI校对的文本），传入可避免重复拼接
+    """
+    results: List[Optional[int]] = [None] * len(needles)
+    if not needles or not texts:
+        return results
+
+    # 同一文本可能被多个问题引用，按文本归并索引
+    needle_indexes = {}
+    for idx, needle in enumerate(needles):
+        if needle:
+            needle_indexes.setdefault(needle, []).append(idx)
+        else:
+            # 空字符串与 `in` 语义一致：出现在第一个段落
+            results[idx] = 0
+
+    if not needle_indexes:
+        return results
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for needle in needle_indexes:
+            automaton.add_word(needle, needle)
+        automaton.make_automaton()
+
+        remaining = len(needle_indexes)
+        for paragraph_index, text in enumerate(texts):
+            for _, needle in automaton.iter(text):
+                indexes = needle_indexes.pop(needle, None)
+                if indexes is None:
+                    continue
+                for idx in indexes:
+                    results[idx] = paragraph_index
+                remaining -= 1
+            if remaining == 0:
+                break
+        return results
+
+    unique_needles = list(needle_indexes)
+    for needle, paragraph_index in zip(unique_needles, _locate(unique_needles, texts, joined_text)):
+        if paragraph_index != -1:
+            for idx in needle_indexes[needle]:
+                results[idx] = paragraph_index
+
+    return results
+
+
+def find_occurrences(needles: List[str], texts: List[str], workers: Optional[int] = None) -> List[List[Tuple[int, int, int]]]:
+    """返回每个目标文本在各段落中的全部出现位置
+
+    每个目标文本对应一个 (段落索引, 段内第几次出现, 起始偏移) 列表，按段落和偏移排序；
+    同一段落内按 str.count 的语义计数，即互不重叠的出现。空字符串不计。
+    文档总字数超过 PARALLEL_MIN_CHARS 时，按连续段落分块在多个进程中扫描，workers 默认为CPU核数。
+    """
+    results: List[List[Tuple[int, int, int]]] = [[] for _ in needles]
+    needle_indexes = {}
+    for idx, needle in enumerate(needles):
+        if needle:
+            needle_indexes.setdefault(needle, []).append(idx)
+
+    if not needle_indexes or not texts:
+        return results
+
+    unique_needles = list(needle_indexes)
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(texts) > 1 and sum(map(len, texts)) >= PARALLEL_MIN_CHARS:
+        occurrences = _scan_parallel(unique_needles, texts, workers)
+    else:
+        occurrences = _scan_chunk(unique_needles, texts)
+
+    for needle, indexes in needle_indexes.items():
+        for idx in indexes:
+            results[idx] = occurrences[needle]
+    return results
+
+
+def _scan_parallel(needles: List[str], texts: List[str], workers: int) -> dict:
+    """将段落按连续区间分块，在进程池中分别扫描后按段落顺序合并"""
+    chunk_size = -(-len(texts) // workers)
+    chunk_starts = range(0, len(texts), chunk_size)
+    occurrences = {needle: [] for needle in needles}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_scan_chunk, needles, texts[start:start + chunk_size]) for start in chunk_starts]
+        for chunk_start, future in zip(chunk_starts, futures):
+            for needle, found in future.result().items():
+                occurrences[needle].extend(
+                    (chunk_start + paragraph_index, occurrence, offset)
+                    for paragraph_index, occurrence, offset in found
+                )
+    return occurrences
+
+
+def _scan_chunk(needles: List[str], texts: List[str]) -> dict:
+    """扫描一组段落，返回 {目标文本: [(段落索引, 段内第几次出现, 起始偏移), ...]}
+
+    定义在模块级别，以便在进程池中调用
+    """
+    occurrences = {needle: [] for needle in needles}
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for needle in needles:
+            automaton.add_word(needle, needle)
+        automaton.make_automaton()
+
+        for paragraph_index, text in enumerate(texts):
+            if not text:
+                continue
+            # 记录每个目标文本在本段落中上一次出现的结束位置，跳过重叠的匹配
+            last_end = {}
+            counts = {}
+            for end, needle in automaton.iter(text):
+                start = end - len(needle) + 1
+                if start < last_end.get(needle, 0):
+                    continue
+                last_end[needle] = end + 1
+                occurrence = counts.get(needle, 0)
+                counts[needle] = occurrence + 1
+                occurrences[needle].append((paragraph_index, occurrence, start))
+    else:
+        # 将所有段落拼接为一个缓冲区并记录各段起始偏移，每个目标文本只需在整个缓冲区上查找一遍。
+        # 段落文本来自XML，不可能包含NUL字符，用它分隔可保证匹配不会跨越段落
+        joined = _SEPARATOR.join(texts)
+        starts = []
+        position = 0
+        for text in texts:
+            starts.append(position)
+            position += len(text) + 1
+
+        for needle, found in occurrences.items():
+            if _SEPARATOR in needle:
+                continue
+            step = len(needle)
+            paragraph_index = -1
+            occurrence = 0
+            pos = joined.find(needle)
+            while pos != -1:
+                index = bisect.bisect_right(starts, pos) - 1
+                if index != paragraph_index:
+                    paragraph_index = index
+                    occurrence = 0
+                found.append((paragraph_index, occurrence, pos - starts[paragraph_index]))
+                occurrence += 1
+                pos = joined.find(needle, pos + step)
+
+    return occurrences
+
+
+def present_needles(needles: Tuple[str, ...], text: str) -> set:
+    """返回在text中出现过的目标文本集合，needles需为元组以便复用已构建的自动机"""
+    automaton = _build_automaton(needles)
+    if automaton is None:
+        return {needle for needle in needles if needle and needle in text}
+    return {needle for _, needle in automaton.iter(text)}
+
+
+def find_matches(needles: Tuple[str, ...], text: str) -> List[Tuple[int, str]]:
+    """一次扫描返回text中所有目标文本的出现位置 (起始偏移, 目标文本)，按起始偏移排序
+
+    needles需为元组以便复用已构建的自动机；同一目标文本的重叠出现也会全部返回
+    """
+    automaton = _build_automaton(needles)
+    if automaton is None:
+        matches = []
+        for needle in needles:
+            if not needle:
+                continue
+            start = text.find(needle)
+            while start != -1:
+                matches.append((start, needle))
+                start = text.find(needle, start + 1)
+    else:
+        matches = [(end - len(needle) + 1, needle) for end, needle in automaton.iter(text)]
+    matches.sort()
+    return matches
+
+
+@functools.lru_cache(maxsize=32)
+def _build_automaton(needles: Tuple[str, ...]):
+    """为固定的目标文本集合构建并缓存Aho–Corasick自动机，未安装pyahocorasick时返回None"""
+    if ahocorasick is None or not any(needles):
+        return None
+    automaton = ahocorasick.Automaton()
+    for needle in needles:
+        if needle:
+            automaton.add_word(needle, needle)
+    automaton.make_automaton()
+    return automaton
+
+
+def _locate(needles: List[str], haystacks: List[str], joined_text: Optional[str] = None) -> List[int]:
+    """逐个目标文本查找首次出现的段落索引，未找到时为-1"""
+    # 目标文本恰为整段时直接查表，只需检查其之前的段落是否已包含它
+    paragraph_lookup = {}
+    for paragraph_index, text in enumerate(haystacks):
+        paragraph_lookup.setdefault(text, paragraph_index)
+
+    # 全文字符频次，用于挑选每个目标文本中最罕见的字符做快速排除
+    # （复用调用方的拼接文本时，分隔符只会抬高个别字符的计数，不影响结果）
+    char_counts = Counter(joined_text if joined_text is not None else ''.join(haystacks))
+
+    # 每个段落的256位字符掩码，目标文本的字符集不是段落字符集的子集时直接跳过该段落
+    paragraph_masks = None
+
+    located = []
+    for needle in needles:
+        exact_index = paragraph_lookup.get(needle, -1)
+        rare_ch = min(needle, key=lambda ch: char_counts.get(ch, 0))
+        if char_counts.get(rare_ch, 0) == 0:
+            # 最罕见的字符在全文中都不存在，无需逐段查找
+            located.append(-1)
+            continue
+
+        search_end = len(haystacks) if exact_index == -1 else exact_index
+        if search_end == 0:
+            located.append(exact_index)
+            continue
+
+        if paragraph_masks is None:
+            paragraph_masks = [_char_mask(text) for text in haystacks]
+        needle_mask = _char_mask(needle)
+        located.append(next(
+            (i for i in range(search_end)
+             if paragraph_masks[i] & needle_mask == needle_mask and haystacks[i].find(needle) != -1),
+            exact_index
+        ))
+    return located
+
+
+def _char_mask(text: str) -> int:
+    """文本字符集的256位掩码（按码位低8位折叠）"""
+    return functools.reduce(operator.or_, (1 << (ord(ch) & 255) for ch in set(text)), 0)
+
+
+@functools.lru_cache(maxsize=4096)
+def extract_corrected_text(suggestion: str) -> str:
+    """从建议中提取修正后的文本（取最后一个分隔符之后的内容），无法提取时返回空字符串"""
+    for separator, strip_quotes in CORRECTION_SEPARATORS:
+        _, found, corrected = suggestion.rpartition(separator)
+        if found:
+            corrected = corrected.strip()
+            return corrected.strip("'\"") if strip_quotes else corrected
+    return ""
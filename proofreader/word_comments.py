@@ -4,14 +4,56 @@
 Word批注处理模块
 """
 
+import copy
+import logging
 from docx import Document
 from docx.oxml import parse_xml
 from docx.oxml.ns import qn
 from docx.shared import RGBColor
 from docx.enum.text import WD_COLOR_INDEX
 import uuid
-from datetime import datetime
-from lxml import etree
+
+
+logger = logging.getLogger(__name__)
+
+# 批注标记的原型元素只解析一次，之后按需深拷贝并设置ID
+_W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+_W_ID = qn('w:id')
+_COMMENT_RANGE_START_PROTO = parse_xml(f'<w:commentRangeStart w:id="0" xmlns:w="{_W_NS}"/>')
+_COMMENT_RANGE_END_PROTO = parse_xml(f'<w:commentRangeEnd w:id="0" xmlns:w="{_W_NS}"/>')
+_COMMENT_REFERENCE_PROTO = parse_xml(f'<w:commentReference w:id="0" xmlns:w="{_W_NS}"/>')
+_COMMENT_REFERENCE_RUN_PROTO = parse_xml(f'<w:r xmlns:w="{_W_NS}"><w:commentReference w:id="0"/></w:r>')
+
+# 尚未查找comments部分的标记
+_MISSING = object()
+
+
+def new_comment_range_start(comment_id):
+    """创建批注范围开始标记"""
+    element = copy.deepcopy(_COMMENT_RANGE_START_PROTO)
+    element.set(_W_ID, str(comment_id))
+    return element
+
+
+def new_comment_range_end(comment_id):
+    """创建批注范围结束标记"""
+    element = copy.deepcopy(_COMMENT_RANGE_END_PROTO)
+    element.set(_W_ID, str(comment_id))
+    return element
+
+
+def new_comment_reference(comment_id):
+    """创建批注引用标记（不含外层run）"""
+    element = copy.deepcopy(_COMMENT_REFERENCE_PROTO)
+    element.set(_W_ID, str(comment_id))
+    return element
+
+
+def new_comment_reference_run(comment_id):
+    """创建包含批注引用标记的run"""
+    element = copy.deepcopy(_COMMENT_REFERENCE_RUN_PROTO)
+    element[0].set(_W_ID, str(comment_id))
+    return element
 
 
 class WordCommentsHandler:
@@ -20,6 +62,7 @@ class WordCommentsHandler:
     def __init__(self, document):
         self.document = document
         self.comment_counter = 0
+        self._comments_part = _MISSING  # 首次查找后缓存文档中的comments部分（不存在时为None）
     
     def add_comment_to_run(self, run, comment_text: str, author: str = "AI校对助手"):
         """为指定的run添加Word原生批注"""
@@ -28,105 +71,69 @@ class WordCommentsHandler:
             self.comment_counter += 1
             comment_id = str(self.comment_counter)
             
+            # 先登记批注，成功后再修改文档，避免留下没有批注内容的标记
+            self._add_comment_to_document_comments(comment_id, comment_text, author)
+            
             # 高亮文本
             run.font.highlight_color = WD_COLOR_INDEX.YELLOW
             
             # 获取run的XML元素
             run_element = run._element
+            parent = run_element.getparent()
+            index = parent.index(run_element)
             
-            # 创建批注范围开始标记
-            comment_range_start = self._create_comment_range_start(comment_id)
-            run_element.addprevious(comment_range_start)
-            
-            # 创建批注范围结束标记
-            comment_range_end = self._create_comment_range_end(comment_id)
-            run_element.addnext(comment_range_end)
-            
-            # 创建批注引用
-            comment_reference = self._create_comment_reference(comment_id)
-            comment_range_end.addnext(comment_reference)
-            
-            # 添加批注到文档的批注集合
-            self._add_comment_to_document_comments(comment_id, comment_text, author)
+            # 批注范围开始标记、原run、批注范围结束标记和批注引用一次性替换原run所在位置
+            parent[index:index + 1] = [
+                self._create_comment_range_start(comment_id),
+                run_element,
+                self._create_comment_range_end(comment_id),
+                self._create_comment_reference(comment_id),
+            ]
             
             return True
             
         except Exception as e:
-            print(f"添加Word批注失败: {e}")
+            logger.warning("添加Word批注失败: %s", e)
             # 回退到简单的文本标记
             self._add_simple_comment_marker(run, comment_text)
             return False
     
     def _create_comment_range_start(self, comment_id: str):
         """创建批注范围开始标记"""
-        return parse_xml(
-            f'<w:commentRangeStart w:id="{comment_id}" '
-            f'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"/>'
-        )
+        return new_comment_range_start(comment_id)
     
     def _create_comment_range_end(self, comment_id: str):
         """创建批注范围结束标记"""
-        return parse_xml(
-            f'<w:commentRangeEnd w:id="{comment_id}" '
-            f'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"/>'
-        )
+        return new_comment_range_end(comment_id)
     
     def _create_comment_reference(self, comment_id: str):
         """创建批注引用"""
-        return parse_xml(
-            f'<w:r xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
-            f'<w:commentReference w:id="{comment_id}"/>'
-            f'</w:r>'
-        )
+        return new_comment_reference_run(comment_id)
     
     def _add_comment_to_document_comments(self, comment_id: str, comment_text: str, author: str):
-        """将批注添加到文档的批注集合中"""
-        try:
-            # 尝试创建comments.xml部分
-            current_time = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
-            
-            # 使用OpenXML标准格式创建批注
-            comment_xml = f'''
-            <w:comment w:id="{comment_id}" w:author="{author}" w:date="{current_time}" 
-                       xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
-                <w:p w:rsidR="00000000" w:rsidRDefault="00000000">
-                    <w:r>
-                        <w:t>{comment_text}</w:t>
-                    </w:r>
-                </w:p>
-            </w:comment>
-            '''
-            
-            # 由于python-docx对comments的支持有限，我们记录批注信息
-            print(f"📝 批注已添加: ID={comment_id}, 作者={author}, 内容={comment_text}")
-            
-            # 这里可以扩展以完全支持comments.xml的创建
-            self._ensure_comments_xml_part(comment_id, comment_text, author)
-            
-        except Exception as e:
-            print(f"处理批注XML失败: {e}")
+        """将批注添加到文档的批注集合中（由add_comment_to_run统一处理异常）"""
+        # 由于python-docx对comments的支持有限，我们记录批注信息
+        logger.debug("批注已添加: ID=%s, 作者=%s, 内容=%s", comment_id, author, comment_text)
+        
+        # 这里可以扩展以完全支持comments.xml的创建
+        self._ensure_comments_xml_part(comment_id, comment_text, author)
     
     def _ensure_comments_xml_part(self, comment_id: str, comment_text: str, author: str):
-        """确保文档包含comments.xml部分"""
-        try:
-            # 获取文档包
-            package = self.document.part.package
-            
-            # 检查是否已有comments部分
-            comments_part = None
-            for part in package.parts:
-                if 'comments' in part.partname:
-                    comments_part = part
-                    break
-            
-            if comments_part is None:
-                # 创建新的comments部分（这需要更复杂的实现）
-                print(f"需要创建comments.xml部分（当前版本使用备用标记）")
-            else:
-                print(f"找到现有的comments部分")
-                
-        except Exception as e:
-            print(f"处理comments.xml部分失败: {e}")
+        """确保文档包含comments.xml部分，只在第一次调用时遍历文档包"""
+        if self._comments_part is not _MISSING:
+            return
+        
+        # 获取文档包，检查是否已有comments部分（只匹配comments.xml，不含commentsExtended.xml等）
+        package = self.document.part.package
+        self._comments_part = next(
+            (part for part in package.parts if part.partname.endswith('/comments.xml')), None
+        )
+        
+        if self._comments_part is None:
+            # 创建新的comments部分（这需要更复杂的实现）
+            logger.debug("需要创建comments.xml部分（当前版本使用备用标记）")
+        else:
+            logger.debug("找到现有的comments部分")
     
     def _add_simple_comment_marker(self, run, comment_text: str):
         """添加简单的批注标记作为备用方案，包含完整批注内容"""
@@ -150,7 +157,7 @@ class WordCommentsHandler:
             run._element.addnext(comment_marker)
             
         except Exception as e:
-            print(f"添加简单批注标记失败: {e}")
+            logger.warning("添加简单批注标记失败: %s", e)
 
 
 def add_word_comment(paragraph, target_text: str, comment: str, author: str = "AI校对助手"):
@@ -196,7 +203,7 @@ def add_word_comment(paragraph, target_text: str, comment: str, author: str = "A
         return True
         
     except Exception as e:
-        print(f"添加Word批注失败: {e}")
+        logger.warning("添加Word批注失败: %s", e)
         return False
 
 
@@ -212,7 +219,7 @@ def _add_comment_summary(paragraph, target_text: str, comment: str, author: str)
             current = current.getparent()
         
         # 这里可以扩展以在文档末尾添加批注摘要
-        print(f"📋 批注摘要: 在文本 '{target_text}' 上添加了批注: {comment} (作者: {author})")
+        logger.debug("批注摘要: 在文本 '%s' 上添加了批注: %s (作者: %s)", target_text, comment, author)
         
     except Exception as e:
-        print(f"记录批注摘要失败: {e}") 
\ No newline at end of file
+        logger.warning("记录批注摘要失败: %s", e)
\ No newline at end of file
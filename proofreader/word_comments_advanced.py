@@ -4,12 +4,70 @@
 高级Word批注处理模块 - 实现真正的Word审阅批注功能
 """
 
+import bisect
+import copy
+import io
+import logging
 from docx import Document
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
 from docx.enum.text import WD_COLOR_INDEX
+from docx.oxml.ns import qn
+from docx.text.run import Run
 from datetime import datetime
-import xml.etree.ElementTree as ET
+
+try:
+    from .word_comments import (
+        new_comment_range_start, new_comment_range_end,
+        new_comment_reference, new_comment_reference_run
+    )
+    from .word_comments_xml import add_comments_to_docx
+except ImportError:
+    from word_comments import (
+        new_comment_range_start, new_comment_range_end,
+        new_comment_reference, new_comment_reference_run
+    )
+    from word_comments_xml import add_comments_to_docx
+
+
+logger = logging.getLogger(__name__)
+
+# 可安全拆分的run只包含这些子元素
+_PLAIN_RUN_TAGS = (qn('w:rPr'), qn('w:t'))
+
+
+class _ParaIndex:
+    """段落文本及run偏移表的缓存，避免对同一段落的每个批注都重新拼接段落文本"""
+    
+    __slots__ = ('paragraph', 'text', 'runs', 'run_texts', 'run_starts', 'next_start')
+    
+    def __init__(self, paragraph):
+        self.paragraph = paragraph
+        self.text = paragraph.text
+        self.runs = paragraph.runs
+        self.run_texts = [run.text for run in self.runs]
+        self.run_starts = []
+        position = 0
+        for run_text in self.run_texts:
+            self.run_starts.append(position)
+            position += len(run_text)
+        self.next_start = {}  # 目标文本 -> 下一次查找的起始位置
+    
+    def split_run(self, i, offset):
+        """在第i个run的offset处拆分为两个run，格式相同，并同步更新偏移表"""
+        run = self.runs[i]
+        text = self.run_texts[i]
+        new_element = copy.deepcopy(run._element)
+        run._element.addnext(new_element)
+        new_run = Run(new_element, run._parent)
+        run.text = text[:offset]
+        new_run.text = text[offset:]
+        self.runs.insert(i + 1, new_run)
+        self.run_texts[i:i + 1] = [text[:offset], text[offset:]]
+        self.run_starts.insert(i + 1, self.run_starts[i] + offset)
+
+
+def _is_plain_text_run(run):
+    """run是否只包含格式和文本，只有这样的run可以安全拆分"""
+    return all(child.tag in _PLAIN_RUN_TAGS for child in run._element)
 
 
 class WordCommentsManager:
@@ -19,18 +77,35 @@ class WordCommentsManager:
         self.document = document
         self.comment_counter = 0
         self.comments = []  # 存储批注信息
+        # 批注时间取本次处理的开始时间，避免每个批注都重新格式化
+        self._date_str = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+        self._paragraph_indexes = {}  # 段落元素 -> _ParaIndex，同一段落的多个批注共用
         
+    def index_paragraph(self, paragraph):
+        """获取段落的文本缓存，不存在时创建；批注只插入标记和高亮，不会改变段落文本"""
+        index = self._paragraph_indexes.get(paragraph._element)
+        if index is None:
+            index = _ParaIndex(paragraph)
+            self._paragraph_indexes[paragraph._element] = index
+        return index
+    
     def add_comment(self, paragraph, target_text: str, comment_text: str, author: str = "AI校对助手"):
-        """在段落中添加Word审阅批注"""
+        """在段落中添加Word审阅批注，paragraph也可以是index_paragraph返回的段落缓存"""
         try:
-            original_text = paragraph.text
-            start_pos = original_text.find(target_text)
+            index = paragraph if isinstance(paragraph, _ParaIndex) else self.index_paragraph(paragraph)
+            original_text = index.text
+            
+            # 同一目标文本多次批注时，从上一次匹配之后继续查找
+            start_pos = original_text.find(target_text, index.next_start.get(target_text, 0))
+            if start_pos == -1:
+                start_pos = original_text.find(target_text)
             
             if start_pos == -1:
-                print(f"未找到目标文本: {target_text}")
+                logger.warning("未找到目标文本: %s", target_text)
                 return False
             
             end_pos = start_pos + len(target_text)
+            index.next_start[target_text] = end_pos
             
             # 生成批注ID
             self.comment_counter += 1
@@ -41,36 +116,32 @@ class WordCommentsManager:
                 'id': comment_id,
                 'text': comment_text,
                 'author': author,
-                'date': datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+                'date': self._date_str
             })
             
             # 重建段落，正确插入批注标记
-            self._rebuild_paragraph_with_comment(paragraph, original_text, start_pos, end_pos, comment_id)
+            self._rebuild_paragraph_with_comment(index.paragraph, original_text, start_pos, end_pos, comment_id, index)
             
-            print(f"✅ Word审阅批注已添加: {comment_text[:50]}...")
+            logger.debug("Word审阅批注已添加: %s...", comment_text[:50])
             return True
             
         except Exception as e:
-            print(f"添加Word审阅批注失败: {e}")
+            logger.warning("添加Word审阅批注失败: %s", e)
             return False
     
-    def _rebuild_paragraph_with_comment(self, paragraph, original_text, start_pos, end_pos, comment_id):
+    def _rebuild_paragraph_with_comment(self, paragraph, original_text, start_pos, end_pos, comment_id, index=None):
         """重建段落，正确插入批注标记"""
         try:
             # 不清空段落，而是在现有内容基础上添加批注标记
             # 直接在段落的XML元素中添加批注标记
+            if index is None:
+                index = _ParaIndex(paragraph)
             
             # 1. 添加批注范围开始标记
             self._add_comment_range_start_to_element(paragraph._element, comment_id)
             
-            # 2. 查找包含目标文本的run并高亮
-            for run in paragraph.runs:
-                if start_pos <= len(run.text) and run.text:
-                    # 找到包含目标文本的run
-                    run_text = run.text
-                    if original_text[start_pos:end_pos] in run_text:
-                        run.font.highlight_color = WD_COLOR_INDEX.YELLOW
-                        break
+            # 2. 高亮目标文本覆盖的run
+            self._highlight_range(index, start_pos, end_pos)
             
             # 3. 添加批注范围结束标记
             self._add_comment_range_end_to_element(paragraph._element, comment_id)
@@ -79,29 +150,52 @@ class WordCommentsManager:
             self._add_comment_reference_to_element(paragraph._element, comment_id)
                 
         except Exception as e:
-            print(f"重建段落失败: {e}")
+            logger.warning("重建段落失败: %s", e)
             # 如果失败，使用简单的标记方法
             self._add_simple_comment_markers(paragraph, comment_id)
     
+    def _highlight_range(self, index, start_pos, end_pos):
+        """按run偏移表高亮[start_pos, end_pos)覆盖的run，目标只占run的一部分时先拆分该run"""
+        if index.run_starts and index.run_starts[-1] + len(index.run_texts[-1]) != len(index.text):
+            # 段落文本包含不在paragraph.runs中的内容（如超链接），偏移对不上时只高亮包含目标文本的run
+            target = index.text[start_pos:end_pos]
+            for run, run_text in zip(index.runs, index.run_texts):
+                if target in run_text:
+                    run.font.highlight_color = WD_COLOR_INDEX.YELLOW
+                    break
+            return
+        
+        i = bisect.bisect_right(index.run_starts, start_pos) - 1
+        while 0 <= i < len(index.runs) and index.run_starts[i] < end_pos:
+            run_start = index.run_starts[i]
+            run_end = run_start + len(index.run_texts[i])
+            if run_end > start_pos and _is_plain_text_run(index.runs[i]):
+                if run_start < start_pos:
+                    # 目标从run中间开始，拆出后半部分继续处理
+                    index.split_run(i, start_pos - run_start)
+                    i += 1
+                    continue
+                if run_end > end_pos:
+                    index.split_run(i, end_pos - run_start)
+            if run_end > start_pos and index.run_texts[i]:
+                index.runs[i].font.highlight_color = WD_COLOR_INDEX.YELLOW
+            i += 1
+    
     def _add_comment_range_start(self, paragraph, comment_id):
         """添加批注范围开始标记"""
         try:
-            element = OxmlElement('w:commentRangeStart')
-            element.set(qn('w:id'), str(comment_id))
-            paragraph._element.append(element)
-            print(f"✅ 添加批注范围开始标记: comment_id={comment_id}")
+            paragraph._element.append(new_comment_range_start(comment_id))
+            logger.debug("添加批注范围开始标记: comment_id=%s", comment_id)
         except Exception as e:
-            print(f"添加批注范围开始标记失败: {e}")
+            logger.warning("添加批注范围开始标记失败: %s", e)
     
     def _add_comment_range_end(self, paragraph, comment_id):
         """添加批注范围结束标记"""
         try:
-            element = OxmlElement('w:commentRangeEnd')
-            element.set(qn('w:id'), str(comment_id))
-            paragraph._element.append(element)
-            print(f"✅ 添加批注范围结束标记: comment_id={comment_id}")
+            paragraph._element.append(new_comment_range_end(comment_id))
+            logger.debug("添加批注范围结束标记: comment_id=%s", comment_id)
         except Exception as e:
-            print(f"添加批注范围结束标记失败: {e}")
+            logger.warning("添加批注范围结束标记失败: %s", e)
     
     def _add_comment_reference_run(self, paragraph, comment_id):
         """在独立的run中添加批注引用标记"""
@@ -110,48 +204,36 @@ class WordCommentsManager:
             new_run = paragraph.add_run()
             
             # 在run的XML元素中添加批注引用
-            run_element = new_run._element
-            comment_ref = OxmlElement('w:commentReference')
-            comment_ref.set(qn('w:id'), str(comment_id))
-            
-            run_element.append(comment_ref)
+            new_run._element.append(new_comment_reference(comment_id))
             
-            print(f"✅ 添加批注引用标记: comment_id={comment_id}")
+            logger.debug("添加批注引用标记: comment_id=%s", comment_id)
         except Exception as e:
-            print(f"添加批注引用标记失败: {e}")
+            logger.warning("添加批注引用标记失败: %s", e)
     
     def _add_comment_range_start_to_element(self, paragraph_element, comment_id):
         """直接在段落元素中添加批注范围开始标记"""
         try:
-            element = OxmlElement('w:commentRangeStart')
-            element.set(qn('w:id'), str(comment_id))
-            paragraph_element.insert(0, element)  # 插入到段落开始
-            print(f"✅ 添加批注范围开始标记到元素: comment_id={comment_id}")
+            paragraph_element.insert(0, new_comment_range_start(comment_id))  # 插入到段落开始
+            logger.debug("添加批注范围开始标记到元素: comment_id=%s", comment_id)
         except Exception as e:
-            print(f"添加批注范围开始标记到元素失败: {e}")
+            logger.warning("添加批注范围开始标记到元素失败: %s", e)
     
     def _add_comment_range_end_to_element(self, paragraph_element, comment_id):
         """直接在段落元素中添加批注范围结束标记"""
         try:
-            element = OxmlElement('w:commentRangeEnd')
-            element.set(qn('w:id'), str(comment_id))
-            paragraph_element.append(element)  # 添加到段落末尾
-            print(f"✅ 添加批注范围结束标记到元素: comment_id={comment_id}")
+            paragraph_element.append(new_comment_range_end(comment_id))  # 添加到段落末尾
+            logger.debug("添加批注范围结束标记到元素: comment_id=%s", comment_id)
         except Exception as e:
-            print(f"添加批注范围结束标记到元素失败: {e}")
+            logger.warning("添加批注范围结束标记到元素失败: %s", e)
     
     def _add_comment_reference_to_element(self, paragraph_element, comment_id):
         """直接在段落元素中添加批注引用标记"""
         try:
-            # 创建一个新的run元素
-            run_element = OxmlElement('w:r')
-            comment_ref = OxmlElement('w:commentReference')
-            comment_ref.set(qn('w:id'), str(comment_id))
-            run_element.append(comment_ref)
-            paragraph_element.append(run_element)
-            print(f"✅ 添加批注引用标记到元素: comment_id={comment_id}")
+            # 创建一个包含批注引用的run元素
+            paragraph_element.append(new_comment_reference_run(comment_id))
+            logger.debug("添加批注引用标记到元素: comment_id=%s", comment_id)
         except Exception as e:
-            print(f"添加批注引用标记到元素失败: {e}")
+            logger.warning("添加批注引用标记到元素失败: %s", e)
     
     def _add_simple_comment_markers(self, paragraph, comment_id):
         """简单的批注标记方法（备用）"""
@@ -161,16 +243,8 @@ class WordCommentsManager:
             self._add_comment_range_end(paragraph, comment_id)
             self._add_comment_reference_run(paragraph, comment_id)
         except Exception as e:
-            print(f"添加简单批注标记失败: {e}")
+            logger.warning("添加简单批注标记失败: %s", e)
 
-    def _add_comment_reference(self, paragraph, comment_id):
-        """添加批注引用标记（保留旧方法作为备用）"""
-        try:
-            # 使用新的方法
-            self._add_comment_reference_run(paragraph, comment_id)
-        except Exception as e:
-            print(f"添加批注引用标记失败: {e}")
-    
     def finalize_document(self):
         """完成文档处理，准备批注数据"""
         try:
@@ -185,6 +259,16 @@ class WordCommentsManager:
             print(f"完成文档处理失败: {e}")
             return False
     
+    def save(self, output_path: str) -> bool:
+        """保存文档并一次性写入所有已累积的批注
+
+        调用方应先通过add_comment累积全部批注再调用本方法，整个压缩包只重写一次
+        """
+        buffer = io.BytesIO()
+        self.document.save(buffer)
+        buffer.seek(0)
+        return add_comments_to_docx(buffer, output_path, self.get_comments_for_xml())
+    
     def get_comments_for_xml(self):
         """获取用于生成XML的批注数据"""
         xml_comments = []
@@ -5,83 +5,119 @@ Word文档批注XML处理模块
 用于创建Word格式的批注XML文件
 """
 
+import logging
 import os
-import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 from datetime import datetime
 import zipfile
-import tempfile
+
+try:
+    from .docx_package import COMMENTS_XML, CONTENT_TYPES, DOCUMENT_RELS, rewrite_docx
+except ImportError:
+    from docx_package import COMMENTS_XML, CONTENT_TYPES, DOCUMENT_RELS, rewrite_docx
+
+
+logger = logging.getLogger(__name__)
+
+
+# 批注部件的关系类型与内容类型
+COMMENTS_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/comments'
+COMMENTS_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.comments+xml'
+
+# 源文档缺少关系文件或内容类型文件时使用的空文件
+EMPTY_RELATIONSHIPS = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"></Relationships>'
+)
+EMPTY_CONTENT_TYPES = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"></Types>'
+)
+
+# comments.xml模板
+COMMENTS_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:comments xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+)
+COMMENT_TEMPLATE = (
+    '<w:comment w:id="{id}" w:author="{author}" w:date="{date}" w:initials="AI">'
+    '<w:p><w:r><w:t>{text}</w:t></w:r></w:p></w:comment>'
+)
+COMMENTS_TAIL = '</w:comments>'
+_ATTR_ENTITIES = {'"': '&quot;'}
+
+COMMENTS_OVERRIDE = (
+    f'<Override PartName="/word/comments.xml" ContentType="{COMMENTS_CONTENT_TYPE}"/>'
+).encode('utf-8')
+COMMENTS_RELATIONSHIP = (
+    f'<Relationship Id="rId999" Type="{COMMENTS_REL_TYPE}" Target="comments.xml"/>'
+).encode('utf-8')
 
 
 def add_comments_to_docx(input_docx_path: str, output_docx_path: str, comments_data: list) -> bool:
-    """向docx文件添加Word原生批注"""
+    """向docx文件添加Word原生批注
+
+    只在内存中生成comments.xml并修补关系文件和内容类型，其余部件从源压缩包流式复制；
+    input_docx_path也可以是已保存文档的二进制流
+    """
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 解压docx文件
-            with zipfile.ZipFile(input_docx_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # 创建批注XML文件
-            comments_xml_path = os.path.join(temp_dir, 'word', 'comments.xml')
-            create_comments_xml(comments_xml_path, comments_data)
-            
+        with zipfile.ZipFile(input_docx_path, 'r') as zip_ref:
+            existing = set(zip_ref.namelist())
+            rels_xml = zip_ref.read(DOCUMENT_RELS) if DOCUMENT_RELS in existing else EMPTY_RELATIONSHIPS
+            content_types_xml = zip_ref.read(CONTENT_TYPES) if CONTENT_TYPES in existing else EMPTY_CONTENT_TYPES
+        
+        updated_parts = {
+            # 创建批注XML
+            COMMENTS_XML: build_comments_xml(comments_data),
             # 更新文档关系文件
-            create_document_rels(temp_dir)
-            
+            DOCUMENT_RELS: patch_document_rels(rels_xml),
             # 更新内容类型文件
-            update_content_types(temp_dir)
-            
-            # 重新打包为docx
-            with zipfile.ZipFile(output_docx_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arc_name = os.path.relpath(file_path, temp_dir)
-                        zip_ref.write(file_path, arc_name)
-            
-            return True
+            CONTENT_TYPES: patch_content_types(content_types_xml),
+        }
+        
+        # 重新打包为docx
+        rewrite_docx(input_docx_path, output_docx_path, updated_parts)
+        return True
             
     except Exception as e:
-        print(f"添加批注失败: {e}")
+        logger.warning("添加批注失败: %s", e)
         return False
 
 
-def create_comments_xml(comments_xml_path: str, comments_data: list):
-    """创建comments.xml文件"""
-    # 确保目录存在
-    os.makedirs(os.path.dirname(comments_xml_path), exist_ok=True)
-    
-    # 创建XML命名空间
-    ns_w = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-    ET.register_namespace('w', ns_w)
-    
-    # 创建根元素
-    comments_root = ET.Element(f'{{{ns_w}}}comments')
+def build_comments_xml(comments_data: list) -> bytes:
+    """在内存中生成comments.xml的内容
+
+    结构固定，直接按模板拼接字符串，不构建元素树
+    """
+    default_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+    parts = [COMMENTS_HEAD]
     
     for i, comment_data in enumerate(comments_data, 1):
-        # 创建批注元素
-        comment_elem = ET.SubElement(comments_root, f'{{{ns_w}}}comment')
-        
         # 使用传入的ID，如果没有则使用索引
         comment_id = comment_data.get('id', i)
-        comment_elem.set(f'{{{ns_w}}}id', str(comment_id))
-        comment_elem.set(f'{{{ns_w}}}author', comment_data.get('author', 'AI校对助手'))
-        comment_elem.set(f'{{{ns_w}}}date', comment_data.get('date', datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")))
-        comment_elem.set(f'{{{ns_w}}}initials', 'AI')
-        
-        # 创建段落元素
-        p_elem = ET.SubElement(comment_elem, f'{{{ns_w}}}p')
+        comment_text = comment_data.get('text', '')
+        parts.append(COMMENT_TEMPLATE.format(
+            id=escape(str(comment_id), _ATTR_ENTITIES),
+            author=escape(comment_data.get('author', 'AI校对助手'), _ATTR_ENTITIES),
+            date=escape(comment_data.get('date', default_date), _ATTR_ENTITIES),
+            text=escape(comment_text),
+        ))
         
-        # 创建文本运行
-        r_elem = ET.SubElement(p_elem, f'{{{ns_w}}}r')
-        t_elem = ET.SubElement(r_elem, f'{{{ns_w}}}t')
-        t_elem.text = comment_data.get('text', '')
-        
-        print(f"✅ 创建批注XML: ID={comment_id}, 内容={comment_data.get('text', '')[:30]}...")
+        logger.debug("创建批注XML: ID=%s, 内容=%s...", comment_id, comment_text[:30])
+    
+    parts.append(COMMENTS_TAIL)
+    return ''.join(parts).encode('utf-8')
+
+
+def create_comments_xml(comments_xml_path: str, comments_data: list):
+    """创建comments.xml文件"""
+    # 确保目录存在
+    os.makedirs(os.path.dirname(comments_xml_path), exist_ok=True)
     
     # 写入XML文件
-    tree = ET.ElementTree(comments_root)
-    tree.write(comments_xml_path, encoding='utf-8', xml_declaration=True)
-    print(f"✅ 批注XML文件已创建: {comments_xml_path}")
+    with open(comments_xml_path, 'wb') as f:
+        f.write(build_comments_xml(comments_data))
+    logger.debug("批注XML文件已创建: %s", comments_xml_path)
 
 
 def create_document_rels(temp_dir: str):
@@ -90,56 +126,55 @@ def create_document_rels(temp_dir: str):
     os.makedirs(rels_dir, exist_ok=True)
     
     rels_path = os.path.join(rels_dir, 'document.xml.rels')
-    
-    # 检查是否已存在关系文件
-    if os.path.exists(rels_path):
-        tree = ET.parse(rels_path)
-        root = tree.getroot()
-    else:
-        # 创建新的关系文件
-        ns_rels = 'http://schemas.openxmlformats.org/package/2006/relationships'
-        ET.register_namespace('', ns_rels)
-        root = ET.Element(f'{{{ns_rels}}}Relationships')
-        tree = ET.ElementTree(root)
-    
-    # 检查是否已有批注关系
-    ns = {'': 'http://schemas.openxmlformats.org/package/2006/relationships'}
-    comment_rels = root.findall(".//Relationship[@Type='http://schemas.openxmlformats.org/officeDocument/2006/relationships/comments']", ns)
-    
-    if not comment_rels:
-        # 添加批注关系
-        rel_elem = ET.SubElement(root, 'Relationship')
-        rel_elem.set('Id', 'rId999')  # 使用一个不太可能冲突的ID
-        rel_elem.set('Type', 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/comments')
-        rel_elem.set('Target', 'comments.xml')
-    
-    # 写入文件
-    tree.write(rels_path, encoding='utf-8', xml_declaration=True)
+    _patch_file(rels_path, EMPTY_RELATIONSHIPS, patch_document_rels)
 
 
 def update_content_types(temp_dir: str):
     """更新[Content_Types].xml文件以包含批注内容类型"""
     content_types_path = os.path.join(temp_dir, '[Content_Types].xml')
+    _patch_file(content_types_path, EMPTY_CONTENT_TYPES, patch_content_types)
+
+
+def _patch_file(path: str, empty_xml: bytes, patch):
+    """按字节修补XML文件，不解析整棵树；已包含批注项时不改写文件"""
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(patch(empty_xml))
+        return
     
-    if os.path.exists(content_types_path):
-        tree = ET.parse(content_types_path)
-        root = tree.getroot()
-    else:
-        # 创建新的内容类型文件
-        ns_ct = 'http://schemas.openxmlformats.org/package/2006/content-types'
-        ET.register_namespace('', ns_ct)
-        root = ET.Element(f'{{{ns_ct}}}Types')
-        tree = ET.ElementTree(root)
+    # 批注项已存在时（重复运行的常见情况）只读不写
+    with open(path, 'rb') as f:
+        data = f.read()
+    patched = patch(data)
+    if patched is data:
+        return
     
-    # 检查是否已有批注内容类型
-    ns = {'': 'http://schemas.openxmlformats.org/package/2006/content-types'}
-    comment_overrides = root.findall(".//Override[@PartName='/word/comments.xml']", ns)
+    # 只追加了一个元素，从结束标签处开始覆写即可
+    prefix_len = data.rfind(b'</')
+    with open(path, 'rb+') as f:
+        f.seek(prefix_len)
+        f.write(patched[prefix_len:])
+        f.truncate()
+
+
+def patch_document_rels(rels_xml: bytes) -> bytes:
+    """字节级修补document.xml.rels，追加批注关系（文件结构固定，无需解析整棵树）"""
+    if COMMENTS_REL_TYPE.encode('utf-8') in rels_xml:
+        return rels_xml
     
-    if not comment_overrides:
-        # 添加批注内容类型
-        override_elem = ET.SubElement(root, 'Override')
-        override_elem.set('PartName', '/word/comments.xml')
-        override_elem.set('ContentType', 'application/vnd.openxmlformats-officedocument.wordprocessingml.comments+xml')
+    head, found, tail = rels_xml.rpartition(b'</Relationships>')
+    if not found:
+        raise ValueError("document.xml.rels缺少</Relationships>结束标签")
+    return head + COMMENTS_RELATIONSHIP + found + tail
+
+
+def patch_content_types(content_types_xml: bytes) -> bytes:
+    """字节级修补[Content_Types].xml，追加批注内容类型（文件结构固定，无需解析整棵树）"""
+    if (b'PartName="/word/comments.xml"' in content_types_xml
+            or b"PartName='/word/comments.xml'" in content_types_xml):
+        return content_types_xml
     
-    # 写入文件
-    tree.write(content_types_path, encoding='utf-8', xml_declaration=True) 
\ No newline at end of file
+    head, found, tail = content_types_xml.rpartition(b'</Types>')
+    if not found:
+        raise ValueError("[Content_Types].xml缺少</Types>结束标签")
+    return head + COMMENTS_OVERRIDE + found + tail
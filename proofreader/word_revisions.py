@@ -4,11 +4,51 @@
 Word修订功能模块 - 实现跟踪更改功能
 """
 
+import copy
+import logging
 from docx import Document
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
+from docx.shared import RGBColor
 from datetime import datetime
-import xml.etree.ElementTree as ET
+
+try:
+    from .word_track_changes import enable_track_changes_in_document
+except ImportError:
+    from word_track_changes import enable_track_changes_in_document
+
+
+logger = logging.getLogger(__name__)
+
+# 简化修订中插入文本的颜色（蓝色）
+INSERTED_TEXT_COLOR = RGBColor(0, 0, 255)
+
+_W_ID = qn('w:id')
+_W_AUTHOR = qn('w:author')
+_W_DATE = qn('w:date')
+
+
+def _revision_prototype(tag, text_tag):
+    """构建修订元素原型 <tag><w:r><w:rPr/><text_tag/></w:r></tag>"""
+    element = OxmlElement(tag)
+    run = OxmlElement('w:r')
+    run.append(OxmlElement('w:rPr'))
+    run.append(OxmlElement(text_tag))
+    element.append(run)
+    return element
+
+
+# 修订元素的原型只构建一次，之后按需深拷贝
+_DEL_PROTO = _revision_prototype('w:del', 'w:delText')
+_INS_PROTO = _revision_prototype('w:ins', 'w:t')
+
+
+def _cached_text(paragraph_texts: dict, paragraph) -> str:
+    """返回段落的当前文本，同一段落只读取一次paragraph.text"""
+    text = paragraph_texts.get(paragraph._element)
+    if text is None:
+        text = paragraph_texts[paragraph._element] = paragraph.text
+    return text
 
 
 class WordRevisionsManager:
@@ -19,15 +59,18 @@ class WordRevisionsManager:
         self.revision_counter = 0
         self.author = "AI校对助手"
         self.date = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+        self._paragraph_texts = {}  # 段落元素 -> 当前段落文本，段落重建后同步更新
+        # 所有修订共用的作者和时间属性，每个修订只需再设置ID
+        self._base_attrs = {_W_AUTHOR: self.author, _W_DATE: self.date}
     
     def add_revision(self, paragraph, original_text: str, corrected_text: str, reason: str = ""):
         """在段落中添加修订标记"""
         try:
-            paragraph_text = paragraph.text
+            paragraph_text = _cached_text(self._paragraph_texts, paragraph)
             start_pos = paragraph_text.find(original_text)
             
             if start_pos == -1:
-                print(f"未找到需要修订的文本: {original_text}")
+                logger.warning("未找到需要修订的文本: %s", original_text)
                 return False
             
             end_pos = start_pos + len(original_text)
@@ -53,93 +96,42 @@ class WordRevisionsManager:
             if end_pos < len(paragraph_text):
                 paragraph.add_run(paragraph_text[end_pos:])
             
-            print(f"✅ Word修订已添加: {original_text} -> {corrected_text}")
+            # 删除和插入标记不计入段落文本
+            self._paragraph_texts[paragraph._element] = paragraph_text[:start_pos] + paragraph_text[end_pos:]
+            
+            logger.debug("Word修订已添加: %s -> %s", original_text, corrected_text)
             return True
             
         except Exception as e:
-            print(f"添加Word修订失败: {e}")
+            logger.warning("添加Word修订失败: %s", e)
             return False
     
     def _add_deleted_text(self, paragraph, text: str, revision_id: int):
         """添加删除的文本标记"""
         try:
-            # 创建删除标记元素
-            del_element = OxmlElement('w:del')
-            del_element.set(qn('w:id'), str(revision_id))
-            del_element.set(qn('w:author'), self.author)
-            del_element.set(qn('w:date'), self.date)
-            
-            # 创建删除文本的run
-            del_run = OxmlElement('w:r')
-            
-            # 设置删除文本的属性
-            del_run_props = OxmlElement('w:rPr')
-            del_run.append(del_run_props)
-            
-            # 添加文本
-            del_text = OxmlElement('w:delText')
-            del_text.text = text
-            del_run.append(del_text)
-            
-            del_element.append(del_run)
-            paragraph._element.append(del_element)
-            
+            paragraph._element.append(self._create_revision_element(_DEL_PROTO, text, revision_id))
         except Exception as e:
-            print(f"添加删除文本标记失败: {e}")
+            logger.warning("添加删除文本标记失败: %s", e)
     
     def _add_inserted_text(self, paragraph, text: str, revision_id: int):
         """添加插入的文本标记"""
         try:
-            # 创建插入标记元素
-            ins_element = OxmlElement('w:ins')
-            ins_element.set(qn('w:id'), str(revision_id + 1000))  # 使用不同的ID
-            ins_element.set(qn('w:author'), self.author)
-            ins_element.set(qn('w:date'), self.date)
-            
-            # 创建插入文本的run
-            ins_run = OxmlElement('w:r')
-            
-            # 设置插入文本的属性
-            ins_run_props = OxmlElement('w:rPr')
-            ins_run.append(ins_run_props)
-            
-            # 添加文本
-            ins_text = OxmlElement('w:t')
-            ins_text.text = text
-            ins_run.append(ins_text)
-            
-            ins_element.append(ins_run)
-            paragraph._element.append(ins_element)
-            
+            # 插入标记使用不同的ID
+            paragraph._element.append(self._create_revision_element(_INS_PROTO, text, revision_id + 1000))
         except Exception as e:
-            print(f"添加插入文本标记失败: {e}")
+            logger.warning("添加插入文本标记失败: %s", e)
     
-    def enable_track_changes(self):
-        """启用文档的跟踪更改功能"""
-        try:
-            # 在文档设置中启用跟踪更改
-            settings_element = self._get_or_create_settings()
-            
-            # 添加跟踪更改设置
-            track_revisions = OxmlElement('w:trackRevisions')
-            settings_element.append(track_revisions)
-            
-            print("✅ 已启用文档跟踪更改功能")
-            return True
-            
-        except Exception as e:
-            print(f"启用跟踪更改失败: {e}")
-            return False
+    def _create_revision_element(self, prototype, text, revision_id):
+        """复制修订元素原型，只设置ID，作者和时间取自预先构建的公共属性"""
+        element = copy.deepcopy(prototype)
+        element.set(_W_ID, str(revision_id))
+        element.attrib.update(self._base_attrs)
+        element[0][-1].text = text
+        return element
     
-    def _get_or_create_settings(self):
-        """获取或创建文档设置元素"""
-        try:
-            # 这是一个简化版本，实际实现需要更复杂的XML操作
-            # 由于python-docx的限制，我们主要依赖XML标记
-            return OxmlElement('w:settings')
-        except Exception as e:
-            print(f"获取文档设置失败: {e}")
-            return None
+    def enable_track_changes(self):
+        """启用文档的跟踪更改功能（直接修改内存中文档的settings部件，保存后生效）"""
+        return enable_track_changes_in_document(self.document)
 
 
 class SimpleWordRevisionsManager:
@@ -149,15 +141,16 @@ class SimpleWordRevisionsManager:
         self.document = document
         self.revision_counter = 0
         self.author = "AI校对助手"
+        self._paragraph_texts = {}  # 段落元素 -> 当前段落文本，段落重建后同步更新
     
     def add_revision(self, paragraph, original_text: str, corrected_text: str, reason: str = ""):
         """添加简化的修订标记"""
         try:
-            paragraph_text = paragraph.text
+            paragraph_text = _cached_text(self._paragraph_texts, paragraph)
             start_pos = paragraph_text.find(original_text)
             
             if start_pos == -1:
-                print(f"未找到需要修订的文本: {original_text}")
+                logger.warning("未找到需要修订的文本: %s", original_text)
                 return False
             
             end_pos = start_pos + len(original_text)
@@ -178,41 +171,26 @@ class SimpleWordRevisionsManager:
             inserted_run = paragraph.add_run(corrected_text)
             inserted_run.font.underline = True
             # 设置为蓝色
-            from docx.shared import RGBColor
-            inserted_run.font.color.rgb = RGBColor(0, 0, 255)
+            inserted_run.font.color.rgb = INSERTED_TEXT_COLOR
             
             # 添加原文本之后的内容
             if end_pos < len(paragraph_text):
                 paragraph.add_run(paragraph_text[end_pos:])
             
+            # 删除线文本和插入文本都是普通run，计入段落文本
+            self._paragraph_texts[paragraph._element] = (
+                paragraph_text[:end_pos] + corrected_text + paragraph_text[end_pos:]
+            )
+            
             self.revision_counter += 1
-            print(f"✅ 修订标记已添加: {original_text} -> {corrected_text}")
+            logger.debug("修订标记已添加: %s -> %s", original_text, corrected_text)
             return True
             
         except Exception as e:
-            print(f"添加修订标记失败: {e}")
+            logger.warning("添加修订标记失败: %s", e)
             return False
 
 
-def create_revisions_xml(revisions_data):
-    """创建修订XML内容（用于完整的Word修订功能）"""
-    # XML命名空间
-    ns_w = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-    
-    # 注册命名空间
-    ET.register_namespace('w', ns_w)
-    
-    # 创建修订信息（这是一个概念性实现）
-    revisions_info = {
-        'total_revisions': len(revisions_data),
-        'author': 'AI校对助手',
-        'date': datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
-        'revisions': revisions_data
-    }
-    
-    return revisions_info
-
-
 # 测试函数
 def test_word_revisions():
     """测试Word修订功能"""
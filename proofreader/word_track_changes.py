@@ -5,14 +5,89 @@
 实现Microsoft Word审阅中的修订功能
 """
 
+import copy
+import logging
 from docx import Document
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
+from docx.text.run import Run
 from datetime import datetime
 import zipfile
-import tempfile
 import os
-import xml.etree.ElementTree as ET
+from lxml import etree
+try:
+    from .docx_package import rewrite_docx, SETTINGS_XML, DOCUMENT_XML
+    from .text_matcher import find_matches
+except ImportError:
+    from docx_package import rewrite_docx, SETTINGS_XML, DOCUMENT_XML
+    from text_matcher import find_matches
+
+
+logger = logging.getLogger(__name__)
+
+# WordprocessingML命名空间（Clark记法前缀）
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_W_ID = qn('w:id')
+_W_AUTHOR = qn('w:author')
+_W_DATE = qn('w:date')
+
+
+def _revision_prototype(tag, text_tag):
+    """构建修订元素原型 <tag><w:r><text_tag/></w:r></tag>"""
+    element = OxmlElement(tag)
+    run = OxmlElement('w:r')
+    run.append(OxmlElement(text_tag))
+    element.append(run)
+    return element
+
+
+# 修订元素的原型只构建一次，之后按需深拷贝
+_DEL_PROTO = _revision_prototype('w:del', 'w:delText')
+_INS_PROTO = _revision_prototype('w:ins', 'w:t')
+_DEL_WRAPPER_PROTO = OxmlElement('w:del')
+
+# 追加到settings.xml中的跟踪更改设置
+TRACK_REVISIONS_ELEMENT = b'<w:trackRevisions w:val="1"/>'
+# 已启用跟踪更改的常见写法
+TRACK_REVISIONS_ENABLED = (TRACK_REVISIONS_ELEMENT, b'<w:trackRevisions/>', b'<w:trackRevisions w:val="true"/>')
+# 源文档缺少settings.xml时使用的内容
+NEW_SETTINGS_XML = (
+    b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+    b'<w:settings xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    + TRACK_REVISIONS_ELEMENT +
+    b'</w:settings>'
+)
+# trackRevisions是settings的直接子元素，按标签直接查找即可
+_W_TRACK_REVISIONS = qn('w:trackRevisions')
+_W_VAL = qn('w:val')
+
+_W_R = qn('w:r')
+_W_T = qn('w:t')
+_W_RPR = qn('w:rPr')
+_W_DELTEXT = qn('w:delText')
+
+# 可安全拆分的run只包含这些子元素
+_PLAIN_RUN_TAGS = (_W_RPR, _W_T)
+
+
+def _is_plain_text_run(run_element):
+    """run是否只包含格式和文本，只有这样的run可以安全拆分"""
+    return all(child.tag in _PLAIN_RUN_TAGS for child in run_element)
+
+
+class _ParagraphChanges:
+    """单个段落累积的跟踪更改"""
+    
+    __slots__ = ('paragraph', 'original_text', 'snapshot', 'changes', 'pending')
+    
+    def __init__(self, paragraph):
+        self.paragraph = paragraph
+        self.original_text = paragraph.text
+        # 首次应用更改前段落内容的副本，再次应用时从这里恢复，与original_text保持一致；
+        # 在应用时才记录，添加更改后对段落的其他修改（如批注标记）不会因添加顺序而丢失
+        self.snapshot = None
+        self.changes = []
+        self.pending = True
 
 
 class WordTrackChangesManager:
@@ -24,7 +99,7 @@ class WordTrackChangesManager:
         self.author = "AI校对助手"
         self.date = datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
         self.revisions_data = []
-        self.paragraph_changes = {}  # 跟踪每个段落的修改
+        self.paragraph_changes = {}  # 段落元素 -> _ParagraphChanges
     
     def add_tracked_change(self, paragraph, original_text: str, corrected_text: str, reason: str = ""):
         """添加跟踪更改（真正的Word修订）"""
@@ -34,8 +109,8 @@ class WordTrackChangesManager:
             del_revision_id = self.revision_counter
             ins_revision_id = self.revision_counter + 1000
             
-            # 存储修订数据
-            self.revisions_data.append({
+            # 存储修订数据；同一字典也放入段落的更改列表，不再为每个更改单独创建字典
+            revision = {
                 'paragraph': paragraph,
                 'original_text': original_text,
                 'corrected_text': corrected_text,
@@ -44,302 +119,377 @@ class WordTrackChangesManager:
                 'author': self.author,
                 'date': self.date,
                 'reason': reason
-            })
+            }
+            self.revisions_data.append(revision)
             
             # 跟踪段落修改，批量处理
-            para_id = id(paragraph)
-            if para_id not in self.paragraph_changes:
-                self.paragraph_changes[para_id] = {
-                    'paragraph': paragraph,
-                    'original_text': paragraph.text,
-                    'changes': []
-                }
+            # 按段落元素归组，同一段落的文本只读取一次
+            para_changes = self.paragraph_changes.get(paragraph._element)
+            if para_changes is None:
+                para_changes = _ParagraphChanges(paragraph)
+                self.paragraph_changes[paragraph._element] = para_changes
             
-            self.paragraph_changes[para_id]['changes'].append({
-                'original_text': original_text,
-                'corrected_text': corrected_text,
-                'del_id': del_revision_id,
-                'ins_id': ins_revision_id,
-                'reason': reason
-            })
-            
-            print(f"✅ 已添加跟踪更改: {original_text} -> {corrected_text}")
+            para_changes.changes.append(revision)
+            para_changes.pending = True
             return True
             
         except Exception as e:
-            print(f"添加跟踪更改失败: {e}")
+            logger.warning("添加跟踪更改失败: %s", e)
             return False
     
     def apply_all_changes(self):
-        """应用所有跟踪更改到文档"""
-        for para_id, para_data in self.paragraph_changes.items():
-            paragraph = para_data['paragraph']
-            original_full_text = para_data['original_text']
-            changes = para_data['changes']
+        """应用所有跟踪更改到文档，返回本次应用的段落数和更改数
+
+        每个段落只在有新增更改时重建一次，重复调用不会重新处理已应用的段落
+        """
+        paragraph_count = 0
+        change_count = 0
+        for para_changes in self.paragraph_changes.values():
+            if not para_changes.pending:
+                continue
+            
+            # 首次应用时段落尚未修改，无需恢复，只记录当前内容供之后重新应用
+            snapshot = para_changes.snapshot
+            if snapshot is None:
+                paragraph_element = para_changes.paragraph._element
+                para_changes.original_text = para_changes.paragraph.text
+                para_changes.snapshot = [copy.deepcopy(child) for child in paragraph_element]
             
-            # 应用所有更改到段落
-            self._apply_changes_to_paragraph(paragraph, original_full_text, changes)
+            # 应用该段落累积的全部更改
+            self._apply_changes_to_paragraph(
+                para_changes.paragraph, para_changes.original_text, para_changes.changes, snapshot
+            )
+            para_changes.pending = False
+            paragraph_count += 1
+            change_count += len(para_changes.changes)
+        
+        logger.info("已应用跟踪更改: %d 个段落，%d 个更改", paragraph_count, change_count)
+        return {'paragraphs': paragraph_count, 'changes': change_count}
     
-    def _apply_changes_to_paragraph(self, paragraph, original_text, changes):
-        """将多个更改应用到单个段落（改进版本）"""
+    def _apply_changes_to_paragraph(self, paragraph, original_text, changes, snapshot=None):
+        """将多个更改应用到单个段落（改进版本）
+
+        snapshot为段落首次应用更改前子元素的副本，传入时先恢复为该内容，
+        首次应用之后对段落的其他修改不会保留
+        """
         try:
-            # 收集所有需要更改的位置
-            changes_with_pos = []
-            processed_positions = set()  # 避免重复处理相同位置
-            
-            for change in changes:
-                original_part = change['original_text']
-                # 找到所有出现的位置
-                start = 0
-                while True:
-                    pos = original_text.find(original_part, start)
-                    if pos == -1:
-                        break
-                    
-                    # 避免重复处理相同位置的相同文本
-                    position_key = (pos, original_part)
-                    if position_key not in processed_positions:
-                        changes_with_pos.append((pos, change))
-                        processed_positions.add(position_key)
-                    
-                    start = pos + 1  # 继续查找下一个出现
+            if len(changes) == 1:
+                selected = self._select_single_change(original_text, changes[0])
+            else:
+                selected = self._select_changes(original_text, changes)
             
-            # 按位置降序排序（从后往前处理，避免位置变化）
-            changes_with_pos.sort(key=lambda x: x[0], reverse=True)
+            if snapshot is not None:
+                paragraph._element[:] = [copy.deepcopy(child) for child in snapshot]
             
-            # 清空段落
-            paragraph.clear()
+            # 没有可应用的更改时保留段落原有内容
+            if not selected:
+                return
             
-            # 如果没有更改，直接添加原文
-            if not changes_with_pos:
-                paragraph.add_run(original_text)
+            # 优先在原有run中就地插入修订，保留文本格式
+            if self._splice_changes_into_runs(paragraph, original_text, selected):
                 return
             
-            # 构建新的段落内容
-            current_text = original_text
+            # 段落包含无法按run偏移定位的内容（如超链接、制表符处拆分），按纯文本重建段落
+            paragraph.clear()
             
-            # 从后往前处理每个更改
-            for pos, change in changes_with_pos:
-                original_part = change['original_text']
-                corrected_part = change['corrected_text']
-                del_id = change['del_id']
-                ins_id = change['ins_id']
-                
-                # 验证位置是否仍然有效
-                if pos + len(original_part) <= len(current_text) and current_text[pos:pos+len(original_part)] == original_part:
-                    # 分割文本
-                    before_part = current_text[:pos]
-                    after_part = current_text[pos + len(original_part):]
-                    
-                    # 重新组合文本，添加标记
-                    marker = f"@@DEL:{del_id}:{original_part}@@@@INS:{ins_id}:{corrected_part}@@"
-                    current_text = before_part + marker + after_part
+            # 从前往后一次构建段落：未修改的文本作为普通run，更改处依次添加删除和插入元素
+            paragraph_element = paragraph._element
+            prev = 0
+            for pos, change in selected:
+                if pos > prev:
+                    paragraph.add_run(original_text[prev:pos])
+                paragraph_element.append(self._create_deletion_element(change['original_text'], change['del_id']))
+                paragraph_element.append(self._create_insertion_element(change['corrected_text'], change['ins_id']))
+                prev = pos + len(change['original_text'])
             
-            # 解析并构建段落
-            self._build_paragraph_from_marked_text(paragraph, current_text)
+            if prev < len(original_text):
+                paragraph.add_run(original_text[prev:])
                     
         except Exception as e:
-            print(f"应用段落更改失败: {e}")
+            logger.warning("应用段落更改失败: %s", e)
             # 如果失败，至少保留原始文本
             paragraph.clear()
             paragraph.add_run(original_text)
     
-    def _build_paragraph_from_marked_text(self, paragraph, marked_text):
-        """从标记文本构建段落"""
-        try:
-            # 解析标记文本
-            pos = 0
-            while pos < len(marked_text):
-                # 查找下一个删除标记
-                del_start = marked_text.find("@@DEL:", pos)
-                if del_start == -1:
-                    # 没有更多删除标记，添加剩余文本
-                    remaining = marked_text[pos:]
-                    if remaining:
-                        paragraph.add_run(remaining)
-                    break
-                
-                # 添加删除标记之前的文本
-                if del_start > pos:
-                    before_text = marked_text[pos:del_start]
-                    paragraph.add_run(before_text)
-                
-                # 解析删除标记
-                del_end = marked_text.find("@@", del_start + 6)
-                if del_end == -1:
-                    break
-                
-                del_content = marked_text[del_start + 6:del_end]
-                parts = del_content.split(":", 1)
-                if len(parts) == 2:
-                    del_id = parts[0]
-                    del_text = parts[1]
-                    
-                    # 创建删除元素
-                    del_element = self._create_deletion_element(del_text, del_id)
-                    paragraph._element.append(del_element)
-                
-                # 查找对应的插入标记
-                ins_start = marked_text.find("@@INS:", del_end)
-                if ins_start == del_end + 2:  # 紧接着的插入标记
-                    ins_end = marked_text.find("@@", ins_start + 6)
-                    if ins_end != -1:
-                        ins_content = marked_text[ins_start + 6:ins_end]
-                        parts = ins_content.split(":", 1)
-                        if len(parts) == 2:
-                            ins_id = parts[0]
-                            ins_text = parts[1]
-                            
-                            # 创建插入元素
-                            ins_element = self._create_insertion_element(ins_text, ins_id)
-                            paragraph._element.append(ins_element)
-                        
-                        pos = ins_end + 2
-                    else:
-                        pos = del_end + 2
-                else:
-                    pos = del_end + 2
-                    
-        except Exception as e:
-            print(f"构建段落失败: {e}")
-            # 如果失败，清理并添加原始文本
-            paragraph.clear()
-            clean_text = marked_text.replace("@@DEL:", "").replace("@@INS:", "").replace("@@", "")
-            paragraph.add_run(clean_text)
-    
-    def _create_deletion_element(self, text, revision_id):
-        """创建删除元素 (w:del)"""
-        # 创建删除元素
-        del_element = OxmlElement('w:del')
-        del_element.set(qn('w:id'), str(revision_id))
-        del_element.set(qn('w:author'), self.author)
-        del_element.set(qn('w:date'), self.date)
+    def _select_changes(self, original_text, changes):
+        """返回按位置升序、互不重叠的 (位置, 更改) 列表"""
+        # 一次扫描收集所有需要更改的位置（包括同一文本的多次出现）；
+        # 多个更改的原文本相同时只使用第一个，避免重复处理相同位置
+        first_change = {}
+        for order, change in enumerate(changes):
+            first_change.setdefault(change['original_text'], (order, change))
         
-        # 创建删除的run
-        del_run = OxmlElement('w:r')
+        changes_with_pos = [
+            (pos, first_change[original_part])
+            for pos, original_part in find_matches(tuple(first_change), original_text)
+        ]
         
-        # 添加删除文本
-        del_text = OxmlElement('w:delText')
-        del_text.text = text
-        del_run.append(del_text)
+        # 从后往前选出互不重叠的更改：同一位置按更改添加顺序取第一个，
+        # 与后面已选更改重叠的更改跳过
+        changes_with_pos.sort(key=lambda x: (-x[0], x[1][0]))
+        selected = []
+        next_start = len(original_text)
+        for pos, (_, change) in changes_with_pos:
+            if pos + len(change['original_text']) <= next_start:
+                selected.append((pos, change))
+                next_start = pos
+        selected.reverse()
         
-        del_element.append(del_run)
-        return del_element
+        return selected
     
-    def _create_insertion_element(self, text, revision_id):
-        """创建插入元素 (w:ins)"""
-        # 创建插入元素
-        ins_element = OxmlElement('w:ins')
-        ins_element.set(qn('w:id'), str(revision_id))
-        ins_element.set(qn('w:author'), self.author)
-        ins_element.set(qn('w:date'), self.date)
+    def _select_single_change(self, original_text, change):
+        """只有一个更改时无需扫描和排序：从后往前用rfind依次找出互不重叠的出现位置，
+        结果与_select_changes相同
+        """
+        original_part = change['original_text']
+        selected = []
+        if not original_part:
+            return selected
+        pos = original_text.rfind(original_part)
+        while pos != -1:
+            selected.append((pos, change))
+            pos = original_text.rfind(original_part, 0, pos)
+        selected.reverse()
+        return selected
+    
+    def _splice_changes_into_runs(self, paragraph, original_text, selected):
+        """在段落原有的run中就地插入删除和插入标记，保留run格式
+
+        selected为按位置升序、互不重叠的 (位置, 更改)；
+        run文本与段落文本对不上或需要拆分非纯文本run时返回False，段落保持不变
+        """
+        paragraph_element = paragraph._element
+        runs = [Run(r, paragraph) for r in paragraph_element.iterchildren(_W_R)]
+        texts = [run.text for run in runs]
+        if ''.join(texts) != original_text:
+            return False
         
-        # 创建插入的run
-        ins_run = OxmlElement('w:r')
+        boundaries = sorted({b for pos, change in selected for b in (pos, pos + len(change['original_text']))})
         
-        # 添加插入文本
-        ins_text = OxmlElement('w:t')
-        ins_text.text = text
-        ins_run.append(ins_text)
+        # 先检查再修改：所有需要在中间拆分的run都必须是纯文本run
+        pieces = []
+        start = 0
+        for run, text in zip(runs, texts):
+            end = start + len(text)
+            cuts = [b - start for b in boundaries if start < b < end]
+            if cuts and not _is_plain_text_run(run._element):
+                return False
+            pieces.append((run, text, start, cuts))
+            start = end
         
-        ins_element.append(ins_run)
-        return ins_element
+        # 在修订边界处拆分run，拆出的run复制原run的格式
+        spans = []
+        for run, text, start, cuts in pieces:
+            if not cuts:
+                spans.append((run._element, start, len(text)))
+                continue
+            offsets = [0] + cuts + [len(text)]
+            run.text = text[:cuts[0]]
+            spans.append((run._element, start, cuts[0]))
+            previous = run._element
+            for a, b in zip(offsets[1:], offsets[2:]):
+                element = copy.deepcopy(run._element)
+                previous.addnext(element)
+                Run(element, paragraph).text = text[a:b]
+                spans.append((element, start + a, b - a))
+                previous = element
+        
+        # 将每个更改覆盖的run移入w:del，并在其后添加使用相同格式的w:ins
+        i = 0
+        for pos, change in selected:
+            end = pos + len(change['original_text'])
+            while spans[i][1] < pos:
+                i += 1
+            # 不含文本的run（如图片）不移入删除标记
+            covered = []
+            while i < len(spans) and spans[i][1] < end:
+                if spans[i][2]:
+                    covered.append(spans[i][0])
+                i += 1
+            
+            del_element = copy.deepcopy(_DEL_WRAPPER_PROTO)
+            self._set_revision_attributes(del_element, change['del_id'])
+            covered[0].addprevious(del_element)
+            for element in covered:
+                for text_element in element.iterchildren(_W_T):
+                    text_element.tag = _W_DELTEXT
+                del_element.append(element)
+            
+            ins_element = self._create_insertion_element(change['corrected_text'], change['ins_id'])
+            run_properties = covered[0].find(_W_RPR)
+            if run_properties is not None:
+                ins_element[0].insert(0, copy.deepcopy(run_properties))
+            del_element.addnext(ins_element)
+        
+        return True
+    
+    def _set_revision_attributes(self, element, revision_id):
+        """设置修订元素的ID、作者和时间"""
+        element.set(_W_ID, str(revision_id))
+        element.set(_W_AUTHOR, self.author)
+        element.set(_W_DATE, self.date)
+    
+    def _create_deletion_element(self, text, revision_id):
+        """创建删除元素 (w:del)"""
+        return self._create_revision_element(_DEL_PROTO, text, revision_id)
+    
+    def _create_insertion_element(self, text, revision_id):
+        """创建插入元素 (w:ins)"""
+        return self._create_revision_element(_INS_PROTO, text, revision_id)
+    
+    def _create_revision_element(self, prototype, text, revision_id):
+        """复制修订元素原型，设置ID、作者、时间和文本"""
+        element = copy.deepcopy(prototype)
+        self._set_revision_attributes(element, revision_id)
+        element[0][0].text = text
+        return element
 
 
 def enable_track_changes_in_docx(docx_path, output_path, revisions_data):
     """在Word文档中启用跟踪更改并添加修订"""
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 解压docx文件
-            with zipfile.ZipFile(docx_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # 修改settings.xml以启用跟踪更改
-            enable_track_changes_setting(temp_dir)
+        with zipfile.ZipFile(docx_path, 'r') as zip_ref:
+            existing = set(zip_ref.namelist())
+            settings_xml = zip_ref.read(SETTINGS_XML) if SETTINGS_XML in existing else None
             
-            # 验证document.xml中的修订标记
-            verify_document_revisions(temp_dir)
-            
-            # 重新打包为docx文件
-            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arc_name = os.path.relpath(file_path, temp_dir)
-                        zip_ref.write(file_path, arc_name)
-            
-            print(f"✅ 成功启用Word跟踪更改: {output_path}")
-            return True
+            # 统计document.xml中的修订标记，直接从压缩包流式读取
+            # 仅用于诊断：启用INFO日志时才统计，失败不影响输出
+            if DOCUMENT_XML in existing and logger.isEnabledFor(logging.INFO):
+                try:
+                    with zip_ref.open(DOCUMENT_XML) as document_xml:
+                        logger.info("document.xml修订标记: w:del=%d, w:ins=%d, w:delText=%d",
+                                    *_count_revisions(document_xml))
+                except Exception as e:
+                    logger.warning("验证修订标记失败: %s", e)
+        
+        # 修改settings.xml以启用跟踪更改；修改失败时仍输出文档，保留原有设置
+        updated_parts = {}
+        try:
+            updated_parts[SETTINGS_XML] = inject_track_revisions(settings_xml)
+            logger.info("已在settings.xml中启用跟踪更改")
+        except Exception as e:
+            logger.warning("启用跟踪更改设置失败: %s", e)
+        
+        # 其余部件直接从原文档复制
+        rewrite_docx(docx_path, output_path, updated_parts)
+        
+        logger.info("成功启用Word跟踪更改: %s", output_path)
+        return True
             
     except Exception as e:
-        print(f"❌ 启用跟踪更改失败: {e}")
+        logger.warning("启用跟踪更改失败: %s", e)
         return False
 
 
-def enable_track_changes_setting(temp_dir):
-    """在settings.xml中启用跟踪更改"""
+def enable_track_changes_in_document(document):
+    """直接在内存中的Document对象上启用跟踪更改，保存一次即可生效，无需再重写docx压缩包"""
     try:
-        settings_path = os.path.join(temp_dir, 'word', 'settings.xml')
-        
-        if os.path.exists(settings_path):
-            # 解析现有的settings.xml
-            tree = ET.parse(settings_path)
-            root = tree.getroot()
-        else:
-            # 创建新的settings.xml
-            ns_w = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-            root = ET.Element(f'{{{ns_w}}}settings')
-            tree = ET.ElementTree(root)
-        
-        # 定义命名空间
-        ns = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
-        
-        # 检查是否已存在trackRevisions设置
-        track_revisions = root.find('.//w:trackRevisions', ns)
+        settings_element = document.settings.element
+        track_revisions = settings_element.find(_W_TRACK_REVISIONS)
         
         if track_revisions is None:
             # 添加trackRevisions设置
-            track_revisions = ET.SubElement(root, f"{{{ns['w']}}}trackRevisions")
+            track_revisions = OxmlElement('w:trackRevisions')
+            settings_element.append(track_revisions)
         
         # 确保跟踪更改被启用
-        track_revisions.set(f"{{{ns['w']}}}val", "1")
+        track_revisions.set(_W_VAL, "1")
+        logger.info("已在文档设置中启用跟踪更改")
+        return True
+        
+    except Exception as e:
+        logger.warning("启用跟踪更改设置失败: %s", e)
+        return False
+
+
+def enable_track_changes_setting(temp_dir):
+    """在settings.xml中启用跟踪更改"""
+    try:
+        settings_path = os.path.join(temp_dir, 'word', 'settings.xml')
+        
+        settings_xml = None
+        if os.path.exists(settings_path):
+            with open(settings_path, 'rb') as f:
+                settings_xml = f.read()
         
         # 保存settings.xml
-        tree.write(settings_path, encoding='utf-8', xml_declaration=True)
+        with open(settings_path, 'wb') as f:
+            f.write(inject_track_revisions(settings_xml))
         print("✅ 已在settings.xml中启用跟踪更改")
         
     except Exception as e:
         print(f"❌ 启用跟踪更改设置失败: {e}")
 
 
+def inject_track_revisions(settings_xml):
+    """在settings.xml内容中启用trackRevisions，settings_xml为None时创建新的设置，返回新的内容"""
+    if settings_xml is None:
+        # 缺少settings.xml时直接使用固定内容
+        return NEW_SETTINGS_XML
+    
+    if b'trackRevisions' not in settings_xml:
+        # 常见情况只需追加一个元素，直接在结束标签前拼接字节，无需解析和重新序列化整个文件
+        head, found, tail = settings_xml.rpartition(b'</w:settings>')
+        if found:
+            return head + TRACK_REVISIONS_ELEMENT + found + tail
+    elif any(element in settings_xml for element in TRACK_REVISIONS_ENABLED):
+        # 已经启用跟踪更改（重复处理同一文档的常见情况），内容无需改变
+        return settings_xml
+    
+    # 解析现有的settings.xml
+    root = etree.fromstring(settings_xml)
+    
+    # 检查是否已存在trackRevisions设置（settings的直接子元素）
+    track_revisions = root.find(_W_TRACK_REVISIONS)
+    
+    if track_revisions is None:
+        # 添加trackRevisions设置
+        track_revisions = etree.SubElement(root, _W_TRACK_REVISIONS)
+    
+    # 确保跟踪更改被启用
+    track_revisions.set(_W_VAL, "1")
+    return etree.tostring(root, encoding='UTF-8', xml_declaration=True, standalone=True)
+
+
 def verify_document_revisions(temp_dir):
     """验证document.xml中的修订标记"""
     try:
         document_path = os.path.join(temp_dir, 'word', 'document.xml')
         
         if os.path.exists(document_path):
-            with open(document_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 统计修订标记
-            del_count = content.count('<w:del ')
-            ins_count = content.count('<w:ins ')
-            deltext_count = content.count('<w:delText>')
-            
-            print(f"📊 document.xml修订标记统计:")
-            print(f"   - w:del (删除标记): {del_count}")
-            print(f"   - w:ins (插入标记): {ins_count}")
-            print(f"   - w:delText (删除文本): {deltext_count}")
-            
-            if del_count > 0 or ins_count > 0:
-                print("✅ 发现Word修订标记")
-            else:
-                print("⚠️  未发现Word修订标记")
+            _report_revision_counts(_count_revisions(document_path))
         
     except Exception as e:
         print(f"❌ 验证修订标记失败: {e}")
 
 
+def _count_revisions(source):
+    """流式统计document.xml中的修订标记，一次遍历，处理过的元素立即释放
+
+    source可以是文件路径或文件对象，返回 (删除标记数, 插入标记数, 删除文本数)
+    """
+    counts = {f'{_W}{name}': 0 for name in ('del', 'ins', 'delText')}
+    for _, elem in etree.iterparse(source, events=('end',), tag=list(counts)):
+        counts[elem.tag] += 1
+        elem.clear(keep_tail=True)
+    return tuple(counts.values())
+
+
+def _report_revision_counts(counts):
+    """输出修订标记统计结果"""
+    del_count, ins_count, deltext_count = counts
+    
+    print(f"📊 document.xml修订标记统计:")
+    print(f"   - w:del (删除标记): {del_count}")
+    print(f"   - w:ins (插入标记): {ins_count}")
+    print(f"   - w:delText (删除文本): {deltext_count}")
+    
+    if del_count > 0 or ins_count > 0:
+        print("✅ 发现Word修订标记")
+    else:
+        print("⚠️  未发现Word修订标记")
+
+
 # 测试函数
 def test_word_track_changes():
     """测试Word跟踪更改功能"""
@@ -359,7 +509,8 @@ def test_word_track_changes():
         track_changes_manager.add_tracked_change(paragraphs[2], "程式设计", "程序设计", "术语统一")
         
         # 应用所有更改
-        track_changes_manager.apply_all_changes()
+        applied = track_changes_manager.apply_all_changes()
+        print(f"✅ 已应用跟踪更改: {applied['paragraphs']} 个段落，{applied['changes']} 个更改")
         
         # 保存临时文档
         temp_file = "test_word_track_changes_temp.docx"
@@ -9,16 +9,108 @@ from docx import Document
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from datetime import datetime
+import copy
+import functools
+import io
+import logging
 import zipfile
-import tempfile
 import os
-import xml.etree.ElementTree as ET
+from lxml import etree
 try:
-    from .word_track_changes import WordTrackChangesManager, enable_track_changes_in_docx
+    from .word_track_changes import WordTrackChangesManager, enable_track_changes_in_docx, inject_track_revisions
     from .word_comments_advanced import WordCommentsManager
+    from .word_comments import new_comment_range_start, new_comment_range_end, new_comment_reference_run
+    from .text_matcher import locate_first
+    from .docx_package import (
+        rewrite_docx,
+        DOCUMENT_XML, SETTINGS_XML, COMMENTS_XML, DOCUMENT_RELS, CONTENT_TYPES
+    )
+    from .word_comments_xml import (
+        build_comments_xml, patch_content_types, patch_document_rels,
+        create_comments_xml, create_document_rels, update_content_types,
+        EMPTY_CONTENT_TYPES, EMPTY_RELATIONSHIPS
+    )
 except ImportError:
-    from word_track_changes import WordTrackChangesManager, enable_track_changes_in_docx
+    from word_track_changes import WordTrackChangesManager, enable_track_changes_in_docx, inject_track_revisions
     from word_comments_advanced import WordCommentsManager
+    from word_comments import new_comment_range_start, new_comment_range_end, new_comment_reference_run
+    from text_matcher import locate_first
+    from docx_package import (
+        rewrite_docx,
+        DOCUMENT_XML, SETTINGS_XML, COMMENTS_XML, DOCUMENT_RELS, CONTENT_TYPES
+    )
+    from word_comments_xml import (
+        build_comments_xml, patch_content_types, patch_document_rels,
+        create_comments_xml, create_document_rels, update_content_types,
+        EMPTY_CONTENT_TYPES, EMPTY_RELATIONSHIPS
+    )
+
+
+logger = logging.getLogger(__name__)
+
+# 验证XML结构时统计的元素
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DOCUMENT_COUNTED_TAGS = (f'{_W}del', f'{_W}ins', f'{_W}commentReference')
+COMMENTS_COUNTED_TAGS = (f'{_W}comment',)
+
+_W_R = f'{_W}r'
+_W_T = f'{_W}t'
+_W_RPR = f'{_W}rPr'
+_XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+_W_P = f'{_W}p'
+
+# 解析document.xml的解析器：允许超大文本节点，不收集xml:id
+_DOCUMENT_PARSER = etree.XMLParser(huge_tree=True, collect_ids=False)
+# 预编译的段落文本XPath，取段落内全部w:t的文本
+_PARAGRAPH_TEXT_NODES = etree.XPath(
+    './/w:t/text()', namespaces={'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
+)
+
+
+def _is_splittable_run(run):
+    """run是否只包含格式和一个文本元素，只有这样的run可以安全拆分"""
+    tags = [child.tag for child in run]
+    return tags.count(_W_T) == 1 and all(tag in (_W_RPR, _W_T) for tag in tags)
+
+
+def _set_run_text(run, text):
+    """设置纯文本run的文本，保留首尾空格"""
+    text_element = run.find(_W_T)
+    text_element.text = text
+    text_element.set(_XML_SPACE, 'preserve')
+
+
+@functools.lru_cache(maxsize=4096)
+def determine_revision_type(original_text: str, corrected_text: str) -> str:
+    """判断修订类型，同一对原文和修正文本只计算一次"""
+    if len(original_text) == 1 and len(corrected_text) == 1:
+        return "错别字修正"
+    elif "科学" in original_text or "科学" in corrected_text:
+        return "术语修正"
+    elif len(original_text) > len(corrected_text):
+        return "文本简化"
+    elif len(original_text) < len(corrected_text):
+        return "文本扩展"
+    else:
+        return "文本优化"
+
+
+@functools.lru_cache(maxsize=8192)
+def extract_original_text_from_comment(comment_text: str) -> str:
+    """从批注文本中提取原始文本，无法提取时返回空字符串；同一批注文本只解析一次"""
+    # 查找 "修订: 'xxx' →" 模式
+    _, found, rest = comment_text.partition("修订: '")
+    if found:
+        original_text, found, _ = rest.partition("' →")
+        if found and original_text:
+            return original_text
+    
+    # 查找其他可能的模式
+    _, found, rest = comment_text.partition("原文：")
+    if found:
+        return rest.partition('\n')[0].strip()
+    
+    return ""
 
 
 class WordTrackChangesWithCommentsManager:
@@ -28,7 +120,15 @@ class WordTrackChangesWithCommentsManager:
         self.document = document
         self.track_changes_manager = WordTrackChangesManager(document)
         self.comments_manager = WordCommentsManager(document)
-        self.combined_changes = []
+        # 组合修改按字段分别存放在并列的列表中，不为每条修改创建字典；
+        # 只记录跟踪更改成功的修改，统计时直接取长度和对布尔列表求和
+        self._originals = []
+        self._corrected = []
+        self._reasons = []
+        self._comment_ok = []
+        self._paragraphs = []
+        # 批注中的时间取本次处理的开始时间，整行只格式化一次，所有批注共用
+        self._timestamp_line = f"⏰ 时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
     
     def add_tracked_change_with_comment(self, paragraph, original_text: str, corrected_text: str, reason: str = ""):
         """添加跟踪更改并同时添加批注说明原因"""
@@ -45,31 +145,45 @@ class WordTrackChangesWithCommentsManager:
             )
             
             if not track_success:
-                print(f"⚠️ 跟踪更改添加失败: {original_text}")
+                logger.warning("跟踪更改添加失败: %s", original_text)
                 return comment_success  # 即使跟踪更改失败，如果批注成功也算部分成功
             
             # 3. 记录组合修改
-            self.combined_changes.append({
-                'original_text': original_text,
-                'corrected_text': corrected_text,
-                'reason': reason,
-                'track_changes_success': track_success,
-                'comment_success': comment_success,
-                'paragraph': paragraph
-            })
+            self._originals.append(original_text)
+            self._corrected.append(corrected_text)
+            self._reasons.append(reason)
+            self._comment_ok.append(bool(comment_success))
+            self._paragraphs.append(paragraph)
             
-            print(f"✅ 已添加跟踪更改+批注: {original_text} -> {corrected_text}")
+            logger.debug("已添加跟踪更改+批注: %s -> %s", original_text, corrected_text)
             if comment_success:
-                print(f"   📝 批注内容: {comment_text}")
+                logger.debug("批注内容: %s", comment_text)
             else:
-                print(f"   ⚠️  批注添加失败，仅应用跟踪更改")
+                logger.warning("批注添加失败，仅应用跟踪更改: %s", original_text)
             
             return True
             
         except Exception as e:
-            print(f"添加跟踪更改+批注失败: {e}")
+            logger.warning("添加跟踪更改+批注失败: %s", e)
             return False
     
+    @property
+    def combined_changes(self):
+        """组合修改列表，按需由并列列表组装为字典"""
+        return [
+            {
+                'original_text': original_text,
+                'corrected_text': corrected_text,
+                'reason': reason,
+                'track_changes_success': True,
+                'comment_success': comment_success,
+                'paragraph': paragraph
+            }
+            for original_text, corrected_text, reason, comment_success, paragraph in zip(
+                self._originals, self._corrected, self._reasons, self._comment_ok, self._paragraphs
+            )
+        ]
+    
     def _generate_comment_text(self, original_text: str, corrected_text: str, reason: str):
         """生成批注文本"""
         comment_parts = []
@@ -86,35 +200,26 @@ class WordTrackChangesWithCommentsManager:
         comment_parts.append(f"🏷️ 类型: {revision_type}")
         
         # 时间戳
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
-        comment_parts.append(f"⏰ 时间: {timestamp}")
+        comment_parts.append(self._timestamp_line)
         
         return "\n".join(comment_parts)
     
     def _determine_revision_type(self, original_text: str, corrected_text: str):
         """判断修订类型"""
-        if len(original_text) == 1 and len(corrected_text) == 1:
-            return "错别字修正"
-        elif "科学" in original_text or "科学" in corrected_text:
-            return "术语修正"
-        elif len(original_text) > len(corrected_text):
-            return "文本简化"
-        elif len(original_text) < len(corrected_text):
-            return "文本扩展"
-        else:
-            return "文本优化"
+        return determine_revision_type(original_text, corrected_text)
     
     def apply_all_changes(self):
         """应用所有跟踪更改"""
         print("🔄 应用所有跟踪更改...")
-        self.track_changes_manager.apply_all_changes()
-        print("✅ 跟踪更改应用完成")
+        applied = self.track_changes_manager.apply_all_changes()
+        print(f"✅ 跟踪更改应用完成: {applied['paragraphs']} 个段落，{applied['changes']} 个更改")
+        return applied
     
     def get_statistics(self):
         """获取修订统计信息"""
-        total_changes = len(self.combined_changes)
-        track_changes_count = sum(1 for c in self.combined_changes if c['track_changes_success'])
-        comments_count = sum(1 for c in self.combined_changes if c['comment_success'])
+        total_changes = len(self._originals)
+        track_changes_count = total_changes
+        comments_count = sum(self._comment_ok)
         
         return {
             'total_changes': total_changes,
@@ -124,33 +229,45 @@ class WordTrackChangesWithCommentsManager:
         }
 
 
-def enable_track_changes_and_comments_in_docx(docx_path, output_path, track_changes_data, comments_data):
-    """在Word文档中启用跟踪更改和批注"""
+def enable_track_changes_and_comments_in_docx(docx_path, output_path, track_changes_data, comments_data, verify=False):
+    """在Word文档中启用跟踪更改和批注
+
+    只在内存中生成或修补settings.xml、comments.xml、关系文件和内容类型，
+    其余部件从源压缩包流式复制，不解压整个文档；verify为True时输出修订和批注标记统计
+    """
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 解压docx文件
-            with zipfile.ZipFile(docx_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-            
-            # 启用跟踪更改
-            enable_track_changes_setting(temp_dir)
-            
-            # 添加批注XML文件
-            add_comments_xml_files(temp_dir, comments_data)
-            
-            # 验证XML结构
-            verify_combined_xml_structure(temp_dir)
-            
-            # 重新打包
-            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arc_name = os.path.relpath(file_path, temp_dir)
-                        zip_ref.write(file_path, arc_name)
-            
-            print(f"✅ 成功创建带批注的Word跟踪更改文档: {output_path}")
-            return True
+        with zipfile.ZipFile(docx_path, 'r') as zip_ref:
+            existing = set(zip_ref.namelist())
+            settings_xml = zip_ref.read(SETTINGS_XML) if SETTINGS_XML in existing else None
+            rels_xml = zip_ref.read(DOCUMENT_RELS) if DOCUMENT_RELS in existing else EMPTY_RELATIONSHIPS
+            content_types_xml = zip_ref.read(CONTENT_TYPES) if CONTENT_TYPES in existing else EMPTY_CONTENT_TYPES
+            
+            # 从压缩包流式统计document.xml中的修订和批注引用，不读入整个文件
+            doc_counts = None
+            if verify and DOCUMENT_XML in existing:
+                with zip_ref.open(DOCUMENT_XML) as document_xml:
+                    doc_counts = _count_elements(document_xml, DOCUMENT_COUNTED_TAGS)
+        
+        # 启用跟踪更改
+        updated_parts = {SETTINGS_XML: inject_track_revisions(settings_xml)}
+        print("✅ 已启用跟踪更改设置")
+        
+        # 添加批注XML文件
+        updated_parts[COMMENTS_XML] = build_comments_xml(comments_data)
+        updated_parts[DOCUMENT_RELS] = patch_document_rels(rels_xml)
+        updated_parts[CONTENT_TYPES] = patch_content_types(content_types_xml)
+        print("✅ 已添加批注XML文件")
+        
+        # 验证XML结构（仅用于诊断，默认跳过）
+        if verify:
+            comment_count, = _count_elements(io.BytesIO(updated_parts[COMMENTS_XML]), COMMENTS_COUNTED_TAGS)
+            _report_combined_counts(doc_counts, comment_count)
+        
+        # 重新打包，未修改的部件直接从原文档复制
+        rewrite_docx(docx_path, output_path, updated_parts)
+        
+        print(f"✅ 成功创建带批注的Word跟踪更改文档: {output_path}")
+        return True
             
     except Exception as e:
         print(f"❌ 创建带批注的跟踪更改文档失败: {e}")
@@ -162,27 +279,17 @@ def enable_track_changes_setting(temp_dir):
     try:
         settings_path = os.path.join(temp_dir, 'word', 'settings.xml')
         
+        settings_xml = None
         if os.path.exists(settings_path):
-            tree = ET.parse(settings_path)
-            root = tree.getroot()
+            with open(settings_path, 'rb') as f:
+                settings_xml = f.read()
         else:
-            ns_w = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-            root = ET.Element(f'{{{ns_w}}}settings')
-            tree = ET.ElementTree(root)
+            # 只有settings.xml不存在时才可能缺少word目录
+            os.makedirs(os.path.dirname(settings_path), exist_ok=True)
         
-        ns = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
-        
-        # 启用跟踪更改
-        track_revisions = root.find('.//w:trackRevisions', ns)
-        if track_revisions is None:
-            track_revisions = ET.SubElement(root, f"{{{ns['w']}}}trackRevisions")
-        track_revisions.set(f"{{{ns['w']}}}val", "1")
-        
-        # 确保目录存在
-        word_dir = os.path.join(temp_dir, 'word')
-        os.makedirs(word_dir, exist_ok=True)
-        
-        tree.write(settings_path, encoding='utf-8', xml_declaration=True)
+        # 在内存中修补后一次写回
+        with open(settings_path, 'wb') as f:
+            f.write(inject_track_revisions(settings_xml))
         print("✅ 已启用跟踪更改设置")
         
     except Exception as e:
@@ -192,24 +299,8 @@ def enable_track_changes_setting(temp_dir):
 def add_comments_xml_files(temp_dir, comments_data):
     """添加批注相关的XML文件"""
     try:
-        try:
-            from .word_comments_xml import (
-                create_comments_xml, 
-                create_document_rels, 
-                update_content_types
-            )
-        except ImportError:
-            from .word_comments_xml import (
-                create_comments_xml, 
-                create_document_rels, 
-                update_content_types
-            )
-        
-        word_dir = os.path.join(temp_dir, 'word')
-        os.makedirs(word_dir, exist_ok=True)
-        
-        # 创建comments.xml
-        comments_xml_path = os.path.join(word_dir, 'comments.xml')
+        # 创建comments.xml（create_comments_xml会按需创建word目录）
+        comments_xml_path = os.path.join(temp_dir, 'word', 'comments.xml')
         create_comments_xml(comments_xml_path, comments_data)
         
         # 创建document.xml.rels
@@ -230,37 +321,55 @@ def verify_combined_xml_structure(temp_dir):
         document_path = os.path.join(temp_dir, 'word', 'document.xml')
         comments_path = os.path.join(temp_dir, 'word', 'comments.xml')
         
-        # 验证document.xml中的修订标记
+        doc_counts = None
         if os.path.exists(document_path):
-            with open(document_path, 'r', encoding='utf-8') as f:
-                doc_content = f.read()
-            
-            del_count = doc_content.count('<w:del ')
-            ins_count = doc_content.count('<w:ins ')
-            comment_ref_count = doc_content.count('<w:commentReference ')
-            
-            print(f"📊 document.xml统计:")
-            print(f"   - 删除标记: {del_count}")
-            print(f"   - 插入标记: {ins_count}")
-            print(f"   - 批注引用: {comment_ref_count}")
+            doc_counts = _count_elements(document_path, DOCUMENT_COUNTED_TAGS)
         
-        # 验证comments.xml
+        comment_count = None
         if os.path.exists(comments_path):
-            with open(comments_path, 'r', encoding='utf-8') as f:
-                comments_content = f.read()
-            
-            comment_count = comments_content.count('<w:comment ')
-            print(f"   - 批注数量: {comment_count}")
-            
-            if del_count > 0 and comment_count > 0:
-                print("✅ 发现跟踪更改和批注标记")
-            else:
-                print("⚠️  跟踪更改或批注标记缺失")
+            comment_count, = _count_elements(comments_path, COMMENTS_COUNTED_TAGS)
+        
+        _report_combined_counts(doc_counts, comment_count)
         
     except Exception as e:
         print(f"❌ 验证XML结构失败: {e}")
 
 
+def _count_elements(source, tags):
+    """流式统计XML中各标签的元素数量，一次遍历，处理过的元素立即释放
+
+    source可以是文件路径或文件对象，按tags的顺序返回数量元组
+    """
+    counts = dict.fromkeys(tags, 0)
+    for _, elem in etree.iterparse(source, events=('end',), tag=tags):
+        counts[elem.tag] += 1
+        elem.clear(keep_tail=True)
+    return tuple(counts.values())
+
+
+def _report_combined_counts(doc_counts, comment_count):
+    """输出document.xml中的修订、批注引用数量和comments.xml中的批注数量，为None时跳过"""
+    del_count = 0
+    
+    # 验证document.xml中的修订标记
+    if doc_counts is not None:
+        del_count, ins_count, comment_ref_count = doc_counts
+        
+        print(f"📊 document.xml统计:")
+        print(f"   - 删除标记: {del_count}")
+        print(f"   - 插入标记: {ins_count}")
+        print(f"   - 批注引用: {comment_ref_count}")
+    
+    # 验证comments.xml
+    if comment_count is not None:
+        print(f"   - 批注数量: {comment_count}")
+        
+        if del_count > 0 and comment_count > 0:
+            print("✅ 发现跟踪更改和批注标记")
+        else:
+            print("⚠️  跟踪更改或批注标记缺失")
+
+
 # 测试函数
 def test_track_changes_with_comments():
     """测试带批注的跟踪更改功能"""
@@ -312,7 +421,8 @@ def test_track_changes_with_comments():
             temp_file, 
             output_file, 
             track_comments_manager.track_changes_manager.revisions_data,
-            track_comments_manager.comments_manager.comments
+            track_comments_manager.comments_manager.comments,
+            verify=True
         )
         
         if success:
@@ -365,37 +475,38 @@ class ProofReaderWithCommentsAndTrackChanges:
         try:
             self._print(f"🔧 开始处理批注引用标记和XML: {len(comments_data)} 个批注", "cyan")
             
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # 1. 解压文档
-                with zipfile.ZipFile(input_file, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-                
-                # 2. 在document.xml中添加批注引用标记
-                document_xml_path = os.path.join(temp_dir, 'word', 'document.xml')
-                if not self._add_comment_references_to_document_xml(document_xml_path, comments_data):
-                    self._print("❌ 添加批注引用标记失败", "red")
-                    return False
-                
-                # 3. 创建comments.xml文件
-                comments_xml_path = os.path.join(temp_dir, 'word', 'comments.xml')
-                if not self._create_comments_xml_file(comments_xml_path, comments_data):
-                    self._print("❌ 创建comments.xml失败", "red")
-                    return False
-                
-                # 4. 更新文档关系和内容类型
-                self._update_document_relationships(temp_dir)
-                self._update_content_types(temp_dir)
-                
-                # 5. 重新打包文档
-                with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
-                    for root, dirs, files in os.walk(temp_dir):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            arc_name = os.path.relpath(file_path, temp_dir)
-                            zip_ref.write(file_path, arc_name)
-                
-                self._print(f"✅ 成功创建包含批注的文档: {output_file}", "green")
-                return True
+            # 1. 仅读取需要修改的部件，全部在内存中处理
+            with zipfile.ZipFile(input_file, 'r') as zip_ref:
+                existing = set(zip_ref.namelist())
+                document_xml = zip_ref.read(DOCUMENT_XML)
+                rels_xml = zip_ref.read(DOCUMENT_RELS) if DOCUMENT_RELS in existing else EMPTY_RELATIONSHIPS
+                content_types_xml = zip_ref.read(CONTENT_TYPES) if CONTENT_TYPES in existing else EMPTY_CONTENT_TYPES
+            
+            # 2. 在document.xml中添加批注引用标记
+            document_xml = self._add_comment_references_to_document_xml(document_xml, comments_data)
+            if document_xml is None:
+                self._print("❌ 添加批注引用标记失败", "red")
+                return False
+            
+            # 3. 创建comments.xml
+            comments_xml = self._create_comments_xml(comments_data)
+            if comments_xml is None:
+                self._print("❌ 创建comments.xml失败", "red")
+                return False
+            
+            # 4. 更新文档关系和内容类型
+            updated_parts = {
+                DOCUMENT_XML: document_xml,
+                COMMENTS_XML: comments_xml,
+                DOCUMENT_RELS: self._update_document_relationships(rels_xml),
+                CONTENT_TYPES: self._update_content_types(content_types_xml),
+            }
+            
+            # 5. 重新打包文档，未修改的部件直接从原文档复制
+            rewrite_docx(input_file, output_file, updated_parts)
+            
+            self._print(f"✅ 成功创建包含批注的文档: {output_file}", "green")
+            return True
                 
         except Exception as e:
             self._print(f"❌ 处理批注失败: {e}", "red")
@@ -403,108 +514,85 @@ class ProofReaderWithCommentsAndTrackChanges:
             traceback.print_exc()
             return False
     
-    def _add_comment_references_to_document_xml(self, document_xml_path: str, comments_data: list) -> bool:
-        """在document.xml中添加批注引用标记"""
+    def _add_comment_references_to_document_xml(self, document_xml: bytes, comments_data: list):
+        """在document.xml内容中添加批注引用标记，返回修改后的内容，失败时返回None"""
         try:
-            # 读取document.xml
-            tree = ET.parse(document_xml_path)
-            root = tree.getroot()
+            # 使用lxml解析document.xml：树保存在C层，内存占用远小于ElementTree，
+            # 并且保留原有的命名空间前缀（ElementTree会将其改写为ns0等，破坏mc:Ignorable引用）
+            root = etree.fromstring(document_xml, _DOCUMENT_PARSER)
             
             # 定义命名空间
             ns = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
-            ET.register_namespace('w', ns['w'])
             
-            # 查找所有段落
-            paragraphs = root.findall('.//w:p', ns)
-            
-            comment_id = 1
-            for comment_data in comments_data:
-                comment_text_content = comment_data.get('text', '')
-                
-                # 尝试从批注文本中提取原始文本（用于定位）
-                original_text = self._extract_original_text_from_comment(comment_text_content)
-                
+            # 查找所有段落，并一次性建立段落文本索引
+            paragraphs = list(root.iter(_W_P))
+            paragraph_texts = [self._get_paragraph_text(paragraph, ns) for paragraph in paragraphs]
+            
+            # 尝试从批注文本中提取原始文本（用于定位），一次扫描定位全部原始文本首次出现的段落
+            original_texts = [
+                self._extract_original_text_from_comment(comment_data.get('text', ''))
+                for comment_data in comments_data
+            ]
+            locations = locate_first(original_texts, paragraph_texts)
+            
+            # 按段落归集批注范围：段落索引 -> [(批注ID, 原始文本, 起始偏移, 结束偏移)]
+            # 批注ID与_create_comments_xml一致，按批注顺序从1开始编号；未定位的批注只跳过引用标记，
+            # 不影响后续批注的ID，引用与comments.xml中的批注始终一一对应
+            pending = {}
+            missing = 0
+            for comment_id, (comment_data, original_text, location) in enumerate(
+                    zip(comments_data, original_texts, locations), 1):
                 if not original_text:
-                    self._print(f"⚠️ 无法从批注中提取原始文本: {comment_text_content[:50]}...", "yellow")
+                    missing += 1
+                    logger.warning("无法从批注中提取原始文本: %s...", comment_data.get('text', '')[:50])
                     continue
                 
-                # 在段落中查找原始文本并添加批注引用
-                if self._add_comment_ref_to_paragraph(paragraphs, original_text, comment_id, ns):
-                    self._print(f"✅ 已添加批注引用 {comment_id}: {original_text}", "green")
-                    comment_id += 1
+                # 在包含原始文本的段落中添加批注引用
+                if location is not None:
+                    start = paragraph_texts[location].find(original_text)
+                    pending.setdefault(location, []).append(
+                        (comment_id, original_text, start, start + len(original_text))
+                    )
+                    logger.debug("已添加批注引用 %s: %s", comment_id, original_text)
                 else:
-                    self._print(f"⚠️ 未找到文本位置: {original_text}", "yellow")
+                    missing += 1
+                    logger.warning("未找到文本位置: %s", original_text)
+            
+            # 逐条批注只写日志，终端只输出一行汇总
+            summary = f"✅ 已添加批注引用 {len(comments_data) - missing} 个"
+            self._print(f"{summary}，{missing} 个未定位" if missing else summary, "yellow" if missing else "green")
+            
+            # 每个段落只遍历一次run，在目标文本处插入全部批注标记；
+            # 无法按run定位时（如超链接、修订内的文本）退回到在段落末尾添加标记
+            for location, ranges in pending.items():
+                paragraph = paragraphs[location]
+                if self._splice_comments(paragraph, paragraph_texts[location], ranges):
+                    continue
+                for comment_id, original_text, _, _ in ranges:
+                    self._insert_comment_markers(paragraph, original_text, comment_id, ns)
             
-            # 保存修改后的document.xml
-            tree.write(document_xml_path, encoding='utf-8', xml_declaration=True)
-            return True
+            # 序列化修改后的document.xml
+            return etree.tostring(root, encoding='UTF-8', xml_declaration=True, standalone=True)
             
         except Exception as e:
             self._print(f"❌ 修改document.xml失败: {e}", "red")
-            return False
+            return None
     
     def _extract_original_text_from_comment(self, comment_text: str) -> str:
         """从批注文本中提取原始文本"""
-        try:
-            # 查找 "修订: 'xxx' →" 模式
-            if "修订: '" in comment_text and "' →" in comment_text:
-                start = comment_text.find("修订: '") + 4
-                end = comment_text.find("' →", start)
-                if start > 3 and end > start:
-                    return comment_text[start:end]
-            
-            # 查找其他可能的模式
-            if "原文：" in comment_text:
-                lines = comment_text.split('\n')
-                for line in lines:
-                    if "原文：" in line:
-                        return line.split("原文：")[1].strip()
-            
-            return ""
-        except Exception:
-            return ""
-    
-    def _add_comment_ref_to_paragraph(self, paragraphs, target_text: str, comment_id: int, ns: dict) -> bool:
-        """在段落中添加批注引用标记"""
-        try:
-            for paragraph in paragraphs:
-                # 获取段落的文本内容
-                para_text = self._get_paragraph_text(paragraph, ns)
-                
-                if target_text in para_text:
-                    # 找到包含目标文本的段落，添加批注引用标记
-                    self._insert_comment_markers(paragraph, target_text, comment_id, ns)
-                    return True
-            
-            return False
-        except Exception as e:
-            self._print(f"添加批注引用标记失败: {e}", "red")
-            return False
+        return extract_original_text_from_comment(comment_text)
     
     def _get_paragraph_text(self, paragraph, ns: dict) -> str:
         """获取段落的纯文本内容"""
-        text_parts = []
-        text_elements = paragraph.findall('.//w:t', ns)
-        for text_elem in text_elements:
-            if text_elem.text:
-                text_parts.append(text_elem.text)
-        return ''.join(text_parts)
+        return ''.join(_PARAGRAPH_TEXT_NODES(paragraph))
     
     def _insert_comment_markers(self, paragraph, target_text: str, comment_id: int, ns: dict):
         """在段落中插入批注标记"""
         try:
-            # 创建批注范围开始标记
-            comment_range_start = ET.Element(f"{{{ns['w']}}}commentRangeStart")
-            comment_range_start.set(f"{{{ns['w']}}}id", str(comment_id))
-            
-            # 创建批注范围结束标记
-            comment_range_end = ET.Element(f"{{{ns['w']}}}commentRangeEnd")
-            comment_range_end.set(f"{{{ns['w']}}}id", str(comment_id))
-            
-            # 创建一个新的run包含批注引用
-            comment_run = ET.Element(f"{{{ns['w']}}}r")
-            comment_ref = ET.SubElement(comment_run, f"{{{ns['w']}}}commentReference")
-            comment_ref.set(f"{{{ns['w']}}}id", str(comment_id))
+            # 从原型复制批注范围开始、结束标记和包含批注引用的run
+            comment_range_start = new_comment_range_start(comment_id)
+            comment_range_end = new_comment_range_end(comment_id)
+            comment_run = new_comment_reference_run(comment_id)
             
             # 将批注标记插入到段落的适当位置
             # 这里简化处理，在段落末尾添加标记
@@ -512,19 +600,76 @@ class ProofReaderWithCommentsAndTrackChanges:
             paragraph.append(comment_range_end)
             paragraph.append(comment_run)
             
-            self._print(f"✅ 批注标记已插入段落: comment_id={comment_id}", "dim")
+            logger.debug("批注标记已插入段落: comment_id=%s", comment_id)
             
         except Exception as e:
             self._print(f"插入批注标记失败: {e}", "red")
     
-    def _create_comments_xml_file(self, comments_xml_path: str, comments_data: list) -> bool:
-        """创建comments.xml文件"""
+    def _splice_comments(self, paragraph, paragraph_text: str, ranges: list) -> bool:
+        """在段落的run之间插入批注范围和引用标记，目标文本只占run的一部分时拆分该run
+
+        ranges为 (批注ID, 原始文本, 起始偏移, 结束偏移) 列表；段落的直接子run无法覆盖全部段落文本，
+        或需要拆分的run不是纯文本run时返回False，段落保持不变
+        """
+        runs = paragraph.findall(_W_R)
+        texts = [''.join(t.text or '' for t in run.iterchildren(_W_T)) for run in runs]
+        if ''.join(texts) != paragraph_text:
+            return False
+        
+        boundaries = sorted({offset for _, _, start, end in ranges for offset in (start, end)})
+        
+        # 先检查再修改：所有需要在中间拆分的run都必须只包含格式和一个文本元素
+        spans = []
+        position = 0
+        for run, text in zip(runs, texts):
+            cuts = [b - position for b in boundaries if position < b < position + len(text)]
+            if cuts and not _is_splittable_run(run):
+                return False
+            spans.append((run, text, position, cuts))
+            position += len(text)
+        
+        # 在边界处拆分run，得到 (run, 起始偏移, 结束偏移) 列表
+        pieces = []
+        for run, text, start, cuts in spans:
+            if not text:
+                continue
+            if not cuts:
+                pieces.append((run, start, start + len(text)))
+                continue
+            offsets = [0] + cuts + [len(text)]
+            previous = run
+            for i, (a, b) in enumerate(zip(offsets, offsets[1:])):
+                element = run if i == 0 else copy.deepcopy(run)
+                if i:
+                    previous.addnext(element)
+                _set_run_text(element, text[a:b])
+                pieces.append((element, start + a, start + b))
+                previous = element
+        
+        first_at = {}
+        last_at = {}
+        for element, start, end in pieces:
+            first_at.setdefault(start, element)
+            last_at[end] = element
+        
+        # 同一run后的多个结束标记按批注顺序排列
+        inserted_after = {}
+        for comment_id, _, start, end in ranges:
+            first_at[start].addprevious(new_comment_range_start(comment_id))
+            last = last_at[end]
+            anchor = inserted_after.get(last, last)
+            comment_range_end = new_comment_range_end(comment_id)
+            comment_run = new_comment_reference_run(comment_id)
+            anchor.addnext(comment_range_end)
+            comment_range_end.addnext(comment_run)
+            inserted_after[last] = comment_run
+            logger.debug("批注标记已插入段落: comment_id=%s", comment_id)
+        
+        return True
+    
+    def _create_comments_xml(self, comments_data: list):
+        """生成comments.xml的内容，批注ID按顺序从1开始编号，失败时返回None"""
         try:
-            try:
-                from .word_comments_xml import create_comments_xml
-            except ImportError:
-                from word_comments_xml import create_comments_xml
-            
             # 为comments_data添加ID
             processed_comments = []
             for i, comment in enumerate(comments_data, 1):
@@ -532,31 +677,24 @@ class ProofReaderWithCommentsAndTrackChanges:
                 processed_comment['id'] = i
                 processed_comments.append(processed_comment)
             
-            create_comments_xml(comments_xml_path, processed_comments)
-            return True
+            return build_comments_xml(processed_comments)
             
         except Exception as e:
             self._print(f"创建comments.xml失败: {e}", "red")
-            return False
+            return None
     
-    def _update_document_relationships(self, temp_dir: str):
-        """更新文档关系"""
+    def _update_document_relationships(self, rels_xml: bytes) -> bytes:
+        """更新文档关系 - 结构固定，直接字节级追加批注关系"""
         try:
-            try:
-                from .word_comments_xml import create_document_rels
-            except ImportError:
-                from word_comments_xml import create_document_rels
-            create_document_rels(temp_dir)
+            return patch_document_rels(rels_xml)
         except Exception as e:
             self._print(f"更新文档关系失败: {e}", "yellow")
+            return rels_xml
     
-    def _update_content_types(self, temp_dir: str):
-        """更新内容类型"""
+    def _update_content_types(self, content_types_xml: bytes) -> bytes:
+        """更新内容类型 - 结构固定，直接字节级追加批注内容类型"""
         try:
-            try:
-                from .word_comments_xml import update_content_types
-            except ImportError:
-                from word_comments_xml import update_content_types
-            update_content_types(temp_dir)
+            return patch_content_types(content_types_xml)
         except Exception as e:
-            self._print(f"更新内容类型失败: {e}", "yellow") 
\ No newline at end of file
+            self._print(f"更新内容类型失败: {e}", "yellow")
+            return content_types_xml
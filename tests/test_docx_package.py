@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+docx压缩包处理模块测试
+"""
+
+import io
+import os
+import zipfile
+
+import pytest
+
+from proofreader.docx_package import (
+    STORED_MAX_SIZE, extract_parts, read_parts_from_dir, rewrite_docx
+)
+
+
+DOCUMENT_BODY = b'<w:document>' + b'<w:p>text</w:p>' * 500 + b'</w:document>'
+
+MEMBERS = [
+    ('[Content_Types].xml', b'<Types></Types>'),
+    ('word/document.xml', DOCUMENT_BODY),
+    ('word/media/image1.png', os.urandom(4096)),
+    ('word/settings.xml', b'<w:settings></w:settings>'),
+    ('docProps/core.xml', b'<cp:coreProperties/>'),
+]
+
+
+@pytest.fixture
+def source_docx(temp_dir):
+    """按固定顺序写入全部部件（均使用deflate）的压缩包"""
+    path = os.path.join(temp_dir, 'in.docx')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in MEMBERS:
+            zf.writestr(name, data)
+    return path
+
+
+def _read_all(path_or_file):
+    """返回 [(部件名, 压缩方式, 内容)]"""
+    with zipfile.ZipFile(path_or_file) as zf:
+        return [(info.filename, info.compress_type, zf.read(info.filename)) for info in zf.infolist()]
+
+
+def test_rewrite_keeps_member_order_and_appends_new_parts(source_docx, temp_dir):
+    """替换的部件保持原位置，新部件追加在末尾，未修改的部件内容不变"""
+    output = os.path.join(temp_dir, 'out.docx')
+    rewrite_docx(source_docx, output, {
+        'word/settings.xml': b'<w:settings><w:trackRevisions/></w:settings>',
+        'word/comments.xml': b'<w:comments/>',
+    })
+
+    members = _read_all(output)
+    assert [name for name, _, _ in members] == [name for name, _ in MEMBERS] + ['word/comments.xml']
+    contents = {name: data for name, _, data in members}
+    assert contents['word/settings.xml'] == b'<w:settings><w:trackRevisions/></w:settings>'
+    assert contents['word/comments.xml'] == b'<w:comments/>'
+    for name, data in MEMBERS:
+        if name != 'word/settings.xml':
+            assert contents[name] == data
+
+
+def test_rewrite_stores_media_and_small_parts(source_docx, temp_dir):
+    """媒体文件和小于STORED_MAX_SIZE的部件直接存储，较大的XML部件使用deflate"""
+    output = os.path.join(temp_dir, 'out.docx')
+    rewrite_docx(source_docx, output, {'word/comments.xml': b'<w:comments/>' * 500})
+
+    compress_types = {name: compress_type for name, compress_type, _ in _read_all(output)}
+    assert compress_types['word/media/image1.png'] == zipfile.ZIP_STORED
+    assert compress_types['word/settings.xml'] == zipfile.ZIP_STORED
+    assert compress_types['[Content_Types].xml'] == zipfile.ZIP_STORED
+    assert len(DOCUMENT_BODY) >= STORED_MAX_SIZE
+    assert compress_types['word/document.xml'] == zipfile.ZIP_DEFLATED
+    assert compress_types['word/comments.xml'] == zipfile.ZIP_DEFLATED
+
+
+def test_rewrite_in_place(source_docx):
+    """输出路径与输入相同时先读入源文件，不会截断后再读取"""
+    rewrite_docx(source_docx, source_docx, {'word/settings.xml': b'<w:settings/>'})
+
+    with zipfile.ZipFile(source_docx) as zf:
+        assert zf.testzip() is None
+        assert zf.read('word/settings.xml') == b'<w:settings/>'
+        assert zf.read('word/document.xml') == DOCUMENT_BODY
+
+
+def test_rewrite_in_memory(source_docx):
+    """输入和输出都可以是二进制流"""
+    with open(source_docx, 'rb') as f:
+        source = io.BytesIO(f.read())
+    output = io.BytesIO()
+    rewrite_docx(source, output, {'word/settings.xml': b'<w:settings/>'})
+
+    output.seek(0)
+    contents = {name: data for name, _, data in _read_all(output)}
+    assert contents['word/settings.xml'] == b'<w:settings/>'
+    assert contents['word/media/image1.png'] == dict(MEMBERS)['word/media/image1.png']
+
+
+def test_extract_and_read_parts(source_docx, temp_dir):
+    """只解压存在的指定部件，读取时跳过不存在的部件"""
+    target = os.path.join(temp_dir, 'parts')
+    names = ['word/settings.xml', 'word/document.xml', 'word/comments.xml']
+
+    assert extract_parts(source_docx, target, names) == ['word/settings.xml', 'word/document.xml']
+    assert read_parts_from_dir(target, names) == {
+        'word/settings.xml': dict(MEMBERS)['word/settings.xml'],
+        'word/document.xml': DOCUMENT_BODY,
+    }
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+增强版校对器测试 - AI校对结果缓存
+"""
+
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from proofreader import proofreader_track_changes_enhanced
+from proofreader.proofreader_track_changes_enhanced import ProofReaderWithTrackChangesAndComments
+
+
+TEXT = "计算器是一种电子设备"
+
+
+class _StubCompletions:
+    """模拟openai客户端的chat.completions，记录调用次数"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        content = json.dumps({"issues": [], "suggestions": [], "overall_assessment": "良好"}, ensure_ascii=False)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def cache_dir(monkeypatch, temp_dir):
+    """将AI校对缓存目录指向临时目录"""
+    path = os.path.join(temp_dir, 'cache')
+    monkeypatch.setattr(proofreader_track_changes_enhanced, 'CACHE_DIR', path)
+    return path
+
+
+def _proofreader(monkeypatch, mock_api_key, completions):
+    """创建启用缓存的校对器，并以模拟客户端替换AI调用"""
+    monkeypatch.setenv('OPENAI_API_KEY', mock_api_key)
+    proofreader = ProofReaderWithTrackChangesAndComments(use_cache=True)
+    proofreader.ai_checker.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return proofreader
+
+
+def test_failed_ai_call_is_not_cached(monkeypatch, mock_api_key, cache_dir):
+    """基础检查发现问题但AI调用失败时，结果带有失败标记且不写入缓存"""
+    completions = _StubCompletions(error=RuntimeError("连接超时"))
+    proofreader = _proofreader(monkeypatch, mock_api_key, completions)
+
+    result = proofreader._cached_check_text(TEXT)
+    assert result.issues
+    assert result.statistics.get("ai_failed")
+    assert not os.path.exists(cache_dir) or not os.listdir(cache_dir)
+
+    proofreader._cached_check_text(TEXT)
+    assert completions.calls == 2
+
+
+def test_successful_ai_call_is_cached(monkeypatch, mock_api_key, cache_dir):
+    """AI调用成功的结果写入缓存，再次校对相同文本时跳过AI调用"""
+    completions = _StubCompletions()
+    proofreader = _proofreader(monkeypatch, mock_api_key, completions)
+
+    first = proofreader._cached_check_text(TEXT)
+    assert "ai_failed" not in first.statistics
+    assert len(os.listdir(cache_dir)) == 1
+
+    second = proofreader._cached_check_text(TEXT)
+    assert completions.calls == 1
+    assert second.to_dict() == first.to_dict()
+
+
+def test_cache_key_includes_base_url(monkeypatch, mock_api_key, cache_dir):
+    """更换接口地址后不复用之前的缓存结果"""
+    completions = _StubCompletions()
+    proofreader = _proofreader(monkeypatch, mock_api_key, completions)
+    proofreader._cached_check_text(TEXT)
+
+    proofreader.config.ai.base_url = "https://example.com/v1"
+    proofreader._cached_check_text(TEXT)
+    assert completions.calls == 2
+    assert len(os.listdir(cache_dir)) == 2
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+修复版增强校对器测试 - 跟踪更改与批注的对应关系
+"""
+
+import os
+import zipfile
+
+import pytest
+from docx import Document
+from lxml import etree
+
+from proofreader.proofreader_track_changes_enhanced_fixed import ProofReaderWithTrackChangesAndCommentsFixed
+from proofreader.word_track_changes import WordTrackChangesManager
+
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+@pytest.fixture
+def proofreader(monkeypatch, mock_api_key):
+    """使用模拟API密钥创建校对器，不修改进程环境变量"""
+    monkeypatch.setenv('OPENAI_API_KEY', mock_api_key)
+    return ProofReaderWithTrackChangesAndCommentsFixed()
+
+
+def _change(paragraph_index, original, corrected, occurrence=0):
+    """构造一个同步更改"""
+    return {
+        'paragraph_index': paragraph_index,
+        'original_text': original,
+        'corrected_text': corrected,
+        'comment_text': f"🔧 错误修正: {original} → {corrected}\n",
+        'reason': '错别字',
+        'type': 'error_fix',
+        'occurrence_index': occurrence,
+    }
+
+
+def _apply(proofreader, temp_dir, paragraphs, changes):
+    """应用更改并返回输出文档的 (document.xml根元素, comments.xml根元素)"""
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    output = os.path.join(temp_dir, 'out.docx')
+    assert proofreader._apply_changes_with_proper_comments(doc, changes, output)
+
+    with zipfile.ZipFile(output) as zf:
+        return etree.fromstring(zf.read('word/document.xml')), etree.fromstring(zf.read('word/comments.xml'))
+
+
+def _anchored_text(document, comment_id):
+    """返回批注范围开始标记之后紧邻的删除修订文本，未包裹删除修订时返回None"""
+    starts = [marker for marker in document.iter(f'{W}commentRangeStart') if marker.get(f'{W}id') == comment_id]
+    assert len(starts) == 1
+    deletion = starts[0].getnext()
+    if deletion is None or deletion.tag != f'{W}del':
+        return None
+    return ''.join(deletion.itertext())
+
+
+def test_duplicate_corrections_share_one_comment(proofreader, temp_dir):
+    """同一修正多处出现时每处都有跟踪更改，但只创建一个批注，批注包裹第一处删除修订"""
+    paragraphs = ["计算器科学和计算器科学", "程式设计", "计算器科学很重要"]
+    changes = [
+        _change(0, "计算器科学", "计算机科学", 0),
+        _change(0, "计算器科学", "计算机科学", 1),
+        _change(1, "程式设计", "程序设计"),
+        _change(2, "计算器科学", "计算机科学"),
+    ]
+    document, comments = _apply(proofreader, temp_dir, paragraphs, changes)
+
+    assert [comment.get(f'{W}id') for comment in comments.iter(f'{W}comment')] == ['1', '2']
+    body_paragraphs = document.findall(f'.//{W}p')
+    assert [len(p.findall(f'{W}del')) for p in body_paragraphs] == [2, 1, 1]
+    for tag in ('commentRangeStart', 'commentRangeEnd', 'commentReference'):
+        assert sorted(marker.get(f'{W}id') for marker in document.iter(f'{W}{tag}')) == ['1', '2']
+
+    assert _anchored_text(document, '1') == "计算器科学"
+    assert _anchored_text(document, '2') == "程式设计"
+    first_start = next(document.iter(f'{W}commentRangeStart'))
+    assert first_start.getparent() is body_paragraphs[0]
+
+
+def test_comments_part_is_attached_once(proofreader, temp_dir):
+    """批注部件只注册一次，对已包含批注的文档再次处理时替换原有批注部件"""
+    doc = Document()
+    doc.add_paragraph("计算器科学")
+    first = os.path.join(temp_dir, 'first.docx')
+    assert proofreader._apply_changes_with_proper_comments(doc, [_change(0, "计算器科学", "计算机科学")], first)
+
+    doc = Document(first)
+    doc.add_paragraph("程式设计")
+    second = os.path.join(temp_dir, 'second.docx')
+    changes = [_change(1, "程式设计", "程序设计")]
+    changes[0]['comment_text'] = "第二次批注"
+    assert proofreader._apply_changes_with_proper_comments(doc, changes, second)
+
+    with zipfile.ZipFile(second) as zf:
+        names = zf.namelist()
+        rels = zf.read('word/_rels/document.xml.rels')
+        content_types = zf.read('[Content_Types].xml')
+        comments = etree.fromstring(zf.read('word/comments.xml'))
+    assert names.count('word/comments.xml') == 1
+    assert rels.count(b'relationships/comments"') == 1
+    assert content_types.count(b'/word/comments.xml') == 1
+    assert [''.join(comment.itertext()) for comment in comments.iter(f'{W}comment')] == ["第二次批注"]
+
+
+@pytest.mark.parametrize('advance_counter', [False, True])
+def test_failed_track_change_keeps_comment_own_markers(proofreader, temp_dir, monkeypatch, advance_counter):
+    """跟踪更改失败的批注不记录删除修订ID，不会包裹其他更改的删除修订"""
+    original_add = WordTrackChangesManager.add_tracked_change
+
+    def add_tracked_change(manager, paragraph, original_text, corrected_text, reason=""):
+        if original_text == "程式设计":
+            if advance_counter:
+                manager.revision_counter += 1
+            return False
+        return original_add(manager, paragraph, original_text, corrected_text, reason)
+
+    monkeypatch.setattr(WordTrackChangesManager, 'add_tracked_change', add_tracked_change)
+    paragraphs = ["计算器科学", "程式设计", "软体很好"]
+    changes = [
+        _change(0, "计算器科学", "计算机科学"),
+        _change(1, "程式设计", "程序设计"),
+        _change(2, "软体", "软件"),
+    ]
+    document, comments = _apply(proofreader, temp_dir, paragraphs, changes)
+
+    assert [comment.get(f'{W}id') for comment in comments.iter(f'{W}comment')] == ['1', '2', '3']
+    body_paragraphs = document.findall(f'.//{W}p')
+    assert [len(p.findall(f'{W}del')) for p in body_paragraphs] == [1, 0, 1]
+    assert _anchored_text(document, '1') == "计算器科学"
+    assert _anchored_text(document, '2') is None
+    assert _anchored_text(document, '3') == "软体"
+    second_start = [marker for marker in document.iter(f'{W}commentRangeStart') if marker.get(f'{W}id') == '2']
+    assert second_start[0].getparent() is body_paragraphs[1]
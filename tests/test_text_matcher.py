@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+文本定位模块测试 - Aho–Corasick自动机与子串查找回退路径的结果一致
+"""
+
+import pytest
+
+from proofreader import text_matcher
+from proofreader.text_matcher import find_matches, find_occurrences, locate_first, present_needles
+
+
+PARAGRAPHS = [
+    "这是一个测试文档。",
+    "计算器科学是一门重要的学科，计算器科学很好。",
+    "",
+    "程式设计需要仔细考虑，程式设计和计算机科学。",
+    "aaaa abcabc",
+]
+
+NEEDLES = ["计算器科学", "程式设计", "计算机科学", "不存在", "", "aa", "abc", "bc", "计算器科学", "。"]
+
+
+@pytest.fixture(params=["automaton", "fallback"])
+def backend(request, monkeypatch):
+    """分别在Aho–Corasick自动机和子串查找回退路径下运行测试"""
+    if request.param == "automaton":
+        if text_matcher.ahocorasick is None:
+            pytest.skip("未安装pyahocorasick")
+    else:
+        monkeypatch.setattr(text_matcher, "ahocorasick", None)
+    text_matcher._build_automaton.cache_clear()
+    yield request.param
+    text_matcher._build_automaton.cache_clear()
+
+
+def _expected_first(needle, texts):
+    """逐段落查找首次出现的段落索引"""
+    return next((i for i, text in enumerate(texts) if needle in text), None)
+
+
+def _expected_occurrences(needle, texts):
+    """按str.count的语义逐段落收集互不重叠的出现位置"""
+    found = []
+    if not needle:
+        return found
+    for paragraph_index, text in enumerate(texts):
+        occurrence = 0
+        pos = text.find(needle)
+        while pos != -1:
+            found.append((paragraph_index, occurrence, pos))
+            occurrence += 1
+            pos = text.find(needle, pos + len(needle))
+        assert occurrence == text.count(needle)
+    return found
+
+
+def test_locate_first_matches_substring_search(backend):
+    """每个目标文本定位到首次出现的段落，重复和空字符串与 `in` 语义一致"""
+    expected = [_expected_first(needle, PARAGRAPHS) for needle in NEEDLES]
+    assert locate_first(NEEDLES, PARAGRAPHS) == expected
+
+
+def test_locate_first_with_joined_text(backend):
+    """传入调用方拼接好的全文时结果不变"""
+    joined = ' '.join(PARAGRAPHS)
+    assert locate_first(NEEDLES, PARAGRAPHS, joined) == locate_first(NEEDLES, PARAGRAPHS)
+
+
+def test_locate_first_empty_inputs(backend):
+    """没有目标文本或没有段落时全部为None"""
+    assert locate_first([], PARAGRAPHS) == []
+    assert locate_first(["计算器"], []) == [None]
+
+
+def test_find_occurrences_non_overlapping(backend):
+    """同一段落内按str.count的语义计数，重叠的出现不计"""
+    results = find_occurrences(NEEDLES, PARAGRAPHS, workers=1)
+    for needle, found in zip(NEEDLES, results):
+        assert found == _expected_occurrences(needle, PARAGRAPHS), needle
+
+
+def test_find_occurrences_overlapping_needle():
+    """'aa'在'aaaa'中只有两次互不重叠的出现"""
+    assert find_occurrences(["aa"], ["aaaa"], workers=1) == [[(0, 0, 0), (0, 1, 2)]]
+
+
+def test_find_occurrences_parallel_matches_serial(monkeypatch):
+    """按段落分块并行扫描的结果与单进程扫描一致"""
+    serial = find_occurrences(NEEDLES, PARAGRAPHS, workers=1)
+    monkeypatch.setattr(text_matcher, "PARALLEL_MIN_CHARS", 0)
+    assert find_occurrences(NEEDLES, PARAGRAPHS, workers=2) == serial
+
+
+def test_find_matches_reports_all_occurrences(backend):
+    """一次扫描返回全部出现位置（包括重叠的出现），按起始偏移排序"""
+    text = PARAGRAPHS[4] + PARAGRAPHS[1]
+    needles = ("aa", "abc", "bc", "计算器科学", "不存在")
+    expected = sorted(
+        (start, needle)
+        for needle in needles
+        for start in range(len(text))
+        if text.startswith(needle, start)
+    )
+    assert find_matches(needles, text) == expected
+
+
+def test_present_needles(backend):
+    """返回在文本中出现过的目标文本集合"""
+    needles = ("计算器科学", "程式设计", "不存在", "")
+    assert present_needles(needles, PARAGRAPHS[1]) == {"计算器科学"}
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+高级Word批注模块测试 - 段落文本缓存与目标文本高亮
+"""
+
+from docx import Document
+from docx.enum.text import WD_COLOR_INDEX
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+
+from proofreader.word_comments_advanced import WordCommentsManager
+
+
+def _highlights(paragraph):
+    """返回段落中非空run的 (文本, 是否高亮, 是否加粗)，跳过批注引用run"""
+    return [(run.text, run.font.highlight_color == WD_COLOR_INDEX.YELLOW, bool(run.bold))
+            for run in paragraph.runs if run.text]
+
+
+def test_repeated_target_continues_after_previous_match():
+    """同一段落中重复批注相同文本时依次定位到后面的出现位置"""
+    doc = Document()
+    paragraph = doc.add_paragraph()
+    paragraph.add_run("程式")
+    paragraph.add_run("和程式")
+    manager = WordCommentsManager(doc)
+
+    assert manager.add_comment(paragraph, "程式", "术语问题")
+    assert manager.add_comment(paragraph, "程式", "术语问题")
+    assert manager.index_paragraph(paragraph) is manager.index_paragraph(paragraph)
+    assert [comment['id'] for comment in manager.comments] == [1, 2]
+    assert _highlights(paragraph) == [("程式", True, False), ("和", False, False), ("程式", True, False)]
+
+
+def test_target_spanning_runs_highlights_each_run():
+    """跨run的目标文本高亮其覆盖的每个run，未覆盖的run不变"""
+    doc = Document()
+    paragraph = doc.add_paragraph()
+    paragraph.add_run("这是")
+    paragraph.add_run("计算").bold = True
+    paragraph.add_run("器科学")
+    paragraph.add_run("。")
+    manager = WordCommentsManager(doc)
+
+    assert manager.add_comment(paragraph, "计算器科学", "错别字")
+    assert _highlights(paragraph) == [
+        ("这是", False, False), ("计算", True, True), ("器科学", True, False), ("。", False, False)
+    ]
+
+
+def test_partially_covered_run_is_split():
+    """目标只占run的一部分时拆分该run，只高亮目标文本，拆出的run保留格式"""
+    doc = Document()
+    paragraph = doc.add_paragraph()
+    paragraph.add_run("计算器科学很重要").bold = True
+    manager = WordCommentsManager(doc)
+
+    assert manager.add_comment(paragraph, "器科学", "错别字")
+    assert manager.add_comment(paragraph, "重要", "用词")
+    assert paragraph.text == "计算器科学很重要"
+    assert _highlights(paragraph) == [
+        ("计算", False, True), ("器科学", True, True), ("很", False, True), ("重要", True, True)
+    ]
+
+
+def test_paragraph_with_hyperlink_highlights_containing_run():
+    """段落包含超链接时偏移对不上，只高亮包含目标文本的run"""
+    doc = Document()
+    paragraph = doc.add_paragraph()
+    paragraph.add_run("参见")
+    paragraph._p.append(parse_xml(
+        f'<w:hyperlink {nsdecls("w", "r")} r:id="rId99"><w:r><w:t>链接</w:t></w:r></w:hyperlink>'
+    ))
+    paragraph.add_run("中的计算器科学")
+    manager = WordCommentsManager(doc)
+
+    assert manager.add_comment(paragraph, "计算器科学", "错别字")
+    assert _highlights(paragraph) == [("参见", False, False), ("中的计算器科学", True, False)]
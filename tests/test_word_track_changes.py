@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Word跟踪更改模块测试 - 在原有run中插入修订并保留格式
+"""
+
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+from proofreader.word_track_changes import WordTrackChangesManager
+from proofreader.word_track_changes_with_comments import WordTrackChangesWithCommentsManager
+
+
+def _runs_text(element, text_tag='w:t'):
+    """返回元素下全部run的 (文本, 是否加粗, 是否斜体)"""
+    result = []
+    for run in element.iter(qn('w:r')):
+        text = ''.join(t.text or '' for t in run.iter(qn(text_tag)))
+        rpr = run.find(qn('w:rPr'))
+        bold = rpr is not None and rpr.find(qn('w:b')) is not None
+        italic = rpr is not None and rpr.find(qn('w:i')) is not None
+        result.append((text, bold, italic))
+    return result
+
+
+def _formatted_paragraph():
+    """'计算'加粗、'器科学很好'斜体的段落"""
+    doc = Document()
+    paragraph = doc.add_paragraph()
+    paragraph.add_run("计算").bold = True
+    paragraph.add_run("器科学很好").italic = True
+    return doc, paragraph
+
+
+def test_change_spanning_runs_keeps_run_properties():
+    """跨run的修订拆分原run，删除和插入都保留原有格式"""
+    doc, paragraph = _formatted_paragraph()
+    manager = WordTrackChangesManager(doc)
+    manager.add_tracked_change(paragraph, "计算器科学", "计算机科学")
+    manager.apply_all_changes()
+
+    element = paragraph._element
+    deletions = element.findall(qn('w:del'))
+    insertions = element.findall(qn('w:ins'))
+    assert len(deletions) == 1 and len(insertions) == 1
+    assert _runs_text(deletions[0], 'w:delText') == [("计算", True, False), ("器科学", False, True)]
+    assert _runs_text(insertions[0]) == [("计算机科学", True, False)]
+
+    # 修订之后的文本仍是原run的斜体格式
+    assert _runs_text(element.findall(qn('w:r'))[-1]) == [("很好", False, True)]
+    assert deletions[0].get(qn('w:id')) == '1'
+    assert insertions[0].get(qn('w:id')) == '1001'
+
+
+def test_all_occurrences_are_changed():
+    """同一段落中目标文本的每次出现都生成一对修订"""
+    doc = Document()
+    paragraph = doc.add_paragraph("程式设计和程式设计")
+    manager = WordTrackChangesManager(doc)
+    manager.add_tracked_change(paragraph, "程式设计", "程序设计")
+    manager.apply_all_changes()
+
+    element = paragraph._element
+    assert [d.findtext(f"{qn('w:r')}/{qn('w:delText')}") for d in element.findall(qn('w:del'))] == ["程式设计"] * 2
+    assert [i.findtext(f"{qn('w:r')}/{qn('w:t')}") for i in element.findall(qn('w:ins'))] == ["程序设计"] * 2
+
+
+def test_run_with_other_content_falls_back_to_rebuild():
+    """需要拆分的run包含制表符等非文本内容时按纯文本重建段落"""
+    doc = Document()
+    paragraph = doc.add_paragraph()
+    run = paragraph.add_run("计算器")
+    run._element.append(OxmlElement('w:tab'))
+    paragraph.add_run("科学")
+    manager = WordTrackChangesManager(doc)
+    manager.add_tracked_change(paragraph, "器", "机")
+    manager.apply_all_changes()
+
+    element = paragraph._element
+    assert element.findtext(f"{qn('w:del')}/{qn('w:r')}/{qn('w:delText')}") == "器"
+    assert element.findtext(f"{qn('w:ins')}/{qn('w:r')}/{qn('w:t')}") == "机"
+
+
+def test_reapply_restores_from_snapshot():
+    """再次应用时从首次应用前的内容重建，不会重复生成已有的修订"""
+    doc, paragraph = _formatted_paragraph()
+    manager = WordTrackChangesManager(doc)
+    manager.add_tracked_change(paragraph, "计算器科学", "计算机科学")
+    manager.apply_all_changes()
+    manager.add_tracked_change(paragraph, "很好", "很重要")
+    manager.apply_all_changes()
+
+    element = paragraph._element
+    assert len(element.findall(qn('w:del'))) == 2
+    assert [i.findtext(f"{qn('w:r')}/{qn('w:t')}") for i in element.findall(qn('w:ins'))] == ["计算机科学", "很重要"]
+
+
+def test_comment_markers_survive_regardless_of_order():
+    """批注在跟踪更改之前添加时，同一段落中每个批注的标记都会保留"""
+    doc = Document()
+    paragraph = doc.add_paragraph("计算器科学和程式设计都很重要。")
+    manager = WordTrackChangesWithCommentsManager(doc)
+    manager.add_tracked_change_with_comment(paragraph, "计算器科学", "计算机科学", "错别字")
+    manager.add_tracked_change_with_comment(paragraph, "程式设计", "程序设计", "术语")
+    manager.apply_all_changes()
+
+    element = paragraph._element
+    for tag in ('w:commentRangeStart', 'w:commentRangeEnd', 'w:commentReference'):
+        assert sorted(marker.get(qn('w:id')) for marker in element.iter(qn(tag))) == ['1', '2']
+    assert len(element.findall(qn('w:del'))) == 2
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+带批注的跟踪更改模块测试 - 在目标文本处插入批注范围标记
+"""
+
+from lxml import etree
+
+from proofreader.word_track_changes_with_comments import ProofReaderWithCommentsAndTrackChanges
+
+
+W_NS = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W = f'{{{W_NS}}}'
+
+
+def _paragraph(body):
+    """解析段落XML，body为<w:p>的内容"""
+    return etree.fromstring(f'<w:p xmlns:w="{W_NS}">{body}</w:p>')
+
+
+def _layout(paragraph):
+    """按顺序列出段落子元素：run为 ('r', 文本, 是否加粗)，批注标记为 (标签, ID)"""
+    layout = []
+    for child in paragraph:
+        name = etree.QName(child).localname
+        if name == 'r':
+            reference = child.find(f'{W}commentReference')
+            if reference is not None:
+                layout.append(('commentReference', reference.get(f'{W}id')))
+            else:
+                text = ''.join(t.text or '' for t in child.iter(f'{W}t'))
+                layout.append(('r', text, child.find(f'{W}rPr/{W}b') is not None))
+        else:
+            layout.append((name, child.get(f'{W}id')))
+    return layout
+
+
+def _ranges(text, *targets):
+    """按批注顺序生成 (批注ID, 原始文本, 起始偏移, 结束偏移)"""
+    return [(str(i), target, text.find(target), text.find(target) + len(target))
+            for i, target in enumerate(targets, 1)]
+
+
+def test_splice_splits_run_and_keeps_formatting():
+    """目标文本只占run的一部分时拆分run，拆出的run保留格式，标记紧贴目标文本"""
+    paragraph = _paragraph('<w:r><w:rPr><w:b/></w:rPr><w:t>计算器科学很重要</w:t></w:r>')
+    text = '计算器科学很重要'
+
+    assert ProofReaderWithCommentsAndTrackChanges()._splice_comments(paragraph, text, _ranges(text, '器科学'))
+    assert _layout(paragraph) == [
+        ('r', '计算', True),
+        ('commentRangeStart', '1'),
+        ('r', '器科学', True),
+        ('commentRangeEnd', '1'),
+        ('commentReference', '1'),
+        ('r', '很重要', True),
+    ]
+    # 拆分后的文本保留首尾空格
+    assert all(t.get('{http://www.w3.org/XML/1998/namespace}space') == 'preserve'
+               for t in paragraph.iter(f'{W}t'))
+
+
+def test_splice_multiple_ranges_across_runs():
+    """跨run的批注范围和结束于同一位置的多个批注按批注顺序插入"""
+    paragraph = _paragraph('<w:r><w:t>计算器</w:t></w:r><w:r><w:rPr><w:b/></w:rPr><w:t>科学和程式</w:t></w:r>')
+    text = '计算器科学和程式'
+
+    ranges = _ranges(text, '器科学', '计算器科学')
+    assert ProofReaderWithCommentsAndTrackChanges()._splice_comments(paragraph, text, ranges)
+    assert _layout(paragraph) == [
+        ('commentRangeStart', '2'),
+        ('r', '计算', False),
+        ('commentRangeStart', '1'),
+        ('r', '器', False),
+        ('r', '科学', True),
+        ('commentRangeEnd', '1'),
+        ('commentReference', '1'),
+        ('commentRangeEnd', '2'),
+        ('commentReference', '2'),
+        ('r', '和程式', True),
+    ]
+
+
+def test_splice_refuses_unsplittable_run():
+    """需要拆分的run包含非文本内容时不修改段落"""
+    body = '<w:r><w:t>计算器</w:t><w:tab/><w:t>科学</w:t></w:r>'
+    paragraph = _paragraph(body)
+    text = '计算器科学'
+
+    assert not ProofReaderWithCommentsAndTrackChanges()._splice_comments(paragraph, text, _ranges(text, '器'))
+    assert etree.tostring(paragraph) == etree.tostring(_paragraph(body))
+
+
+def test_splice_refuses_text_outside_runs():
+    """段落文本不全在直接子run中（如超链接）时不修改段落"""
+    body = '<w:r><w:t>计算器</w:t></w:r><w:hyperlink><w:r><w:t>科学</w:t></w:r></w:hyperlink>'
+    paragraph = _paragraph(body)
+    text = '计算器科学'
+
+    assert not ProofReaderWithCommentsAndTrackChanges()._splice_comments(paragraph, text, _ranges(text, '器科'))
+    assert etree.tostring(paragraph) == etree.tostring(_paragraph(body))
+
+
+def test_comment_reference_ids_match_comments_xml():
+    """未定位的批注只跳过引用标记，其余批注的ID仍与comments.xml中的顺序一致"""
+    document_xml = (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:document xmlns:w="{W_NS}"><w:body>'
+        f'<w:p><w:r><w:t>计算器科学</w:t></w:r></w:p>'
+        f'<w:p><w:r><w:t>程式设计</w:t></w:r></w:p>'
+        f'</w:body></w:document>'
+    ).encode('utf-8')
+    comments_data = [
+        {'text': "🔄 修订: '计算器' → '计算机'"},
+        {'text': "🔄 修订: '不存在' → '存在'"},
+        {'text': '原文：程式'},
+    ]
+
+    result = ProofReaderWithCommentsAndTrackChanges()._add_comment_references_to_document_xml(
+        document_xml, comments_data
+    )
+    root = etree.fromstring(result)
+    paragraphs = root.findall(f'.//{W}p')
+    assert [marker.get(f'{W}id') for marker in paragraphs[0].iter(f'{W}commentRangeStart')] == ['1']
+    assert [marker.get(f'{W}id') for marker in paragraphs[1].iter(f'{W}commentRangeStart')] == ['3']
+    assert [marker.get(f'{W}id') for marker in root.iter(f'{W}commentReference')] == ['1', '3']